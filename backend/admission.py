@@ -0,0 +1,180 @@
+"""Socket.IO 事件的准入控制：避免單一客戶端（或重試風暴）占滿唯一的 eventlet worker。
+
+- 每個連線（sid）與每個玩家（payload 的 player / player_id）各一個 token bucket，
+  同一玩家開多個分頁也共用玩家額度。
+- 全域同時處理中的事件數上限，超過時立即拒絕，不排隊。屬於盡力而為：處理函式內的 sqlite3 呼叫
+  不會讓出 eventlet hub，只有在 emit、等待合併結果等會讓出的地方才可能有多個事件同時處理中。
+- update_board 依 (room_id, since) 合併：同一房間正在處理或剛算好的相同請求直接共用結果，
+  棋盤有變動（save_move、加入房間）時立即失效，不會拿到過期盤面。
+  失效只發生在本 worker，多 worker 模式下其他 worker 收不到，因此只合併同時處理中的請求，不重用算好的結果。
+被拒絕的事件回覆 error，帶 reason（socket_rate / player_rate / overloaded）與 retry_after 秒數。
+"""
+import os
+import time
+from collections import OrderedDict
+
+import cluster
+import metrics
+
+try:
+    from eventlet.event import Event
+except ImportError:  # pragma: no cover - 非 eventlet 環境
+    Event = None
+
+ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+SOCKET_RATE = float(os.environ.get("ADMISSION_SOCKET_RATE", "20"))    # 每秒補充的 token
+SOCKET_BURST = float(os.environ.get("ADMISSION_SOCKET_BURST", "40"))
+PLAYER_RATE = float(os.environ.get("ADMISSION_PLAYER_RATE", "15"))
+PLAYER_BURST = float(os.environ.get("ADMISSION_PLAYER_BURST", "30"))
+MAX_INFLIGHT = int(os.environ.get("ADMISSION_MAX_INFLIGHT", "64"))
+COALESCE_TTL = float(os.environ.get("ADMISSION_COALESCE_TTL", "0.25"))  # 秒；算好的 update_board 結果可重用多久
+MAX_PLAYER_BUCKETS = 50000
+PRUNE_EVERY = 256  # 合併器每處理幾次請求順便清一次過期條目
+
+REJECTED = metrics.counter(
+    "naval_admission_rejected_total", "被准入控制拒絕的事件數", ("event", "reason"))
+COALESCED = metrics.counter(
+    "naval_admission_coalesced_total", "與其他請求合併、未重新查資料庫的事件數", ("event",))
+
+_inflight = 0
+metrics.gauge("naval_admission_inflight", "處理中的受限事件數", collect=lambda: {(): _inflight})
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, rate, burst):
+        """取一個 token；不足時回傳需等待的秒數，成功回傳 0"""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate if rate > 0 else 60
+
+
+_socket_buckets = {}
+_player_buckets = OrderedDict()  # LRU，避免大量一次性的 player_id 撐爆記憶體
+
+
+def _player_bucket(player_id):
+    bucket = _player_buckets.get(player_id)
+    if bucket is None:
+        bucket = _player_buckets[player_id] = TokenBucket(PLAYER_BURST)
+        if len(_player_buckets) > MAX_PLAYER_BUCKETS:
+            _player_buckets.popitem(last=False)
+    else:
+        _player_buckets.move_to_end(player_id)
+    return bucket
+
+
+def check(event, sid, player_id=None):
+    """回傳 None 表示放行，否則回傳 (reason, retry_after)"""
+    if not ENABLED:
+        return None
+    if _inflight >= MAX_INFLIGHT:
+        REJECTED.inc(event, "overloaded")
+        return "overloaded", 1.0
+
+    bucket = _socket_buckets.get(sid)
+    if bucket is None:
+        bucket = _socket_buckets[sid] = TokenBucket(SOCKET_BURST)
+    wait = bucket.take(SOCKET_RATE, SOCKET_BURST)
+    if wait:
+        REJECTED.inc(event, "socket_rate")
+        return "socket_rate", round(wait, 3)
+
+    if isinstance(player_id, str) and player_id:
+        wait = _player_bucket(player_id).take(PLAYER_RATE, PLAYER_BURST)
+        if wait:
+            REJECTED.inc(event, "player_rate")
+            return "player_rate", round(wait, 3)
+    return None
+
+
+class inflight:
+    """with admission.inflight(): 計入全域同時處理數（只有處理中途讓出 hub 時才會累積）"""
+
+    def __enter__(self):
+        global _inflight
+        _inflight += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        global _inflight
+        _inflight -= 1
+        return False
+
+
+def forget(sid):
+    _socket_buckets.pop(sid, None)
+
+
+# ----------------------------
+# update_board 合併
+# ----------------------------
+class Coalescer:
+    """以 (room_id, key) 合併相同的讀取；同時到達的請求等待第一個的結果，
+    完成後 ttl 秒內的相同請求直接重用（ttl <= 0 時不重用）。invalidate(room_id) 於棋盤變動時呼叫"""
+
+    def __init__(self, event, ttl=COALESCE_TTL):
+        self.event = event
+        self.ttl = ttl
+        self._rooms = {}  # room_id -> {key: [expires_at, waiter, result]}
+        self._calls = 0
+
+    def run(self, room_id, key, compute):
+        self._calls += 1
+        if self._calls % PRUNE_EVERY == 0:
+            self.prune()
+        entries = self._rooms.setdefault(room_id, {})
+        entry = entries.get(key)
+        if entry is not None:
+            expires_at, waiter, result = entry
+            if waiter is not None:
+                COALESCED.inc(self.event)
+                return waiter.wait()
+            if expires_at is not None and time.monotonic() < expires_at:
+                COALESCED.inc(self.event)
+                return result
+
+        waiter = Event() if Event is not None else None
+        entry = entries[key] = [None, waiter, None]
+        try:
+            result = compute()
+        except BaseException as e:
+            if entries.get(key) is entry:
+                del entries[key]
+            if waiter is not None:
+                waiter.send_exception(e)
+            raise
+        # 計算期間房間被 invalidate 時不快取（結果可能已過期），但等待者仍拿這份結果
+        if self._rooms.get(room_id) is entries and entries.get(key) is entry:
+            if self.ttl > 0:
+                entry[:] = [time.monotonic() + self.ttl, None, result]
+            else:
+                del entries[key]
+        if waiter is not None:
+            waiter.send(result)
+        return result
+
+    def invalidate(self, room_id):
+        self._rooms.pop(room_id, None)
+
+    def prune(self):
+        """清掉已過期的條目"""
+        now = time.monotonic()
+        for room_id in list(self._rooms):
+            entries = self._rooms[room_id]
+            for key in [k for k, e in entries.items() if e[0] is not None and e[0] < now]:
+                del entries[key]
+            if not entries:
+                del self._rooms[room_id]
+
+
+# 多 worker 時棋盤變動的 invalidate 只在擁有房間的 worker 發生，其他 worker 不能重用算好的結果
+board_updates = Coalescer("update_board", ttl=0 if cluster.is_clustered() else COALESCE_TTL)
@@ -4,11 +4,11 @@ from .utils import BOARD_SIZE, SHIP_SIZES
 
 def can_place(board, row, col, length, horizontal):
     if horizontal:
-        if col + length > BOARD_SIZE:
+        if col + length > len(board[row]):
             return False
         return all(board[row][c] == 0 for c in range(col, col + length))
     else:
-        if row + length > BOARD_SIZE:
+        if row + length > len(board):
             return False
         return all(board[r][col] == 0 for r in range(row, row + length))
 
@@ -19,19 +19,19 @@ def _compute_image_id(ship_id, size):
     return size
 
 
-def generate_board():
-    board = [[0] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+def generate_board(board_size=BOARD_SIZE, ship_sizes=SHIP_SIZES):
+    board = [[0] * board_size for _ in range(board_size)]
     ships = []
-    for idx, size in enumerate(SHIP_SIZES):
+    for idx, size in enumerate(ship_sizes):
         placed = False
         while not placed:
             horizontal = random.choice([True, False])
             if horizontal:
-                row = random.randint(0, BOARD_SIZE - 1)
-                col = random.randint(0, BOARD_SIZE - size)
+                row = random.randint(0, board_size - 1)
+                col = random.randint(0, board_size - size)
             else:
-                row = random.randint(0, BOARD_SIZE - size)
-                col = random.randint(0, BOARD_SIZE - 1)
+                row = random.randint(0, board_size - size)
+                col = random.randint(0, board_size - 1)
 
             if can_place(board, row, col, size, horizontal):
                 if horizontal:
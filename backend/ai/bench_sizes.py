@@ -0,0 +1,82 @@
+"""各種棋盤大小的單步 AI 延遲基準：啟發式、機率密度與 DQN / ConvDQN 推論。
+
+用法（在 backend/ 目錄下）：
+    uv run python -m ai.bench_sizes --games 5
+
+模型使用隨機初始化的權重（推論延遲與權重無關），不需要先訓練。
+"""
+import time
+import random
+import argparse
+
+import torch
+
+from .env import BattleshipEnv
+from .dqn_battleship import DQN, ConvDQN
+from .evaluate_method import choose_action
+from .simulate import percentile
+from .utils import BOARD_SIZE, VARIANTS, get_allowed_actions, get_variant
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def bench_variant(name, games, seed=0):
+    size, ship_sizes = get_variant(name)
+    models = {"conv_dqn": ConvDQN().eval()}
+    if size == BOARD_SIZE:
+        models["dqn"] = DQN().eval()
+    timings = {"density": [], "heuristic": [], **{key: [] for key in models}}
+
+    random.seed(seed)
+    moves = 0
+    for _ in range(games):
+        env = BattleshipEnv(board_size=size, ship_sizes=ship_sizes, reuse_obs=True)
+        state_feature = env.reset()
+        done = False
+        while not done:
+            started = time.perf_counter()
+            env.compute_probability_density()
+            timings["density"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            action = random.choice(get_allowed_actions(env))
+            timings["heuristic"].append(time.perf_counter() - started)
+
+            for key, model in models.items():
+                started = time.perf_counter()
+                choose_action(model, env, state_feature)
+                timings[key].append(time.perf_counter() - started)
+
+            state_feature, _, done = env.step(action)
+            moves += 1
+
+    return {
+        "variant": name,
+        "board": f"{size}x{size}",
+        "moves_per_game": round(moves / games, 1),
+        **{key: {"p50_ms": _ms(percentile(values, 50)), "p90_ms": _ms(percentile(values, 90))}
+           for key, values in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-move AI latency by board size")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--torch-threads", type=int, default=1)
+    args = parser.parse_args()
+    torch.set_num_threads(args.torch_threads)
+
+    columns = ("density", "heuristic", "dqn", "conv_dqn")
+    print("| variant | 棋盤 | 每局步數 | " + " | ".join(f"{c} p50 / p90 (ms)" for c in columns) + " |")
+    print("| --- | --- | --- | " + " | ".join("---" for _ in columns) + " |")
+    for name in args.variants:
+        row = bench_variant(name, args.games)
+        cells = [f"{row[c]['p50_ms']} / {row[c]['p90_ms']}" if c in row else "-" for c in columns]
+        print(f"| {row['variant']} | {row['board']} | {row['moves_per_game']} | " + " | ".join(cells) + " |")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,12 @@ import torch.optim as optim
 import random
 import matplotlib.pyplot as plt
 from collections import deque
-from .utils import BOARD_SIZE, SHIP_SIZES
+from .utils import BOARD_SIZE, SHIP_SIZES, DEFAULT_VARIANT, VARIANTS, get_variant
 from .env import BattleshipEnv
 
 
 class DQN(nn.Module):
-    def __init__(self):
+    def __init__(self, board_size=BOARD_SIZE):
         super(DQN, self).__init__()
         self.conv = nn.Sequential(
             nn.Conv2d(in_channels=4, out_channels=32, kernel_size=3, stride=1, padding=1),
@@ -19,9 +19,9 @@ class DQN(nn.Module):
             nn.ReLU()
         )
         self.fc = nn.Sequential(
-            nn.Linear(64 * BOARD_SIZE * BOARD_SIZE, 256),
+            nn.Linear(64 * board_size * board_size, 256),
             nn.ReLU(),
-            nn.Linear(256, BOARD_SIZE * BOARD_SIZE)
+            nn.Linear(256, board_size * board_size)
         )
 
     def forward(self, x):
@@ -30,34 +30,85 @@ class DQN(nn.Module):
         return self.fc(x)
 
 
-def train():
+class ConvDQN(nn.Module):
+    """全卷積版本：沒有全連接層，同一組權重可用於任意大小的棋盤，計算量與棋盤面積成正比"""
+    def __init__(self):
+        super(ConvDQN, self).__init__()
+        self.conv = nn.Sequential(
+            nn.Conv2d(in_channels=4, out_channels=32, kernel_size=3, stride=1, padding=1),
+            nn.ReLU(),
+            nn.Conv2d(in_channels=32, out_channels=64, kernel_size=3, stride=1, padding=1),
+            nn.ReLU(),
+            # 空洞卷積放大感受野，長船也看得到兩端
+            nn.Conv2d(in_channels=64, out_channels=64, kernel_size=3, stride=1, padding=2, dilation=2),
+            nn.ReLU(),
+            nn.Conv2d(in_channels=64, out_channels=1, kernel_size=1)
+        )
+
+    def forward(self, x):
+        return self.conv(x).flatten(1)
+
+
+# 訓練超參數預設值；train(params=...) 只需給要覆寫的鍵，ai/sweep.py 以此做搜尋
+DEFAULT_PARAMS = {
+    "lr": 0.001,
+    "gamma": 0.99,
+    "batch_size": 64,
+    "epsilon_start": 1.0,
+    "epsilon_decay": 0.995,
+    "epsilon_min": 0.01,
+    "update_target_steps": 10,
+    "memory_size": 5000,
+    "episodes": 1000,
+}
+
+
+def resolve_params(params=None):
+    """合併預設值；未知的鍵直接報錯，避免打錯字卻默默用了預設值"""
+    params = dict(params or {})
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的超參數：{', '.join(sorted(unknown))}")
+    merged = {**DEFAULT_PARAMS, **params}
+    for key in ("batch_size", "update_target_steps", "memory_size", "episodes"):
+        merged[key] = int(merged[key])
+    return merged
+
+
+def train(board_size=BOARD_SIZE, ship_sizes=SHIP_SIZES, conv=False, model_path="dqn_battleship.pth",
+          params=None, verbose=True, plot=True):
+    """回傳 (model, history)；history 含每局總獎勵、epsilon 與總步數"""
+    p = resolve_params(params)
     reward_history = []
     epsilon_history = []
+    steps = 0
 
-    env = BattleshipEnv()
-    model = DQN()
-    target_model = DQN()
+    # replay memory 要保留每一步的觀察值，不能用 reuse_obs（torch.FloatTensor 會與陣列共用記憶體）
+    env = BattleshipEnv(board_size=board_size, ship_sizes=ship_sizes)
+    num_actions = board_size * board_size
+    model = ConvDQN() if conv else DQN(board_size)
+    target_model = ConvDQN() if conv else DQN(board_size)
     target_model.load_state_dict(model.state_dict())
 
-    optimizer = optim.Adam(model.parameters(), lr=0.001)
+    optimizer = optim.Adam(model.parameters(), lr=p["lr"])
     loss_fn = nn.MSELoss()
-    memory = deque(maxlen=5000)
-    batch_size = 64
-    gamma = 0.99
-    epsilon = 1.0
-    epsilon_decay = 0.995
-    epsilon_min = 0.01
-    update_target_steps = 10
-    episodes = 1000
+    memory = deque(maxlen=p["memory_size"])
+    batch_size = p["batch_size"]
+    gamma = p["gamma"]
+    epsilon = p["epsilon_start"]
+    epsilon_decay = p["epsilon_decay"]
+    epsilon_min = p["epsilon_min"]
+    update_target_steps = p["update_target_steps"]
+    episodes = p["episodes"]
 
     for episode in range(episodes):
         state_np = env.reset()
         state = torch.FloatTensor(state_np).unsqueeze(0)
         total_reward = 0
 
-        for t in range(100):
+        for t in range(num_actions):
             if random.random() < epsilon:
-                action = random.randint(0, BOARD_SIZE * BOARD_SIZE - 1)
+                action = random.randint(0, num_actions - 1)
             else:
                 with torch.no_grad():
                     q_values = model(state).squeeze()
@@ -68,6 +119,7 @@ def train():
             memory.append((state, action, reward, next_state, done))
             state = next_state
             total_reward += reward
+            steps += 1
 
             if done:
                 break
@@ -100,10 +152,15 @@ def train():
         reward_history.append(total_reward)
         epsilon_history.append(epsilon)
 
-        print(f"Episode {episode+1}, Total Reward: {total_reward:.2f}, Epsilon: {epsilon:.3f}")
+        if verbose:
+            print(f"Episode {episode+1}, Total Reward: {total_reward:.2f}, Epsilon: {epsilon:.3f}")
 
-    torch.save(model.state_dict(), "dqn_battleship.pth")
-    print("訓練完成並儲存模型")
+    torch.save(model.state_dict(), model_path)
+    if verbose:
+        print("訓練完成並儲存模型")
+    history = {"rewards": reward_history, "epsilons": epsilon_history, "steps": steps}
+    if not plot:
+        return model, history
 
     plt.figure(figsize=(10, 5))
     plt.plot(reward_history, label="Total Reward", color='blue')
@@ -126,7 +183,23 @@ def train():
     plt.tight_layout()
     plt.savefig("epsilon_plot.png")
     plt.show()
+    return model, history
 
 
 if __name__ == "__main__":
-    train()
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the battleship DQN")
+    parser.add_argument("--variant", default=DEFAULT_VARIANT, choices=list(VARIANTS))
+    parser.add_argument("--conv", action="store_true", help="使用全卷積的 ConvDQN（非 classic 大小時必須）")
+    parser.add_argument("--out", help="模型輸出路徑")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                        help=f"覆寫超參數，可重複給（{', '.join(DEFAULT_PARAMS)}）")
+    args = parser.parse_args()
+    try:
+        params = resolve_params({key: float(value) for key, value in
+                                 (item.split("=", 1) for item in args.param)})
+    except ValueError as e:
+        parser.error(f"--param 格式錯誤：{e}")
+    size, ship_sizes = get_variant(args.variant)
+    conv = args.conv or size != BOARD_SIZE
+    train(size, ship_sizes, conv, args.out or ("dqn_conv.pth" if conv else "dqn_battleship.pth"), params)
@@ -1,37 +1,91 @@
 import numpy as np
 from copy import deepcopy
+from numpy.lib.stride_tricks import sliding_window_view
 from .utils import BOARD_SIZE, SHIP_SIZES
 from .battleship_board import generate_board
 
 
 class BattleshipEnv:
-    def __init__(self, board=None):
-        self.total_ship_segments = sum(SHIP_SIZES)
-        self.ship_board = board if board is not None else generate_board()['board']
+    """reuse_obs=True 或給 obs_out 時，觀察值寫在同一塊 (4, n, n) float32 緩衝區（obs_out 可以是
+    batch 陣列的一列），每一砲只更新變動的格子，reset/step 不再配置新陣列；回傳的是同一個物件，
+    需要保留歷史觀察值的呼叫端（例如訓練的 replay memory）必須自行複製；
+    注意 torch.from_numpy 與 torch.FloatTensor(ndarray) 都不會複製"""
+
+    def __init__(self, board=None, board_size=BOARD_SIZE, ship_sizes=SHIP_SIZES, reuse_obs=False, obs_out=None):
+        # 給定棋盤時以棋盤本身的大小為準
+        self.size = len(board) if board is not None else board_size
+        self.ship_sizes = list(ship_sizes)
+        self.total_ship_segments = sum(self.ship_sizes)
+        self.ship_board = board if board is not None else generate_board(self.size, self.ship_sizes)['board']
+        self._components, self._component_of = self._find_components()
+
+        shape = (4, self.size, self.size)
+        if obs_out is not None:
+            if obs_out.shape != shape or obs_out.dtype != np.float32 or not obs_out.flags.writeable:
+                raise ValueError(f"obs_out 必須是可寫入的 float32 陣列，形狀 {shape}")
+            self._obs = obs_out
+        else:
+            self._obs = np.empty(shape, dtype=np.float32) if reuse_obs else None
         self.reset()
 
+    def _find_components(self):
+        """棋盤固定不變，船隻（相連的 1）只需在建立時找一次"""
+        n = self.size
+        components = []
+        component_of = {}
+        for i in range(n):
+            for j in range(n):
+                if self.ship_board[i][j] == 1 and (i, j) not in component_of:
+                    ship_cells = []
+                    stack = [(i, j)]
+                    component_of[(i, j)] = len(components)
+                    while stack:
+                        cx, cy = stack.pop()
+                        ship_cells.append((cx, cy))
+                        for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
+                            nx, ny = cx + dx, cy + dy
+                            if 0 <= nx < n and 0 <= ny < n:
+                                if self.ship_board[nx][ny] == 1 and (nx, ny) not in component_of:
+                                    component_of[(nx, ny)] = len(components)
+                                    stack.append((nx, ny))
+                    components.append(ship_cells)
+        return components, component_of
+
     def reset(self):
-        self.state = [[0] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+        self.state = [[0] * self.size for _ in range(self.size)]
         self.remaining = sum(row.count(1) for row in self.ship_board)
-        self.remaining_ships = deepcopy(SHIP_SIZES)
+        self.remaining_ships = deepcopy(self.ship_sizes)
         self.last_hit_position = None
+        if self._obs is not None:
+            self._obs[0].fill(1)
+            self._obs[1:3].fill(0)
+            self._obs[3].fill(self.remaining / self.total_ship_segments)
+            return self._obs
         return self.get_feature_map()
 
     def get_feature_map(self):
+        """由 state 完整重算觀察值；緩衝區模式下寫回緩衝區（外部直接改過 state 時用來同步）"""
         board = np.array(self.state)
+        if self._obs is not None:
+            np.equal(board, 0, out=self._obs[0])
+            np.equal(board, 1, out=self._obs[1])
+            np.greater_equal(board, 2, out=self._obs[2])
+            self._obs[3].fill(self.remaining / self.total_ship_segments)
+            return self._obs
         ch0 = (board == 0).astype(np.float32)
         ch1 = (board == 1).astype(np.float32)
         ch2 = ((board == 2) | (board == 3)).astype(np.float32)
         remaining_ratio = self.remaining / self.total_ship_segments
-        ch3 = np.full((BOARD_SIZE, BOARD_SIZE), remaining_ratio, dtype=np.float32)
+        ch3 = np.full((self.size, self.size), remaining_ratio, dtype=np.float32)
         return np.stack([ch0, ch1, ch2, ch3], axis=0)
 
     def step(self, action):
-        x, y = divmod(action, BOARD_SIZE)
+        x, y = divmod(action, self.size)
         reward = 0
         done = False
+        fresh = self.state[x][y] == 0
 
-        if self.state[x][y] != 0:
+        if not fresh:
             reward = -1
         elif self.ship_board[x][y] == 1:
             self.state[x][y] = 2
@@ -39,64 +93,60 @@ class BattleshipEnv:
             self.last_hit_position = (x, y)
             reward += 0.5
             self.remaining -= 1
+            # 只有被打中的那艘船可能剛被擊沉
+            self._mark_sunk(self._components[self._component_of[(x, y)]])
         else:
             self.state[x][y] = 1
             reward = -0.1
             self.last_hit_position = None
 
-        self.check_and_mark_sunk()
-
         if self.remaining == 0:
             done = True
             reward = 10
 
-        return self.get_feature_map(), reward, done
+        if self._obs is None:
+            return self.get_feature_map(), reward, done
+        if fresh:
+            # 擊沉（2 -> 3）不影響觀察值，每一砲只動一格與剩餘比例
+            obs = self._obs
+            obs[0, x, y] = 0
+            if self.state[x][y] == 1:
+                obs[1, x, y] = 1
+            else:
+                obs[2, x, y] = 1
+                obs[3].fill(self.remaining / self.total_ship_segments)
+        return self._obs, reward, done
 
     def available_actions(self):
-        return [i for i in range(BOARD_SIZE * BOARD_SIZE)
-                if self.state[i // BOARD_SIZE][i % BOARD_SIZE] == 0]
+        n = self.size
+        return [i for i in range(n * n) if self.state[i // n][i % n] == 0]
 
     def check_and_mark_sunk(self):
-        visited = [[False] * BOARD_SIZE for _ in range(BOARD_SIZE)]
-        for i in range(BOARD_SIZE):
-            for j in range(BOARD_SIZE):
-                if self.ship_board[i][j] == 1 and not visited[i][j]:
-                    ship_cells = []
-                    stack = [(i, j)]
-                    visited[i][j] = True
-                    while stack:
-                        cx, cy = stack.pop()
-                        ship_cells.append((cx, cy))
-                        for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
-                            nx, ny = cx + dx, cy + dy
-                            if 0 <= nx < BOARD_SIZE and 0 <= ny < BOARD_SIZE:
-                                if self.ship_board[nx][ny] == 1 and not visited[nx][ny]:
-                                    visited[nx][ny] = True
-                                    stack.append((nx, ny))
-                    sunk = all(self.state[x][y] == 2 for (x, y) in ship_cells)
-                    if sunk:
-                        for (x, y) in ship_cells:
-                            self.state[x][y] = 3
-                        ship_size = len(ship_cells)
-                        if ship_size in self.remaining_ships:
-                            self.remaining_ships.remove(ship_size)
-                        if self.last_hit_position in ship_cells:
-                            self.last_hit_position = None
+        for ship_cells in self._components:
+            self._mark_sunk(ship_cells)
+
+    def _mark_sunk(self, ship_cells):
+        sunk = all(self.state[x][y] == 2 for (x, y) in ship_cells)
+        if sunk:
+            for (x, y) in ship_cells:
+                self.state[x][y] = 3
+            ship_size = len(ship_cells)
+            if ship_size in self.remaining_ships:
+                self.remaining_ships.remove(ship_size)
+            if self.last_hit_position in ship_cells:
+                self.last_hit_position = None
 
     def compute_probability_density(self):
-        density = np.zeros((BOARD_SIZE, BOARD_SIZE), dtype=np.float32)
+        """每格被剩餘船隻（橫/直）覆蓋的擺法數；以滑動視窗計算，成本與棋盤面積成正比"""
+        density = np.zeros((self.size, self.size), dtype=np.float32)
         available = np.array(self.state) == 0
         for ship_len in self.remaining_ships:
-            for i in range(BOARD_SIZE):
-                for j in range(BOARD_SIZE - ship_len + 1):
-                    segment = available[i, j:j+ship_len]
-                    if segment.all():
-                        for k in range(ship_len):
-                            density[i, j+k] += 1
-            for j in range(BOARD_SIZE):
-                for i in range(BOARD_SIZE - ship_len + 1):
-                    segment = available[i:i+ship_len, j]
-                    if segment.all():
-                        for k in range(ship_len):
-                            density[i+k, j] += 1
+            if ship_len > self.size:
+                continue
+            span = self.size - ship_len + 1
+            fits_row = sliding_window_view(available, ship_len, axis=1).all(axis=2)
+            fits_col = sliding_window_view(available, ship_len, axis=0).all(axis=2)
+            for k in range(ship_len):
+                density[:, k:k + span] += fits_row
+                density[k:k + span, :] += fits_col
         return density
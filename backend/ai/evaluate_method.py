@@ -2,33 +2,68 @@ import os
 import torch
 from .battleship_board import generate_board
 from .env import BattleshipEnv
-from .dqn_battleship import DQN
-from .utils import BOARD_SIZE, get_allowed_actions
+from .dqn_battleship import DQN, ConvDQN
+from .utils import BOARD_SIZE, SHIP_SIZES, get_allowed_actions
+from .move_cache import MoveCache, load_opening_book, state_key
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(CURRENT_DIR, "dqn_battleship.pth")
+CONV_MODEL_PATH = os.path.join(CURRENT_DIR, "dqn_conv.pth")  # 非 10x10 棋盤使用的全卷積模型
 
+_loaded = {}  # model_path -> (mtime, model, move_cache)
 
-def evaluate(model_path=MODEL_PATH, board=None):
+
+def model_path_for(board_size):
+    return MODEL_PATH if board_size == BOARD_SIZE else CONV_MODEL_PATH
+
+
+def load_model(model_path=MODEL_PATH):
+    """依權重內容判斷架構：有全連接層的是 DQN，否則是 ConvDQN"""
+    state_dict = torch.load(model_path, weights_only=True)
+    model = DQN() if any(key.startswith("fc.") for key in state_dict) else ConvDQN()
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model
+
+
+def get_model(model_path=MODEL_PATH):
+    """回傳 (model, move_cache)；模型只載入一次，檔案更新後才重新載入並清空快取"""
+    mtime = os.path.getmtime(model_path)
+    entry = _loaded.get(model_path)
+    if entry is None or entry[0] != mtime:
+        model = load_model(model_path)
+        entry = _loaded[model_path] = (mtime, model, MoveCache(book=load_opening_book(model_path)))
+    return entry[1], entry[2]
+
+
+def choose_action(model, env, state_feature):
+    """在啟發式允許的格子中選 Q 值最高的一格"""
+    allowed_moves = torch.tensor(get_allowed_actions(env), dtype=torch.long)
+    # from_numpy 與觀察值共用記憶體，不複製（模型不會改動輸入）
+    state_tensor = torch.from_numpy(state_feature).unsqueeze(0)
+    with torch.no_grad():
+        q_values = model(state_tensor).squeeze()
+        masked = torch.full_like(q_values, -1e9)
+        masked[allowed_moves] = q_values[allowed_moves]
+        return torch.argmax(masked).item()
+
+
+def choose_action_cached(model, move_cache, env, state_feature):
+    return move_cache.get_or_compute(state_key(env), lambda: choose_action(model, env, state_feature))
+
+
+def evaluate(model_path=None, board=None, ship_sizes=None):
+    """ship_sizes 為該局的艦隊，未給時使用預設的 SHIP_SIZES"""
     if board is None:
         board = generate_board()['board']
-    model = DQN()
-    model.load_state_dict(torch.load(model_path, weights_only=True))
-    model.eval()
-    env = BattleshipEnv(board)
+    model, move_cache = get_model(model_path or model_path_for(len(board)))
+    env = BattleshipEnv(board, ship_sizes=ship_sizes or SHIP_SIZES, reuse_obs=True)
     result = []
     state_feature = env.reset()
     done = False
     while not done:
-        allowed_moves = get_allowed_actions(env)
-        state_tensor = torch.FloatTensor(state_feature).unsqueeze(0)
-        with torch.no_grad():
-            q_values = model(state_tensor).squeeze()
-            for i in range(BOARD_SIZE * BOARD_SIZE):
-                if i not in allowed_moves:
-                    q_values[i] = -1e9
-            action = torch.argmax(q_values).item()
-        x, y = divmod(action, BOARD_SIZE)
+        action = choose_action_cached(model, move_cache, env, state_feature)
+        x, y = divmod(action, env.size)
         result.append([x, y])
         state_feature, reward, done = env.step(action)
     return result
@@ -0,0 +1,232 @@
+"""離線專家資料集：用 ai/utils.py 的啟發式（含機率密度）大量自我對局，供 DQN 監督式預訓練。
+
+用法（在 backend/ 目錄下）：
+    uv run python -m ai.expert_dataset generate --out data/expert --positions 10000000 --workers 8
+    uv run python -m ai.expert_dataset pretrain --data data/expert --epochs 2 --out ai/dqn_pretrained.pth
+
+資料以固定大小的分片存放，每個分片三個 .npy（皆可 mmap）：
+- features：uint8 (N, 4, 10, 10)，前三個通道與 BattleshipEnv.get_feature_map 相同，
+  第 4 通道存剩餘船格數，讀取時才除以總船格數，一筆 400 bytes 而不是 float32 的 1600。
+- actions：int16 (N,)，專家選的格子。
+- masks：bool (N, 100)，合法（尚未攻擊過）的格子。
+index.json 記錄分片清單與每片實際筆數；讀取端只 mmap，不會把整份資料載入記憶體。
+"""
+import os
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from .env import BattleshipEnv
+from .dqn_battleship import DQN
+from .utils import BOARD_SIZE, SHIP_SIZES, get_allowed_actions
+
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+CHANNELS = 4
+NUM_ACTIONS = BOARD_SIZE * BOARD_SIZE
+
+
+def _shard_paths(root, name):
+    return {part: os.path.join(root, f"{name}.{part}.npy") for part in ("features", "actions", "masks")}
+
+
+# ----------------------------
+# 產生資料
+# ----------------------------
+def generate_shard(root, name, size, seed):
+    """用啟發式自我對局填滿一個分片，回傳分片資訊"""
+    random.seed(seed)
+    paths = _shard_paths(root, name)
+    open_memmap = np.lib.format.open_memmap
+    features = open_memmap(paths["features"], mode="w+", dtype=np.uint8,
+                           shape=(size, CHANNELS, BOARD_SIZE, BOARD_SIZE))
+    actions = open_memmap(paths["actions"], mode="w+", dtype=np.int16, shape=(size,))
+    masks = open_memmap(paths["masks"], mode="w+", dtype=np.bool_, shape=(size, NUM_ACTIONS))
+
+    count = games = 0
+    while count < size:
+        env = BattleshipEnv(reuse_obs=True)
+        done = False
+        while not done and count < size:
+            state = np.array(env.state, dtype=np.uint8)
+            features[count, 0] = state == 0
+            features[count, 1] = state == 1
+            features[count, 2] = state >= 2
+            features[count, 3] = env.remaining
+            masks[count] = state.reshape(-1) == 0
+            action = random.choice(get_allowed_actions(env))
+            actions[count] = action
+            _, _, done = env.step(action)
+            count += 1
+        games += 1
+
+    for array in (features, actions, masks):
+        array.flush()
+    return {"name": name, "count": count, "games": games}
+
+
+def generate(out_dir, positions, shard_size=1_000_000, seed=0, workers=None, on_progress=None):
+    """產生 positions 筆資料；每個分片用獨立種子，由行程池平行產生"""
+    os.makedirs(out_dir, exist_ok=True)
+    sizes = [min(shard_size, positions - start) for start in range(0, positions, shard_size)]
+    names = [f"shard-{i:05d}" for i in range(len(sizes))]
+    started = time.perf_counter()
+
+    shards = []
+    with ProcessPoolExecutor(max_workers=max(1, workers or os.cpu_count() or 1)) as pool:
+        futures = [pool.submit(generate_shard, out_dir, name, size, seed * 100_003 + i)
+                   for i, (name, size) in enumerate(zip(names, sizes))]
+        for future in as_completed(futures):
+            shards.append(future.result())
+            if on_progress:
+                on_progress(len(shards), len(sizes))
+
+    shards.sort(key=lambda shard: shard["name"])
+    index = {
+        "version": FORMAT_VERSION,
+        "policy": "heuristic",
+        "seed": seed,
+        "shard_size": shard_size,
+        "total": sum(shard["count"] for shard in shards),
+        "games": sum(shard["games"] for shard in shards),
+        "feature_shape": [CHANNELS, BOARD_SIZE, BOARD_SIZE],
+        "ship_segments": sum(SHIP_SIZES),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "shards": shards,
+    }
+    # 先寫暫存檔再改名，讀取端不會看到寫到一半的索引
+    tmp_path = os.path.join(out_dir, INDEX_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_NAME))
+    return index
+
+
+# ----------------------------
+# 串流讀取
+# ----------------------------
+class ExpertDataset(IterableDataset):
+    """直接從 mmap 分片產生 (features, actions, masks) batch；
+    搭配 DataLoader(batch_size=None, num_workers=N) 時各 worker 分到不同分片"""
+
+    def __init__(self, root, batch_size=512, shuffle=True, seed=0):
+        with open(os.path.join(root, INDEX_NAME), encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支援的資料集版本：{self.index.get('version')}")
+        self.root = root
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return sum(-(-shard["count"] // self.batch_size) for shard in self.index["shards"])
+
+    def set_epoch(self, epoch):
+        """每個 epoch 換一種洗牌順序"""
+        self.epoch = epoch
+
+    def _to_tensors(self, features, actions, masks):
+        x = torch.from_numpy(features.astype(np.float32))
+        x[:, 3] /= self.index["ship_segments"]
+        return x, torch.from_numpy(actions.astype(np.int64)), torch.from_numpy(masks)
+
+    def __iter__(self):
+        shards = list(self.index["shards"])
+        rng = np.random.default_rng((self.seed, self.epoch))
+        if self.shuffle:
+            rng.shuffle(shards)
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+
+        for shard in shards:
+            paths = _shard_paths(self.root, shard["name"])
+            features = np.load(paths["features"], mmap_mode="r")
+            actions = np.load(paths["actions"], mmap_mode="r")
+            masks = np.load(paths["masks"], mmap_mode="r")
+            count = shard["count"]
+            order = rng.permutation(count) if self.shuffle else np.arange(count)
+            for start in range(0, count, self.batch_size):
+                # 排序後再取，讀 mmap 時盡量循序
+                rows = np.sort(order[start:start + self.batch_size])
+                yield self._to_tensors(features[rows], actions[rows], masks[rows])
+
+
+# ----------------------------
+# 監督式預訓練（behavior cloning）
+# ----------------------------
+def pretrain(data_dir, out_path, epochs=1, batch_size=512, lr=0.001, num_workers=0, init=None):
+    """以專家動作做分類（非法格子遮掉），讓 DQN 從模仿啟發式開始而不是隨機權重"""
+    model = DQN()
+    if init:
+        model.load_state_dict(torch.load(init, weights_only=True))
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    dataset = ExpertDataset(data_dir, batch_size=batch_size)
+    print(f"資料集：{dataset.index['total']} 筆，{len(dataset.index['shards'])} 個分片")
+
+    model.train()
+    for epoch in range(epochs):
+        dataset.set_epoch(epoch)
+        loader = DataLoader(dataset, batch_size=None, num_workers=num_workers)
+        total_loss = correct = seen = 0
+        for step, (x, action, mask) in enumerate(loader):
+            q_values = model(x).masked_fill(~mask, -1e9)
+            loss = F.cross_entropy(q_values, action)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+            total_loss += loss.item() * len(action)
+            correct += (q_values.argmax(1) == action).sum().item()
+            seen += len(action)
+            if step % 500 == 0:
+                print(f"Epoch {epoch+1}, step {step}, loss {total_loss / seen:.4f}, acc {correct / seen:.3f}")
+        print(f"Epoch {epoch+1} 完成，loss {total_loss / max(seen, 1):.4f}, acc {correct / max(seen, 1):.3f}")
+
+    torch.save(model.state_dict(), out_path)
+    print(f"預訓練完成並儲存模型：{out_path}")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expert dataset for DQN pretraining")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="以啟發式自我對局產生資料")
+    gen.add_argument("--out", required=True)
+    gen.add_argument("--positions", type=int, default=1_000_000)
+    gen.add_argument("--shard-size", type=int, default=1_000_000)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    pre = sub.add_parser("pretrain", help="用資料集預訓練 DQN")
+    pre.add_argument("--data", required=True)
+    pre.add_argument("--out", default="dqn_pretrained.pth")
+    pre.add_argument("--init", help="從既有權重繼續")
+    pre.add_argument("--epochs", type=int, default=1)
+    pre.add_argument("--batch-size", type=int, default=512)
+    pre.add_argument("--lr", type=float, default=0.001)
+    pre.add_argument("--num-workers", type=int, default=0, help="DataLoader 讀取行程數")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        if args.positions <= 0 or args.shard_size <= 0:
+            parser.error("positions 與 shard-size 必須是正整數")
+        index = generate(args.out, args.positions, args.shard_size, args.seed, args.workers,
+                         on_progress=lambda done, total: print(f"分片 {done}/{total} 完成"))
+        print(f"已寫入 {index['total']} 筆（{index['games']} 局）到 {args.out}，耗時 {index['elapsed_s']}s")
+    else:
+        pretrain(args.data, args.out, args.epochs, args.batch_size, args.lr, args.num_workers, args.init)
+
+
+if __name__ == "__main__":
+    main()
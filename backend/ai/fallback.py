@@ -0,0 +1,29 @@
+import random
+from .env import BattleshipEnv
+from .utils import SHIP_SIZES, check_sunken_ships, get_allowed_actions
+
+
+def observe(board_data, ship_sizes=SHIP_SIZES):
+    """由伺服器的棋盤（0 空 / 1 船 / 2 命中 / 3 未中）建立攻擊方看得到的 env；
+    ship_sizes 為該局艦隊，棋盤資料帶有 ships 時以其為準"""
+    board = board_data["board"]
+    fleet = [ship["size"] for ship in board_data.get("ships", [])] or ship_sizes
+    env = BattleshipEnv(board, ship_sizes=fleet)
+    env.state = [[2 if cell == 2 else 1 if cell == 3 else 0 for cell in row] for row in board]
+    env.remaining = sum(row.count(1) for row in board)
+    sunk_ids = check_sunken_ships(board_data)
+    for ship in board_data.get("ships", []):
+        if ship["id"] not in sunk_ids:
+            continue
+        for i in range(ship["size"]):
+            r, c = (ship["row"], ship["col"] + i) if ship["orientation"] == "horizontal" else (ship["row"] + i, ship["col"])
+            env.state[r][c] = 3
+        if ship["size"] in env.remaining_ships:
+            env.remaining_ships.remove(ship["size"])
+    return env
+
+
+def heuristic_move(board_data, ship_sizes=SHIP_SIZES):
+    """不經過 DQN，只用 get_allowed_actions 的啟發式選一格，回傳 [x, y]"""
+    env = observe(board_data, ship_sizes)
+    return list(divmod(random.choice(get_allowed_actions(env)), env.size))
@@ -0,0 +1,176 @@
+"""AI 出招快取：以觀察到的盤面（state + 剩餘船隻）為鍵，記住 DQN 選出的格子。
+
+同一個模型、同一個盤面一定選同一步，所以 PvE 開局那段所有對局都相同的前綴
+只要查一次字典。另有離線建好的開局庫（opening book），涵蓋前幾步所有命中/未中的分支。
+
+建立開局庫（在 backend/ 目錄下）：
+    uv run python -m ai.move_cache --depth 8
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import weakref
+import threading as _threading
+from collections import OrderedDict
+
+from .utils import BOARD_SIZE, SHIP_SIZES
+
+if "eventlet.patcher" in sys.modules:
+    # 伺服器會在 AI 執行緒池中查快取，monkey patch 之後仍要用原生的 lock
+    _threading = sys.modules["eventlet.patcher"].original("threading")
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+BOOK_PATH = os.environ.get("AI_OPENING_BOOK", os.path.join(CURRENT_DIR, "opening_book.json"))
+MAX_ENTRIES = int(os.environ.get("AI_MOVE_CACHE_SIZE", "50000"))
+
+_instances = weakref.WeakSet()
+
+
+def state_key(env):
+    """盤面的標準編碼：每格一個 byte（0 未打 / 1 未中 / 2 命中 / 3 擊沉）+ 排序後的剩餘船長"""
+    cells = bytes(cell for row in env.state for cell in row)
+    return cells + bytes(sorted(env.remaining_ships))
+
+
+def model_fingerprint(model_path):
+    with open(model_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class MoveCache:
+    """有上限的 LRU；開局庫命中時不占 LRU 空間"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, book=None):
+        self.max_entries = max_entries
+        self.book = book or {}
+        self._entries = OrderedDict()
+        self._lock = _threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.book_hits = 0
+        self.evictions = 0
+        _instances.add(self)
+
+    def get_or_compute(self, key, compute):
+        action = self.book.get(key)
+        if action is not None:
+            self.book_hits += 1
+            return action
+        with self._lock:
+            action = self._entries.get(key)
+            if action is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return action
+        action = compute()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = action
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return action
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.book_hits
+        return {
+            "book_hits": self.book_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "book_entries": len(self.book),
+            "hit_rate": round((self.hits + self.book_hits) / lookups, 4) if lookups else None,
+        }
+
+
+def stats():
+    """目前行程內所有快取的統計加總"""
+    total = {"book_hits": 0, "hits": 0, "misses": 0, "evictions": 0, "entries": 0, "book_entries": 0}
+    for cache in list(_instances):
+        for key, value in cache.stats().items():
+            if key in total:
+                total[key] += value
+    lookups = total["hits"] + total["misses"] + total["book_hits"]
+    total["hit_rate"] = round((total["hits"] + total["book_hits"]) / lookups, 4) if lookups else None
+    return total
+
+
+# ----------------------------
+# 開局庫
+# ----------------------------
+def load_opening_book(model_path, path=BOOK_PATH):
+    """讀取開局庫；與目前模型不符（重新訓練過）時忽略"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("model_sha256") != model_fingerprint(model_path):
+            print(f"開局庫 {path} 與目前模型不符，略過")
+            return {}
+        return {bytes.fromhex(key): action for key, action in data["moves"].items()}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"無法讀取開局庫 {path}：{e}")
+        return {}
+
+
+def _observed_env(state):
+    """由觀察到的盤面還原出選步所需的 env 欄位（未擊沉任何船）"""
+    from .env import BattleshipEnv
+    env = BattleshipEnv(board=[[0] * BOARD_SIZE for _ in range(BOARD_SIZE)])
+    env.state = state
+    env.remaining = sum(SHIP_SIZES) - sum(row.count(2) for row in state)
+    env.remaining_ships = list(SHIP_SIZES)
+    return env
+
+
+def build_opening_book(model, depth):
+    """從空盤面開始，展開前 depth 步每一步命中/未中的所有分支"""
+    from .evaluate_method import choose_action
+    book = {}
+
+    def expand(state, level):
+        env = _observed_env(state)
+        action = choose_action(model, env, env.get_feature_map())
+        book[state_key(env)] = action
+        if level + 1 >= depth:
+            return
+        x, y = divmod(action, BOARD_SIZE)
+        for value in (1, 2):  # 未中 / 命中
+            child = [row[:] for row in state]
+            child[x][y] = value
+            expand(child, level + 1)
+
+    expand([[0] * BOARD_SIZE for _ in range(BOARD_SIZE)], 0)
+    return book
+
+
+def main():
+    from .evaluate_method import MODEL_PATH, load_model
+    parser = argparse.ArgumentParser(description="Build the DQN opening book")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--depth", type=int, default=8, help="涵蓋前幾步（條目數約 2^depth）")
+    parser.add_argument("--out", default=BOOK_PATH)
+    args = parser.parse_args()
+
+    if not 1 <= args.depth <= 14:
+        print("depth 必須介於 1 到 14", file=sys.stderr)
+        sys.exit(2)
+    book = build_opening_book(load_model(args.model), args.depth)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({
+            "model_sha256": model_fingerprint(args.model),
+            "depth": args.depth,
+            "moves": {key.hex(): action for key, action in book.items()},
+        }, f)
+    print(f"已寫入 {len(book)} 個開局盤面到 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""大量 AI 對局模擬：不經過伺服器與 game 表，直接用 BattleshipEnv 在多個行程中平行對戰。
+
+用法（在 backend/ 目錄下）：
+    uv run python -m ai.simulate --strategy heuristic --opponent random --games 2000 --seed 1
+    uv run python -m ai.simulate --strategy dqn --boards boards.json --games 500
+
+- 給 --opponent 時為 AI 對 AI：雙方各自攻擊對方的隨機棋盤，先擊沉全部船者勝。
+- 給 --boards 時為 AI 對固定棋盤：輪流使用檔案中的棋盤，只統計攻擊方。
+- --ndjson 會把進度與最終結果逐行以 JSON 輸出（/admin/simulate 即以此串流）。
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .battleship_board import generate_board
+from .env import BattleshipEnv
+from .utils import BOARD_SIZE, get_allowed_actions
+
+STRATEGIES = ("dqn", "heuristic", "random")
+MAX_SHOTS = BOARD_SIZE * BOARD_SIZE
+CHUNK_SIZE = 25  # 每個工作單位的局數，減少行程間往返
+
+_model = None
+_move_cache = None
+
+
+def _init_worker(strategies):
+    """每個子行程只載入一次模型，並限制 torch 只用一條執行緒避免互搶 CPU"""
+    global _model, _move_cache
+    if "dqn" in strategies:
+        import torch
+        from .evaluate_method import get_model
+        torch.set_num_threads(1)
+        _model, _move_cache = get_model()
+
+
+def _pick(strategy, env, state_feature):
+    if strategy == "dqn":
+        from .evaluate_method import choose_action_cached
+        return choose_action_cached(_model, _move_cache, env, state_feature)
+    if strategy == "heuristic":
+        return random.choice(get_allowed_actions(env))
+    return random.choice(env.available_actions())
+
+
+def play(strategy, board):
+    """單方攻擊一張棋盤直到全部擊沉，回傳 (用掉的砲數, 棋盤上的船格數)"""
+    ship_cells = sum(cell == 1 for row in board for cell in row)
+    env = BattleshipEnv(board, reuse_obs=True)
+    state_feature = env.reset()
+    shots = 0
+    done = False
+    while not done and shots < MAX_SHOTS:
+        state_feature, reward, done = env.step(_pick(strategy, env, state_feature))
+        shots += 1
+    return shots, ship_cells
+
+
+def play_game(spec, index):
+    # 每局各自決定亂數種子，結果與工作分配方式無關
+    random.seed(f"{spec['seed']}-{index}")
+    boards = spec.get("boards")
+    board = boards[index % len(boards)] if boards else generate_board()['board']
+    shots, ship_cells = play(spec["strategy"], board)
+    result = {"index": index, "shots": shots, "ship_cells": ship_cells}
+
+    opponent = spec.get("opponent")
+    if opponent:
+        # 雙方互不影響，各自的砲數即可決定勝負；同砲數時先手（偶數局為攻擊方）先打完
+        result["opponent_shots"], _ = play(opponent, generate_board()['board'])
+        if result["shots"] != result["opponent_shots"]:
+            result["win"] = result["shots"] < result["opponent_shots"]
+        else:
+            result["win"] = index % 2 == 0
+    return result
+
+
+def play_chunk(spec, indices):
+    return [play_game(spec, index) for index in indices]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def _shot_stats(values):
+    return {
+        "mean": round(sum(values) / len(values), 3) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "min": min(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+def summarize(spec, results, elapsed):
+    shots = [r["shots"] for r in results]
+    summary = {
+        "strategy": spec["strategy"],
+        "opponent": spec.get("opponent"),
+        "fixed_boards": len(spec["boards"]) if spec.get("boards") else 0,
+        "games": len(results),
+        "seed": spec["seed"],
+        "shots": _shot_stats(shots),
+        # 固定棋盤的船格數不一定是標準艦隊，以每局實際的船格數計算
+        "hit_rate": round(sum(r["ship_cells"] for r in results) / sum(shots), 4) if shots else None,
+        "elapsed_s": round(elapsed, 3),
+        "games_per_s": round(len(results) / elapsed, 2) if elapsed > 0 else None,
+    }
+    if spec.get("opponent"):
+        wins = sum(1 for r in results if r["win"])
+        summary["opponent_shots"] = _shot_stats([r["opponent_shots"] for r in results])
+        summary["wins"] = wins
+        summary["losses"] = len(results) - wins
+        summary["win_rate"] = round(wins / len(results), 4) if results else None
+    return summary
+
+
+def validate_boards(boards):
+    """固定棋盤須為 10x10、只含 0/1 且至少有一格船"""
+    if not isinstance(boards, list) or not boards:
+        raise ValueError("boards 必須是非空的棋盤陣列")
+    for board in boards:
+        if (not isinstance(board, list) or len(board) != BOARD_SIZE
+                or any(not isinstance(row, list) or len(row) != BOARD_SIZE for row in board)
+                or any(cell not in (0, 1) for row in board for cell in row)):
+            raise ValueError(f"每張棋盤必須是 {BOARD_SIZE}x{BOARD_SIZE} 的 0/1 陣列")
+        if not any(cell == 1 for row in board for cell in row):
+            raise ValueError("棋盤上至少要有一艘船")
+    return boards
+
+
+def make_spec(strategy, games, seed=0, opponent=None, boards=None):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy 必須是 {', '.join(STRATEGIES)} 其中之一")
+    if opponent is not None and opponent not in STRATEGIES:
+        raise ValueError(f"opponent 必須是 {', '.join(STRATEGIES)} 其中之一")
+    if opponent is not None and boards:
+        raise ValueError("opponent 與 boards 不能同時指定")
+    if not isinstance(games, int) or games <= 0:
+        raise ValueError("games 必須是正整數")
+    if "dqn" in (strategy, opponent):
+        from .evaluate_method import MODEL_PATH
+        if not os.path.exists(MODEL_PATH):
+            raise ValueError(f"找不到 DQN 模型：{MODEL_PATH}")
+    return {
+        "strategy": strategy,
+        "opponent": opponent,
+        "games": games,
+        "seed": int(seed),
+        "boards": validate_boards(boards) if boards is not None else None,
+    }
+
+
+def run(spec, workers=None, on_progress=None):
+    """以行程池跑完所有對局，回傳統計；on_progress(done, total) 在每批完成時呼叫"""
+    workers = max(1, min(workers or os.cpu_count() or 1, 64))
+    total = spec["games"]
+    chunks = [range(start, min(start + CHUNK_SIZE, total)) for start in range(0, total, CHUNK_SIZE)]
+    strategies = {spec["strategy"], spec.get("opponent")}
+    started = time.perf_counter()
+    results = []
+
+    if workers == 1:
+        _init_worker(strategies)
+        for chunk in chunks:
+            results.extend(play_chunk(spec, chunk))
+            if on_progress:
+                on_progress(len(results), total)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(strategies,)) as pool:
+            futures = [pool.submit(play_chunk, spec, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                results.extend(future.result())
+                if on_progress:
+                    on_progress(len(results), total)
+
+    results.sort(key=lambda r: r["index"])
+    summary = summarize(spec, results, time.perf_counter() - started)
+    summary["workers"] = workers
+    if _move_cache is not None:
+        summary["move_cache"] = _move_cache.stats()
+    return summary
+
+
+def _emit(record):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Naval chess bulk AI simulation")
+    parser.add_argument("--strategy", default="heuristic", choices=STRATEGIES)
+    parser.add_argument("--opponent", choices=STRATEGIES, help="AI 對 AI 時的對手策略")
+    parser.add_argument("--boards", help="固定棋盤 JSON 檔（棋盤陣列），- 代表從 stdin 讀")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--ndjson", action="store_true", help="逐行輸出進度與結果（JSON）")
+    args = parser.parse_args()
+
+    try:
+        boards = None
+        if args.boards == "-":
+            boards = json.load(sys.stdin)
+        elif args.boards:
+            with open(args.boards, encoding="utf-8") as f:
+                boards = json.load(f)
+        spec = make_spec(args.strategy, args.games, args.seed, args.opponent, boards)
+    except (OSError, ValueError) as e:
+        if args.ndjson:
+            _emit({"type": "error", "message": str(e)})
+        else:
+            print(f"錯誤：{e}", file=sys.stderr)
+        sys.exit(2)
+
+    if args.ndjson:
+        def on_progress(done, total):
+            _emit({"type": "progress", "done": done, "total": total})
+    else:
+        def on_progress(done, total):
+            print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    try:
+        summary = run(spec, args.workers, on_progress)
+    except Exception as e:
+        if args.ndjson:
+            _emit({"type": "error", "message": f"{type(e).__name__}: {e}"})
+            sys.exit(1)
+        raise
+
+    if args.ndjson:
+        _emit(dict(summary, type="result"))
+    else:
+        print(file=sys.stderr)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
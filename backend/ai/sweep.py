@@ -0,0 +1,244 @@
+"""DQN 超參數搜尋：依 grid / random 規格平行跑多個短訓練，再用同一組固定棋盤評估並排名。
+
+用法（在 backend/ 目錄下）：
+    uv run python -m ai.sweep sweep.json --out runs/sweep-1 --jobs 4
+
+規格檔（JSON）範例：
+    {
+      "search": "random",          # grid：列出所有組合；random：抽 trials 組
+      "trials": 16,
+      "seed": 0,
+      "variant": "classic",
+      "params": {
+        "episodes": 300,                               # 純量：固定值
+        "lr": {"low": 0.0001, "high": 0.003, "log": true},
+        "gamma": [0.9, 0.95, 0.99],                    # 陣列：從中挑選
+        "batch_size": [32, 64, 128]
+      }
+    }
+區間（low/high）只能用於 random 搜尋；未列出的超參數使用 DEFAULT_PARAMS。
+
+每個 trial 的模型存成 <out>/trial-XXX.pth，結果寫到 <out>/results.json 與依評估砲數排序的 results.md。
+評估有兩欄：shots 為伺服器實際的選步方式（Q 值 + 啟發式遮罩），greedy 只遮掉已攻擊的格子，
+較能看出網路本身學到多少。
+"""
+import os
+import json
+import math
+import time
+import random
+import itertools
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .battleship_board import generate_board
+from .dqn_battleship import DEFAULT_PARAMS, resolve_params
+from .simulate import _shot_stats
+from .utils import BOARD_SIZE, DEFAULT_VARIANT, get_variant
+
+INT_PARAMS = ("batch_size", "update_target_steps", "memory_size", "episodes")
+
+
+# ----------------------------
+# 規格展開
+# ----------------------------
+def _sample(rng, name, choice):
+    if isinstance(choice, list):
+        return rng.choice(choice)
+    if isinstance(choice, dict):
+        low, high = choice["low"], choice["high"]
+        if choice.get("log"):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        return round(value) if name in INT_PARAMS else value
+    return choice
+
+
+def expand_spec(spec):
+    """把規格展開成每個 trial 的超參數 dict（已驗證鍵名）"""
+    params = spec.get("params") or {}
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的超參數：{', '.join(sorted(unknown))}")
+    search = spec.get("search", "grid")
+
+    if search == "grid":
+        if any(isinstance(choice, dict) for choice in params.values()):
+            raise ValueError("grid 搜尋只接受固定值或陣列，區間請改用 random")
+        names = list(params)
+        axes = [choice if isinstance(choice, list) else [choice] for choice in params.values()]
+        trials = [dict(zip(names, combo)) for combo in itertools.product(*axes)]
+    elif search == "random":
+        rng = random.Random(spec.get("seed", 0))
+        trials = [{name: _sample(rng, name, choice) for name, choice in params.items()}
+                  for _ in range(int(spec.get("trials", 10)))]
+    else:
+        raise ValueError(f"未知的搜尋方式：{search}")
+
+    if not trials:
+        raise ValueError("規格沒有產生任何 trial")
+    return [resolve_params(trial) for trial in trials]
+
+
+def eval_boards(variant, count, seed):
+    """固定種子的評估棋盤，所有 trial 用同一組"""
+    size, ship_sizes = get_variant(variant)
+    state = random.getstate()
+    random.seed(f"sweep-eval-{seed}")
+    boards = [generate_board(size, ship_sizes)['board'] for _ in range(count)]
+    random.setstate(state)
+    return boards
+
+
+# ----------------------------
+# 子行程：訓練 + 評估
+# ----------------------------
+def _init_worker(torch_threads):
+    """限制每個 trial 的 torch 執行緒數，多個 trial 同時跑才不會互搶 CPU"""
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _play(model, board, ship_sizes, greedy):
+    import torch
+    from .env import BattleshipEnv
+    from .evaluate_method import choose_action
+    env = BattleshipEnv(board, ship_sizes=ship_sizes, reuse_obs=True)
+    state_feature = env.reset()
+    shots = 0
+    done = False
+    while not done and shots < env.size * env.size:
+        if greedy:
+            with torch.no_grad():
+                q_values = model(torch.from_numpy(state_feature).unsqueeze(0)).squeeze()
+            q_values[torch.tensor(env.state).flatten() != 0] = -1e9
+            action = torch.argmax(q_values).item()
+        else:
+            action = choose_action(model, env, state_feature)
+        state_feature, _, done = env.step(action)
+        shots += 1
+    return shots
+
+
+def run_trial(index, params, variant, boards, seed, out_dir):
+    import torch
+    from .dqn_battleship import train
+    size, ship_sizes = get_variant(variant)
+    trial_seed = seed * 100_003 + index
+    random.seed(trial_seed)
+    torch.manual_seed(trial_seed)
+    model_path = os.path.join(out_dir, f"trial-{index:03d}.pth")
+
+    started = time.perf_counter()
+    model, history = train(size, ship_sizes, conv=size != BOARD_SIZE, model_path=model_path,
+                           params=params, verbose=False, plot=False)
+    train_s = time.perf_counter() - started
+
+    model.eval()
+    shots = [_play(model, board, ship_sizes, greedy=False) for board in boards]
+    greedy = [_play(model, board, ship_sizes, greedy=True) for board in boards]
+    rewards = history["rewards"]
+    tail = rewards[-max(1, len(rewards) // 10):]
+    return {
+        "trial": index,
+        "params": params,
+        "model": model_path,
+        "train_s": round(train_s, 2),
+        "episodes_per_s": round(len(rewards) / train_s, 2) if train_s > 0 else None,
+        "steps_per_s": round(history["steps"] / train_s, 1) if train_s > 0 else None,
+        "final_reward": round(sum(tail) / len(tail), 3) if tail else None,
+        "shots": _shot_stats(shots),
+        "greedy_shots": _shot_stats(greedy),
+    }
+
+
+# ----------------------------
+# 排程與輸出
+# ----------------------------
+def run(spec, out_dir, jobs=None, torch_threads=None, eval_games=50, on_result=None):
+    trials = expand_spec(spec)
+    variant = spec.get("variant", DEFAULT_VARIANT)
+    seed = int(spec.get("seed", 0))
+    boards = eval_boards(variant, eval_games, seed)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(trials)))
+    # 預設讓 jobs × 每個 trial 的執行緒數不超過核心數
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // jobs)
+    os.makedirs(out_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(torch_threads,)) as pool:
+        futures = [pool.submit(run_trial, i, params, variant, boards, seed, out_dir)
+                   for i, params in enumerate(trials)]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if on_result:
+                on_result(results[-1], len(results), len(trials))
+
+    # 評估砲數越少越好；同分時看 greedy
+    results.sort(key=lambda r: (r["shots"]["mean"], r["greedy_shots"]["mean"]))
+    report = {
+        "spec": spec,
+        "variant": variant,
+        "eval_games": eval_games,
+        "jobs": jobs,
+        "torch_threads": torch_threads,
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "results": results,
+    }
+    with open(os.path.join(out_dir, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(out_dir, "results.md"), "w", encoding="utf-8") as f:
+        f.write(format_table(results))
+    return report
+
+
+def format_table(results):
+    names = [name for name in DEFAULT_PARAMS if len({str(r["params"][name]) for r in results}) > 1]
+    header = ["rank", "trial", *names, "shots mean", "shots p90", "greedy mean",
+              "final reward", "episodes/s", "steps/s", "train s"]
+    lines = ["| " + " | ".join(header) + " |", "| " + " | ".join("---" for _ in header) + " |"]
+    for rank, r in enumerate(results, 1):
+        values = [f"{r['params'][name]:.4g}" if isinstance(r["params"][name], float) else str(r["params"][name])
+                  for name in names]
+        cells = [rank, r["trial"], *values, r["shots"]["mean"], r["shots"]["p90"], r["greedy_shots"]["mean"],
+                 r["final_reward"], r["episodes_per_s"], r["steps_per_s"], r["train_s"]]
+        lines.append("| " + " | ".join(str(cell) for cell in cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel DQN hyperparameter sweep")
+    parser.add_argument("spec", help="規格 JSON 檔")
+    parser.add_argument("--out", required=True, help="輸出目錄（模型與結果表）")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="同時訓練的 trial 數")
+    parser.add_argument("--torch-threads", type=int, help="每個 trial 的 torch 執行緒數（預設 核心數 / jobs）")
+    parser.add_argument("--eval-games", type=int, default=50, help="評估用的固定棋盤數")
+    args = parser.parse_args()
+
+    with open(args.spec, encoding="utf-8") as f:
+        spec = json.load(f)
+    try:
+        expand_spec(spec)
+        get_variant(spec.get("variant", DEFAULT_VARIANT))
+    except (ValueError, KeyError) as e:
+        parser.error(f"規格錯誤：{e}")
+    if args.eval_games <= 0:
+        parser.error("eval-games 必須是正整數")
+
+    def progress(result, done, total):
+        print(f"[{done}/{total}] trial {result['trial']}: shots {result['shots']['mean']}, "
+              f"greedy {result['greedy_shots']['mean']}, {result['episodes_per_s']} episodes/s")
+
+    report = run(spec, args.out, args.jobs, args.torch_threads, args.eval_games, on_result=progress)
+    print()
+    print(format_table(report["results"]), end="")
+    print(f"\n共 {len(report['results'])} 個 trial，{report['jobs']} 個並行 × {report['torch_threads']} 條 torch 執行緒，"
+          f"耗時 {report['elapsed_s']}s；結果已寫入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
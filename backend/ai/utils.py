@@ -1,8 +1,25 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 BOARD_SIZE = 10
 SHIP_SIZES = [2, 3, 3, 4, 5]
 
+# 每局可選的棋盤大小與艦隊；classic 即原本的 10x10
+VARIANTS = {
+    "classic": (BOARD_SIZE, SHIP_SIZES),
+    "large": (20, [2, 2, 3, 3, 3, 4, 4, 5, 5, 6]),
+    "huge": (30, [2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 6, 6, 7, 7]),
+}
+DEFAULT_VARIANT = "classic"
+
+
+def get_variant(name):
+    """回傳 (棋盤邊長, 船隻長度)；未知的名稱丟 ValueError"""
+    if name not in VARIANTS:
+        raise ValueError(f"variant 必須是 {', '.join(VARIANTS)} 其中之一")
+    size, ship_sizes = VARIANTS[name]
+    return size, list(ship_sizes)
+
 
 def check_sunken_ships(board_data):
     board = board_data["board"]
@@ -23,39 +40,42 @@ def check_sunken_ships(board_data):
 
 
 def get_between_actions(env):
+    n = env.size
     between_moves = []
-    for i in range(BOARD_SIZE):
-        for j in range(BOARD_SIZE):
+    for i in range(n):
+        for j in range(n):
             if env.state[i][j] == 0:
-                if j - 1 >= 0 and j + 1 < BOARD_SIZE:
+                if j - 1 >= 0 and j + 1 < n:
                     if env.state[i][j-1] == 2 and env.state[i][j+1] == 2:
-                        between_moves.append(i * BOARD_SIZE + j)
+                        between_moves.append(i * n + j)
                         continue
-                if i - 1 >= 0 and i + 1 < BOARD_SIZE:
+                if i - 1 >= 0 and i + 1 < n:
                     if env.state[i-1][j] == 2 and env.state[i+1][j] == 2:
-                        between_moves.append(i * BOARD_SIZE + j)
+                        between_moves.append(i * n + j)
     return list(set(between_moves))
 
 
 def get_all_adjacent_actions(env):
+    n = env.size
     moves = set()
-    for i in range(BOARD_SIZE):
-        for j in range(BOARD_SIZE):
+    for i in range(n):
+        for j in range(n):
             if env.state[i][j] == 2:
                 for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
                     ni, nj = i + dx, j + dy
-                    if 0 <= ni < BOARD_SIZE and 0 <= nj < BOARD_SIZE:
+                    if 0 <= ni < n and 0 <= nj < n:
                         if env.state[ni][nj] == 0:
-                            moves.add(ni * BOARD_SIZE + nj)
+                            moves.add(ni * n + nj)
     return list(moves)
 
 
 def is_near_missed_cluster(env, action):
-    row, col = divmod(action, BOARD_SIZE)
+    n = env.size
+    row, col = divmod(action, n)
     count = 0
     for dx, dy in [(-1,0),(1,0),(0,-1),(0,1)]:
         nx, ny = row + dx, col + dy
-        if 0 <= nx < BOARD_SIZE and 0 <= ny < BOARD_SIZE:
+        if 0 <= nx < n and 0 <= ny < n:
             if env.state[nx][ny] == 1:
                 count += 1
     return count >= 2
@@ -67,7 +87,7 @@ def get_probability_actions(env):
     best = -1
     candidates = []
     for a in available:
-        i, j = divmod(a, BOARD_SIZE)
+        i, j = divmod(a, env.size)
         if density[i, j] > best:
             best = density[i, j]
             candidates = [a]
@@ -79,7 +99,7 @@ def get_probability_actions(env):
 def get_diagonal_actions(env):
     candidates = []
     for a in env.available_actions():
-        row, col = divmod(a, BOARD_SIZE)
+        row, col = divmod(a, env.size)
         if (row % 2 == 0 and col % 2 == 0) or (row % 2 == 1 and col % 2 == 1):
             candidates.append(a)
     if not candidates:
@@ -103,3 +123,106 @@ def get_allowed_actions(env):
                 candidates = get_diagonal_actions(env)
     filtered = [a for a in candidates if not is_near_missed_cluster(env, a)]
     return filtered if filtered else candidates
+
+
+# ----------------------------
+# 批次版本：一次處理 (N, n, n) 的盤面堆疊，結果為 (N, n, n) 的 bool 遮罩，
+# 與上面逐格走訪的版本結果相同（測試見 test/test_batched_heuristics.py）
+# ----------------------------
+_OFFBOARD = -1
+
+
+def _neighbors(states):
+    """上下左右四個方向平移後的盤面，棋盤外以 _OFFBOARD 填補"""
+    padded = np.pad(states, ((0, 0), (1, 1), (1, 1)), constant_values=_OFFBOARD)
+    return (padded[:, :-2, 1:-1], padded[:, 2:, 1:-1],   # 上、下
+            padded[:, 1:-1, :-2], padded[:, 1:-1, 2:])   # 左、右
+
+
+def between_mask(states):
+    up, down, left, right = _neighbors(states)
+    return (states == 0) & (((left == 2) & (right == 2)) | ((up == 2) & (down == 2)))
+
+
+def adjacent_mask(states):
+    up, down, left, right = _neighbors(states)
+    return (states == 0) & ((up == 2) | (down == 2) | (left == 2) | (right == 2))
+
+
+def near_missed_cluster_mask(states):
+    """上下左右至少兩格是未中（1）的格子"""
+    return sum((side == 1).astype(np.int8) for side in _neighbors(states)) >= 2
+
+
+def parity_mask(states):
+    """對角線（棋盤格）上的未攻擊格；某局一格都沒有時改為該局所有未攻擊格"""
+    n = states.shape[-1]
+    rows, cols = np.indices((n, n))
+    available = states == 0
+    mask = available & ((rows + cols) % 2 == 0)
+    empty = ~mask.any(axis=(1, 2))
+    mask[empty] = available[empty]
+    return mask
+
+
+def ship_counts(remaining_ships_list, max_len):
+    """每局剩餘船隻轉成 (N, max_len + 1) 的各長度數量"""
+    counts = np.zeros((len(remaining_ships_list), max_len + 1), dtype=np.float32)
+    for k, ships in enumerate(remaining_ships_list):
+        for ship_len in ships:
+            if ship_len <= max_len:
+                counts[k, ship_len] += 1
+    return counts
+
+
+def probability_density_batch(states, remaining_ships_list):
+    """與 BattleshipEnv.compute_probability_density 相同的擺法數，同長度的船只算一次再乘上數量"""
+    n = states.shape[-1]
+    available = states == 0
+    counts = ship_counts(remaining_ships_list, n)
+    density = np.zeros(states.shape, dtype=np.float32)
+    for ship_len in np.flatnonzero(counts.any(axis=0)):
+        span = n - ship_len + 1
+        fits_row = sliding_window_view(available, ship_len, axis=2).all(axis=3)
+        fits_col = sliding_window_view(available, ship_len, axis=1).all(axis=3)
+        coverage = np.zeros(states.shape, dtype=np.float32)
+        for k in range(ship_len):
+            coverage[:, :, k:k + span] += fits_row
+            coverage[:, k:k + span, :] += fits_col
+        density += counts[:, ship_len, None, None] * coverage
+    return density
+
+
+def probability_mask(states, remaining_ships_list):
+    """未攻擊格中機率密度最高的格子"""
+    available = states == 0
+    density = np.where(available, probability_density_batch(states, remaining_ships_list), -1)
+    best = density.max(axis=(1, 2), keepdims=True)
+    return available & (density == best)
+
+
+def allowed_actions_mask(states, remaining_ships_list):
+    """get_allowed_actions 的批次版本：夾擊 > 相鄰 > 機率密度 > 對角線，再排除未中群旁的格子；
+    states 為 (N, n, n) 的盤面（0 未打 / 1 未中 / 2 命中 / 3 擊沉），回傳 (N, n * n) 的 bool 遮罩"""
+    states = np.asarray(states)
+    n = states.shape[-1]
+
+    def pick(current, tier):
+        # 還沒有候選的局才改用下一層
+        empty = ~current.any(axis=(1, 2))
+        current[empty] = tier[empty]
+        return current
+
+    candidates = between_mask(states)
+    candidates = pick(candidates, adjacent_mask(states))
+    if not candidates.any(axis=(1, 2)).all():
+        candidates = pick(candidates, probability_mask(states, remaining_ships_list))
+        candidates = pick(candidates, parity_mask(states))
+    filtered = candidates & ~near_missed_cluster_mask(states)
+    candidates = pick(filtered, candidates)
+    return candidates.reshape(len(states), n * n)
+
+
+def stack_envs(envs):
+    """把多個同大小的 env 疊成 allowed_actions_mask 的輸入"""
+    return np.array([env.state for env in envs], dtype=np.int8), [env.remaining_ships for env in envs]
@@ -0,0 +1,120 @@
+"""把 CPU 密集的 AI 計算（DQN 推論 + ai/utils.py 的啟發式）移出 eventlet hub。
+
+- 工作交給原生執行緒池（eventlet.tpool），等待時只阻塞呼叫的 green thread；
+  torch 推論期間會釋放 GIL，其餘 socket 照常處理。
+- 排隊加執行中的工作數超過 AI_POOL_MAX_PENDING，或等待超過 AI_POOL_TIMEOUT 時，
+  直接改用呼叫端提供的備援（通常是便宜的啟發式）。
+- torch 的 intra-op 執行緒數固定為 AI_TORCH_THREADS，避免多個 worker × 多條池執行緒互搶 CPU。
+"""
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+
+try:
+    from eventlet import Timeout, patcher, tpool
+    _threading = patcher.original("threading")
+except ImportError:  # pragma: no cover - 非 eventlet 環境改用一般執行緒池
+    tpool = None
+    import threading as _threading
+
+    class Timeout(Exception):
+        pass
+
+WORKERS = int(os.environ.get("AI_POOL_WORKERS", "4"))
+MAX_PENDING = int(os.environ.get("AI_POOL_MAX_PENDING", "16"))
+TIMEOUT = float(os.environ.get("AI_POOL_TIMEOUT", "5"))
+TORCH_THREADS = int(os.environ.get("AI_TORCH_THREADS", "1"))
+
+if tpool is not None:
+    tpool.set_num_threads(WORKERS)  # 需在第一次 tpool.execute 之前設定
+
+_pending = 0
+_lock = _threading.Lock()  # 執行完成的遞減發生在原生執行緒
+_executor = None
+_torch_configured = False
+
+FALLBACKS = metrics.counter(
+    "naval_ai_pool_fallbacks_total", "AI 工作改用備援的次數", ("call", "reason"))
+metrics.gauge("naval_ai_pool_pending", "排隊中與執行中的 AI 工作數", collect=lambda: {(): _pending})
+
+
+def configure_torch():
+    global _torch_configured
+    if not _torch_configured:
+        import torch
+        torch.set_num_threads(TORCH_THREADS)
+        _torch_configured = True
+
+
+def _submit(job, timeout):
+    global _executor
+    if tpool is not None:
+        with Timeout(timeout):
+            return tpool.execute(job)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(WORKERS, thread_name_prefix="ai-pool")
+    return _executor.submit(job).result(timeout=timeout)
+
+
+def run(call, fn, *args, fallback, timeout=None, **kwargs):
+    """在池中執行 fn(*args, **kwargs)；滿載、逾時或失敗時回傳 fallback()"""
+    global _pending
+    with _lock:
+        saturated = _pending >= MAX_PENDING
+        if not saturated:
+            _pending += 1
+    if saturated:
+        FALLBACKS.inc(call, "saturated")
+        return fallback()
+
+    def job():
+        global _pending
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # 逾時後工作仍會跑完，直到這裡才釋放名額，排隊上限才是真的上限
+            with _lock:
+                _pending -= 1
+
+    try:
+        return _submit(job, TIMEOUT if timeout is None else timeout)
+    except (Timeout, FutureTimeout):
+        FALLBACKS.inc(call, "timeout")
+    except Exception:
+        traceback.print_exc()
+        FALLBACKS.inc(call, "error")
+    return fallback()
+
+
+def pending():
+    return _pending
+
+
+# ----------------------------
+# 伺服器使用的 AI 工作
+# ----------------------------
+def _evaluate(board, ship_sizes):
+    configure_torch()
+    from ai.evaluate_method import evaluate
+    return evaluate(board=board, ship_sizes=ship_sizes)
+
+
+def evaluate(board, ship_sizes=None):
+    """整局 DQN 出招序列；池滿載、逾時或該棋盤大小沒有模型時回傳 []，由 process_ai_move 逐步用啟發式出招"""
+    from ai.evaluate_method import model_path_for
+    if not os.path.exists(model_path_for(len(board))):
+        FALLBACKS.inc("evaluate", "no_model")
+        return []
+    return run("evaluate", _evaluate, board, ship_sizes, fallback=list)
+
+
+def warm_up():
+    """背景預先載入 torch 與模型，第一場 PvE 不必等"""
+    def load():
+        configure_torch()
+        from ai.evaluate_method import MODEL_PATH, get_model
+        if os.path.exists(MODEL_PATH):
+            get_model()
+    run("warm_up", load, fallback=lambda: None, timeout=120)
@@ -1,20 +1,36 @@
 import os
+import sys
+import hmac
 import uuid
 import json
 import time
 import sqlite3
-from contextlib import closing
+from contextlib import closing, contextmanager
+from functools import wraps
 from datetime import datetime
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, join_room
-from ai.utils import check_sunken_ships
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+from ai.utils import DEFAULT_VARIANT, check_sunken_ships, get_variant
+from ai import move_cache
+import reaper
+import restore
+import stats
+import cluster
+import metrics
+import profiling
+import board_sync
+import codec
+import ai_pool
+import admission
+import traffic
+import storage as storage_backend
+from board_sync import delta_cache
 
 app = Flask(__name__)
 CORS(app)
 app.config['SECRET_KEY'] = 'naval-chess'
-socketio = SocketIO(app, cors_allowed_origins="*")
 
 # ----------------------------
 # 路徑與資料庫初始化
@@ -25,81 +41,264 @@ DB_PATH = os.path.join(DB_DIR, "naval_chess.db")
 def ensure_instance_dir():
     os.makedirs(DB_DIR, exist_ok=True)
 
+def ensure_column(cur, table, column, ddl):
+    """舊資料庫缺欄位時補上（CREATE TABLE IF NOT EXISTS 不會改既有表）"""
+    columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        try:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        except sqlite3.OperationalError as e:
+            # 多個 worker 同時啟動時可能已被別人補上
+            if "duplicate column" not in str(e):
+                raise
+
+def init_room_tables(cur):
+    """房間相關的表（分 shard 時每個 shard 各一份）"""
+    # 啟用 WAL 改善讀寫並發
+    cur.execute("PRAGMA journal_mode=WAL;")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS game (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id VARCHAR(50) NOT NULL UNIQUE,
+        player1_id VARCHAR(50),
+        player2_id VARCHAR(50),
+        player1_board TEXT,
+        player2_board TEXT,
+        ai_field BOOLEAN DEFAULT 0,
+        ai_turn_array TEXT,
+        current_turn VARCHAR(50),
+        status VARCHAR(20) DEFAULT 'waiting',
+        winner_id VARCHAR(50),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_activity DATETIME
+    );
+    """)
+
+    # 多 worker 模式下房間歸屬的 worker
+    ensure_column(cur, "game", "owner_worker", "INTEGER")
+    # 每下一步 +1，客戶端用來要求增量同步
+    ensure_column(cur, "game", "move_seq", "INTEGER DEFAULT 0")
+    # 棋盤大小與艦隊（ai.utils.VARIANTS 的名稱）
+    ensure_column(cur, "game", "variant", "VARCHAR(20) DEFAULT 'classic'")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS move_log (
+        room_id VARCHAR(50) NOT NULL,
+        seq INTEGER NOT NULL,
+        board VARCHAR(10) NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (room_id, seq)
+    ) WITHOUT ROWID;
+    """)
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_game_status ON game(status);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_game_current_turn ON game(current_turn);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_game_last_activity ON game(last_activity);")
+    # 回收器依狀態 + 閒置時間掃描
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_game_status_last_activity ON game(status, last_activity);")
+
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_game_touch_last_activity
+    AFTER UPDATE ON game
+    BEGIN
+        UPDATE game
+        SET last_activity = CURRENT_TIMESTAMP
+        WHERE id = NEW.id;
+    END;
+    """)
+
+    reaper.init_archive(cur)
+
+def init_global_tables(cur):
+    """全域的表（只在主檔）"""
+    cur.execute("PRAGMA journal_mode=WAL;")
+    stats.init_stats(cur)
+
 def init_db():
     """確保資料庫與資料表存在；沒有就建"""
     ensure_instance_dir()
-    with closing(sqlite3.connect(DB_PATH, check_same_thread=False)) as conn:
-        with closing(conn.cursor()) as cur:
-            # 啟用 WAL 改善讀寫並發
-            cur.execute("PRAGMA journal_mode=WAL;")
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS game (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                room_id VARCHAR(50) NOT NULL UNIQUE,
-                player1_id VARCHAR(50),
-                player2_id VARCHAR(50),
-                player1_board TEXT,
-                player2_board TEXT,
-                ai_field BOOLEAN DEFAULT 0,
-                ai_turn_array TEXT,
-                current_turn VARCHAR(50),
-                status VARCHAR(20) DEFAULT 'waiting',
-                winner_id VARCHAR(50),
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_activity DATETIME
-            );
-            """)
-
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_game_status ON game(status);")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_game_current_turn ON game(current_turn);")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_game_last_activity ON game(last_activity);")
-
-            cur.execute("""
-            CREATE TRIGGER IF NOT EXISTS trg_game_touch_last_activity
-            AFTER UPDATE ON game
-            BEGIN
-                UPDATE game
-                SET last_activity = CURRENT_TIMESTAMP
-                WHERE id = NEW.id;
-            END;
-            """)
-
-            conn.commit()
+    storage.init(init_global_tables, init_room_tables)
 
+# STORAGE_BACKEND / STORAGE_SHARDS 決定房間放在單一檔案、多個 shard 或記憶體
+storage = storage_backend.from_env(DB_PATH)
+if storage.backend == "memory" and cluster.is_clustered():
+    raise RuntimeError("STORAGE_BACKEND=memory 只能在單 worker 模式使用")
 init_db()
 
 # ----------------------------
 # 連線/查詢工具（關鍵：不共用全域 cursor/connection）
 # ----------------------------
 def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
-    conn.row_factory = sqlite3.Row
-    # 再次確保 WAL（若已是 WAL，重設無妨）
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
-
-def fetchone(sql, params=()):
-    with closing(get_conn()) as conn, closing(conn.cursor()) as cur:
+    """主檔的新連線（訊息佇列等全域資料用，呼叫端負責關閉）"""
+    return storage.main.connect()
+
+@metrics.timed(metrics.DB_LATENCY, "fetchone")
+@profiling.traced("db")
+def fetchone(sql, params=(), room_id=None):
+    """room_id 指定時查該房間所屬的 shard，否則查主檔"""
+    with storage.connection(room_id) as conn, closing(conn.cursor()) as cur:
         cur.execute(sql, params)
         return cur.fetchone()
 
-def fetchall(sql, params=()):
-    with closing(get_conn()) as conn, closing(conn.cursor()) as cur:
+@metrics.timed(metrics.DB_LATENCY, "fetchall")
+@profiling.traced("db")
+def fetchall(sql, params=(), room_id=None):
+    with storage.connection(room_id) as conn, closing(conn.cursor()) as cur:
         cur.execute(sql, params)
         return cur.fetchall()
 
-def execute(sql, params=()):
-    with closing(get_conn()) as conn, closing(conn.cursor()) as cur:
+@metrics.timed(metrics.DB_LATENCY, "execute")
+@profiling.traced("db")
+def execute(sql, params=(), room_id=None):
+    shard = storage.main if room_id is None else storage.shard_for(room_id)
+    with shard.connection() as conn, closing(conn.cursor()) as cur, shard.timed_write():
         cur.execute(sql, params)
         conn.commit()
         return cur.lastrowid
 
-def executemany(sql, seq_of_params):
-    with closing(get_conn()) as conn, closing(conn.cursor()) as cur:
+@metrics.timed(metrics.DB_LATENCY, "executemany")
+@profiling.traced("db")
+def executemany(sql, seq_of_params, room_id=None):
+    shard = storage.main if room_id is None else storage.shard_for(room_id)
+    with shard.connection() as conn, closing(conn.cursor()) as cur, shard.timed_write():
         cur.executemany(sql, seq_of_params)
         conn.commit()
 
+@contextmanager
+def transaction(room_id=None):
+    """多個語句一起提交；例外時 rollback"""
+    shard = storage.main if room_id is None else storage.shard_for(room_id)
+    with shard.connection() as conn, metrics.DB_LATENCY.time("transaction"), profiling.span("db"), \
+            shard.timed_write():
+        with conn:
+            yield conn
+
+# ----------------------------
+# 跨房間查詢：分 shard 時依序查每個 shard
+# ----------------------------
+@metrics.timed(metrics.DB_LATENCY, "fetchone_any")
+@profiling.traced("db")
+def fetchone_any(sql, params=()):
+    """回傳第一個有結果的 shard 的那一列（例如找一個等待中的房間）"""
+    return storage.fetchone_any(sql, params)
+
+@metrics.timed(metrics.DB_LATENCY, "fetchall_shards")
+@profiling.traced("db")
+def fetchall_shards(sql, params=()):
+    """合併所有 shard 的結果（不保證順序）"""
+    return storage.fetchall_shards(sql, params)
+
+@profiling.traced("json")
+def json_dumps(obj):
+    return json.dumps(obj)
+
+@profiling.traced("json")
+def json_loads(text):
+    return json.loads(text)
+
+# 有設定 SOCKETIO_MESSAGE_QUEUE 時，emit 會經由佇列轉發到其他 worker
+socketio = SocketIO(app, cors_allowed_origins="*", **cluster.client_manager_options(get_conn))
+
+def enter_room(room):
+    """加入 room；二進位編碼的連線改加入對應的 <room>:mp"""
+    join_room(codec.room_for(request.sid, room))
+
+def reply(event, payload):
+    """回覆目前的連線，依協商的編碼序列化"""
+    if codec.client_codec(request.sid) == codec.MSGPACK:
+        emit(event, codec.encode_msgpack(event, payload))
+    else:
+        codec.sample_json(event, payload)
+        emit(event, payload)
+
+def broadcast(event, payload, room):
+    """廣播到房間；JSON 與二進位客戶端各只序列化一次"""
+    codec.sample_json(event, payload)
+    socketio.emit(event, payload, to=room)
+    if codec.has_binary_clients(cluster.is_clustered()):
+        socketio.emit(event, codec.encode_msgpack(event, payload), to=codec.binary_room(room))
+
+def socket_event(name, admit=False):
+    """註冊 Socket.IO 事件，並記錄處理時間與例外次數；admit=True 時先經過准入控制（限流、全域上限）"""
+    def decorator(fn):
+        latency = metrics.SOCKET_EVENT_LATENCY.labels(name)
+        errors = metrics.SOCKET_EVENT_ERRORS.labels(name)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            trace_token = profiling.begin()
+            if args:
+                args = (codec.decode_incoming(args[0]),) + args[1:]
+            traffic.on_event(request.sid, name, args[0] if args else None)
+            try:
+                if admit:
+                    data = args[0] if args and isinstance(args[0], dict) else {}
+                    rejected = admission.check(name, request.sid, data.get('player') or data.get('player_id'))
+                    if rejected:
+                        reason, retry_after = rejected
+                        reply('error', {'message': '請求過於頻繁，請稍後再試' if reason != 'overloaded'
+                                        else '伺服器忙碌中，請稍後再試',
+                                        'event': name, 'reason': reason, 'retry_after': retry_after})
+                        return
+                    with admission.inflight():
+                        return fn(*args, **kwargs)
+                return fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+                profiling.end(name, trace_token)
+        return socketio.on(name)(wrapper)
+    return decorator
+
+# ----------------------------
+# 指標
+# ----------------------------
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace_token = profiling.begin()
+    if traffic.recorder is not None and request.path.startswith('/api/'):
+        traffic.on_request(request.method, request.url_rule.rule if request.url_rule else request.path,
+                           request.view_args, request.args.to_dict(),
+                           request.get_json(silent=True) if request.is_json else None)
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        metrics.HTTP_REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint, request.method)
+        metrics.HTTP_REQUESTS.inc(endpoint, request.method, response.status_code)
+        profiling.end(f"{request.method} {endpoint}", g.pop('trace_token', None))
+    return response
+
+def collect_room_counts():
+    counts = {}
+    for row in fetchall_shards("SELECT status, COUNT(*) AS n FROM game GROUP BY status"):
+        counts[(row['status'],)] = counts.get((row['status'],), 0) + row['n']
+    return counts
+
+metrics.gauge("naval_rooms", "各狀態的房間數", ("status",), collect=collect_room_counts)
+
+def collect_move_cache_lookups():
+    stats = move_cache.stats()
+    return {(result,): stats[result] for result in ("book_hits", "hits", "misses")}
+
+metrics.gauge("naval_ai_move_cache_lookups", "AI 出招快取累計查詢次數", ("result",),
+              collect=collect_move_cache_lookups)
+metrics.gauge("naval_ai_move_cache_entries", "AI 出招快取目前條目數（不含開局庫）",
+              collect=lambda: {(): move_cache.stats()["entries"]})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.expose(), content_type=metrics.CONTENT_TYPE)
+
 # ----------------------------
 # 基本路由
 # ----------------------------
@@ -112,20 +311,72 @@ def index():
 # ----------------------------
 @socketio.on('connect')
 def handle_connect():
+    metrics.CONNECTS.inc()
+    metrics.CONNECTIONS.inc()
+    if request.args.get('codec'):
+        codec.set_client_codec(request.sid, request.args['codec'])
+    traffic.on_connect(request.sid, request.args.get('codec'))
     print('Client connected')
 
-@socketio.on('join_game')
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    metrics.CONNECTIONS.dec()
+    codec.forget(request.sid)
+    admission.forget(request.sid)
+    traffic.on_disconnect(request.sid)
+
+@socket_event('set_codec')
+def handle_set_codec(data):
+    previous = codec.client_codec(request.sid)
+    chosen = codec.set_client_codec(request.sid, (data or {}).get('codec', codec.JSON))
+    if chosen != previous:
+        # 已加入的房間換到對應編碼的 room
+        for room in rooms():
+            if room != request.sid:
+                leave_room(room)
+                enter_room(codec.base_room(room))
+    reply('codec_set', {'codec': chosen, 'available': codec.available_codecs()})
+
+@socket_event('join_game', admit=True)
 def handle_join_game(data):
     player_id = data['player_id']
 
+    variant = data.get('variant', DEFAULT_VARIANT)
+    try:
+        board_size, ship_sizes = get_variant(variant)
+    except ValueError as e:
+        reply('error', {'message': str(e)})
+        return
+    if len(data['board']) != board_size or any(len(row) != board_size for row in data['board']):
+        reply('error', {'message': f'{variant} 的棋盤必須是 {board_size}x{board_size}'})
+        return
+
     full_board_info = {
         "board": data["board"],
         "ships": data.get("ships", [])
     }
-    board_json = json.dumps(full_board_info)
+    board_json = json_dumps(full_board_info)
     is_ai_game = data.get('is_ai_game', False)
 
-    room = fetchone("SELECT * FROM game WHERE status = 'waiting' AND ai_field = 0 LIMIT 1")
+    # 每個 socket 加入以 player_id 命名的 room，emit(to=player_id) 才能跨 worker 送達
+    enter_room(player_id)
+
+    room = None
+    if not is_ai_game:
+        room = fetchone_any(
+            "SELECT * FROM game WHERE status = 'waiting' AND ai_field = 0 AND variant = ? AND "
+            "(owner_worker = ? OR owner_worker IS NULL) LIMIT 1",
+            (variant, cluster.WORKER_ID)
+        )
+        if not room and cluster.is_clustered():
+            remote = fetchone_any(
+                "SELECT owner_worker FROM game WHERE status = 'waiting' AND ai_field = 0 AND variant = ? LIMIT 1",
+                (variant,)
+            )
+            if remote:
+                # 等待中的房間在別的 worker，請客戶端改連到該 worker 再加入
+                reply('redirect', {'url': cluster.worker_url(remote['owner_worker']), 'reason': 'room_affinity'})
+                return
 
     if room and not is_ai_game:
         room_id = room['room_id']
@@ -133,17 +384,19 @@ def handle_join_game(data):
             UPDATE game 
             SET player2_id = ?, player2_board = ?, status = 'playing', last_activity = ?
             WHERE room_id = ?
-        """, (player_id, board_json, datetime.now(), room_id))
+        """, (player_id, board_json, datetime.now(), room_id), room_id=room_id)
+        admission.board_updates.invalidate(room_id)
 
-        join_room(room_id)
-        # 注意：to=room['player1_id'] 需要對方的 Socket sid；此處沿用原邏輯
-        emit('match_success', {'room_id': room_id, 'player': 'player2'}, to=room['player1_id'])
-        emit('match_success', {'room_id': room_id, 'player': 'player2'})
+        enter_room(room_id)
+        traffic.on_room(request.sid, room_id)
+        # player1 的 socket 已加入以其 player_id 命名的 room
+        broadcast('match_success', {'room_id': room_id, 'player': 'player2'}, room['player1_id'])
+        reply('match_success', {'room_id': room_id, 'player': 'player2'})
 
         import random
         first_turn = random.choice([room['player1_id'], player_id])
-        execute("UPDATE game SET current_turn = ? WHERE room_id = ?", (first_turn, room_id))
-        socketio.emit('game_started', {'first_turn': first_turn}, room=room_id)
+        execute("UPDATE game SET current_turn = ? WHERE room_id = ?", (first_turn, room_id), room_id=room_id)
+        broadcast('game_started', {'first_turn': first_turn}, room_id)
 
     else:
         room_id = str(uuid.uuid4())
@@ -152,77 +405,186 @@ def handle_join_game(data):
         ai_turn_array = None
 
         if is_ai_game:
-            from ai.evaluate_method import evaluate
             from ai.battleship_board import generate_board
-            ai_setup = generate_board()
-            player2_board_json = json.dumps(ai_setup)
-            ai_moves = evaluate(board=data['board'])
-            ai_turn_array = json.dumps(ai_moves)
-
+            with metrics.AI_LATENCY.time("generate_board"), profiling.span("ai"):
+                ai_setup = generate_board(board_size, ship_sizes)
+            player2_board_json = json_dumps(ai_setup)
+            # DQN 在原生執行緒池中計算，這裡只讓出 green thread 等待
+            with metrics.AI_LATENCY.time("evaluate"), profiling.span("ai"):
+                ai_moves = ai_pool.evaluate(data['board'], ship_sizes)
+            ai_turn_array = json_dumps(ai_moves)
+
+        # last_activity 與 trigger 一致使用 SQLite 的 UTC 時間，回收器才能正確比較
         execute("""
             INSERT INTO game (
                 room_id, player1_id, player2_id,
                 player1_board, player2_board,
-                status, ai_field, ai_turn_array,
+                status, ai_field, ai_turn_array, owner_worker, variant,
                 created_at, last_activity
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
         """, (
             room_id, player_id, player2_id,
             board_json, player2_board_json,
             'playing' if is_ai_game else 'waiting',
-            is_ai_game, ai_turn_array,
-            datetime.now(), datetime.now()
-        ))
+            is_ai_game, ai_turn_array, cluster.WORKER_ID, variant,
+            datetime.now()
+        ), room_id=room_id)
 
-        join_room(room_id)
-        emit('joined_game', {'room_id': room_id, 'status': 'playing' if is_ai_game else 'waiting'})
+        enter_room(room_id)
+        traffic.on_room(request.sid, room_id)
+        reply('joined_game', {'room_id': room_id, 'status': 'playing' if is_ai_game else 'waiting', 'variant': variant})
 
         import random
         first_turn = random.choice([player_id, 'ai']) if is_ai_game else None
         if first_turn:
-            execute("UPDATE game SET current_turn = ? WHERE room_id = ?", (first_turn, room_id))
-            socketio.emit('game_started', {'first_turn': first_turn}, room=room_id)
+            execute("UPDATE game SET current_turn = ? WHERE room_id = ?", (first_turn, room_id), room_id=room_id)
+            broadcast('game_started', {'first_turn': first_turn}, room_id)
             if first_turn == 'ai':
                 socketio.start_background_task(ai_auto_play, room_id)
         else:
-            emit('waiting_for_opponent', {'message': '等待對手加入...'}, room=room_id)
+            broadcast('waiting_for_opponent', {'message': '等待對手加入...'}, room_id)
 
-@socketio.on('update_board')
+@socket_event('update_board', admit=True)
 def handle_update_board(data):
     room_id = data['room_id']
-    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,))
+    since = data.get('since')
+    if not (isinstance(since, int) and since >= 0):
+        since = None
+    # 同一房間同時湧入的相同請求（例如重連風暴）只查一次資料庫
+    event, payload = admission.board_updates.run(room_id, since, lambda: board_state(room_id, since))
+    reply(event, payload)
+
+def board_state(room_id, since):
+    """回傳 update_board 要回覆的 (event, payload)"""
+    if since is not None:
+        row = fetchone("SELECT move_seq FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
+        if not row:
+            return 'error', {'message': '房間不存在'}
+        seq = row['move_seq'] or 0
+        if since <= seq:
+            return 'board_delta', {
+                'room_id': room_id,
+                'since': since,
+                'seq': seq,
+                'changes': changes_since(room_id, since, seq),
+            }
+
+    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
+    if not room:
+        return 'error', {'message': '房間不存在'}
+
+    return 'board_update', {
+        'player1': json_loads(room['player1_board']),
+        'player2': json_loads(room['player2_board']),
+        'is_ai_game': room['ai_field'],
+        'variant': room['variant'],
+        'seq': room['move_seq'] or 0
+    }
+
+@socket_event('spectate', admit=True)
+def handle_spectate(data):
+    room_id = data.get('room_id')
+    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,), room_id=room_id) if room_id else None
     if not room:
-        emit('error', {'message': '房間不存在'})
+        reply('error', {'message': '房間不存在'})
         return
 
-    emit('board_update', {
-        'player1': json.loads(room['player1_board']),
-        'player2': json.loads(room['player2_board']),
-        'is_ai_game': room['ai_field']
+    enter_room(board_sync.spectator_room(room_id))
+
+    # 斷線重連的觀戰者帶 since，快取內有就直接送缺少的變動
+    since = data.get('since')
+    seq = room['move_seq'] or 0
+    if isinstance(since, int) and 0 <= since <= seq:
+        changes = delta_cache.changes_since(room_id, since, seq)
+        if changes is not None:
+            reply('spectator_catchup', changes)
+            return
+
+    reply('spectator_snapshot', {
+        'room_id': room_id,
+        'player1': board_sync.mask_board(json_loads(room['player1_board'])['board']),
+        'player2': board_sync.mask_board(json_loads(room['player2_board'])['board']) if room['player2_board'] else None,
+        'status': room['status'],
+        'variant': room['variant'],
+        'seq': seq
     })
 
-@socketio.on('make_move')
+def changes_since(room_id, since, seq):
+    changes = delta_cache.changes_since(room_id, since, seq)
+    if changes is None:
+        rows = fetchall(
+            "SELECT seq, board, x, y, value FROM move_log WHERE room_id = ? AND seq > ? ORDER BY seq",
+            (room_id, since), room_id=room_id
+        )
+        changes = [board_sync.make_change(r['seq'], r['board'], r['x'], r['y'], r['value']) for r in rows]
+    return changes
+
+def save_move(room_id, set_clause, params, target, x, y, hit):
+    """在同一個 transaction 內更新房間、遞增 move_seq 並寫入 move_log，回傳新的 seq"""
+    value = 2 if hit else 3
+    with transaction(room_id) as conn:
+        conn.execute(
+            f"UPDATE game SET {set_clause}, move_seq = COALESCE(move_seq, 0) + 1 WHERE room_id = ?",
+            (*params, room_id)
+        )
+        seq = conn.execute("SELECT move_seq FROM game WHERE room_id = ?", (room_id,)).fetchone()[0]
+        conn.execute(
+            "INSERT INTO move_log (room_id, seq, board, x, y, value) VALUES (?, ?, ?, ?, ?, ?)",
+            (room_id, seq, target, x, y, value)
+        )
+    # 提交後才失效，期間算好的舊盤面不會被留在合併快取
+    admission.board_updates.invalidate(room_id)
+
+    # 同一份 change 同時進快取並廣播給所有觀戰者（Socket.IO 對整個 room 只編碼一次）
+    change = board_sync.make_change(seq, target, x, y, value)
+    delta_cache.append(room_id, change)
+    broadcast('spectator_delta', change, board_sync.spectator_room(room_id))
+    return seq
+
+@socket_event('make_move', admit=True)
 def handle_make_move(data):
     room_id = data.get('room_id')
     player = data.get('player')
     x, y = data.get('x'), data.get('y')
 
     if not all([room_id, player]) or x is None or y is None:
-        emit('error', {'message': '缺少參數'})
+        reply('error', {'message': '缺少參數'})
         return
 
     # 讀目前房間狀態
-    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,))
+    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
     if not room:
-        emit('error', {'message': '找不到房間'})
+        reply('error', {'message': '找不到房間'})
+        return
+
+    # 已結束或被回收器標為 expired 的房間在歸檔前仍留在 game 表，不能再接受出招
+    if room['status'] != 'playing':
+        reply('error', {'message': '對局已結束' if room['status'] == 'finished' else '房間已過期',
+                        'status': room['status']})
+        return
+
+    # 負數索引會從另一邊繞回去，超出邊界會在 handler 內丟 IndexError
+    board_size = get_variant(room['variant'] or DEFAULT_VARIANT)[0]
+    if not all(type(v) is int and 0 <= v < board_size for v in (x, y)):
+        reply('error', {'message': f'座標必須是 0 到 {board_size - 1} 的整數'})
+        return
+
+    if not cluster.owns(room['owner_worker']):
+        reply('redirect', {'url': cluster.worker_url(room['owner_worker']), 'room_id': room_id, 'reason': 'room_affinity'})
         return
 
     if room['current_turn'] != player:
-        emit('error', {'message': '還沒輪到你'})
+        reply('error', {'message': '還沒輪到你'})
         return
 
-    opponent_board_key = 'player2_board' if player == room['player1_id'] else 'player1_board'
-    opponent_data = json.loads(room[opponent_board_key])
+    if cluster.is_clustered() and codec.room_for(request.sid, room_id) not in rooms():
+        # 依 redirect 改連過來的連線還沒在本 worker 加入房間，補上才收得到之後的廣播
+        enter_room(room_id)
+        enter_room(player)
+
+    target = 'player2' if player == room['player1_id'] else 'player1'
+    opponent_board_key = f'{target}_board'
+    opponent_data = json_loads(room[opponent_board_key])
     board = opponent_data["board"]
 
     hit = (board[x][y] == 1)
@@ -231,22 +593,24 @@ def handle_make_move(data):
 
     next_turn = player if hit else (room['player1_id'] if player == room['player2_id'] else room['player2_id'])
 
-    execute(f"""
-        UPDATE game
-        SET {opponent_board_key} = ?, current_turn = ?
-        WHERE room_id = ?
-    """, (json.dumps(opponent_data), next_turn, room_id))
+    seq = save_move(room_id, f"{opponent_board_key} = ?, current_turn = ?",
+                    (json_dumps(opponent_data), next_turn), target, x, y, hit)
 
-    socketio.emit('move_made', {
+    broadcast('move_made', {
         'attacker': player,
         'x': x,
         'y': y,
-        'hit': hit
-    }, room=room_id)
+        'hit': hit,
+        'seq': seq
+    }, room_id)
 
     if all(cell != 1 for row in board for cell in row):
-        execute("UPDATE game SET status = 'finished', winner_id = ? WHERE room_id = ?", (player, room_id))
-        socketio.emit('game_over', {'winner': player}, room=room_id)
+        # 結束對局與更新戰績在同一個 transaction
+        with transaction(room_id) as conn:
+            stats.finish_game(conn, room, player, stats.shots_fired(board))
+        broadcast('game_over', {'winner': player}, room_id)
+        broadcast('game_over', {'winner': player}, board_sync.spectator_room(room_id))
+        delta_cache.discard(room_id)
         return
 
     # 若是 AI 對戰且輪到 AI，就啟動背景任務
@@ -256,18 +620,22 @@ def handle_make_move(data):
 # ----------------------------
 # AI 背景流程（每次操作自行開連線）
 # ----------------------------
+@metrics.timed(metrics.AI_LATENCY, "process_ai_move")
 def process_ai_move(room_id):
-    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,))
-    if not room or room['current_turn'] != 'ai':
+    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
+    if not room or room['status'] != 'playing' or room['current_turn'] != 'ai':
         return False
 
-    ai_turns = json.loads(room['ai_turn_array'] or '[]')
-    if not ai_turns:
-        return False
-
-    ai_x, ai_y = ai_turns.pop(0)
-    player_data = json.loads(room['player1_board'])
+    ai_turns = json_loads(room['ai_turn_array'] or '[]')
+    player_data = json_loads(room['player1_board'])
     board = player_data["board"]
+    if ai_turns:
+        ai_x, ai_y = ai_turns.pop(0)
+    else:
+        # AI 池滿載或逾時時沒有預先算好的序列，改為每回合用啟發式出招
+        from ai.fallback import heuristic_move
+        with metrics.AI_LATENCY.time("heuristic_move"), profiling.span("ai"):
+            ai_x, ai_y = heuristic_move(player_data, get_variant(room['variant'] or DEFAULT_VARIANT)[1])
 
     hit = (board[ai_x][ai_y] == 1)
     board[ai_x][ai_y] = 2 if hit else 3
@@ -275,37 +643,254 @@ def process_ai_move(room_id):
 
     next_turn = 'ai' if hit else room['player1_id']
 
-    execute("""
-        UPDATE game
-        SET player1_board = ?, ai_turn_array = ?, current_turn = ?
-        WHERE room_id = ?
-    """, (json.dumps(player_data), json.dumps(ai_turns), next_turn, room_id))
+    seq = save_move(room_id, "player1_board = ?, ai_turn_array = ?, current_turn = ?",
+                    (json_dumps(player_data), json_dumps(ai_turns), next_turn), 'player1', ai_x, ai_y, hit)
 
-    socketio.emit('move_made', {
+    broadcast('move_made', {
         'attacker': 'ai',
         'x': ai_x,
         'y': ai_y,
-        'hit': hit
-    }, room=room_id)
+        'hit': hit,
+        'seq': seq
+    }, room_id)
 
     if all(cell != 1 for row in board for cell in row):
-        execute("UPDATE game SET status = 'finished', winner_id = 'ai' WHERE room_id = ?", (room_id,))
-        socketio.emit('game_over', {'winner': 'ai'}, room=room_id)
+        with transaction(room_id) as conn:
+            stats.finish_game(conn, room, 'ai', stats.shots_fired(board))
+        broadcast('game_over', {'winner': 'ai'}, room_id)
+        broadcast('game_over', {'winner': 'ai'}, board_sync.spectator_room(room_id))
+        delta_cache.discard(room_id)
         return False
 
-    updated = fetchone("SELECT current_turn FROM game WHERE room_id = ?", (room_id,))
+    updated = fetchone("SELECT current_turn FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
     return (updated and updated['current_turn'] == 'ai')
 
-def ai_auto_play(room_id):
+# 正在替哪些房間出招；同一房間只能有一個 ai_auto_play（例如重啟還原與玩家出招同時排程）
+ai_rooms = set()
+
+def ai_auto_play(room_id, delay=1):
+    socketio.sleep(delay)
+    if room_id in ai_rooms:
+        return
+    ai_rooms.add(room_id)
+    try:
+        while True:
+            trace_token = profiling.begin()
+            try:
+                keep_shooting = process_ai_move(room_id)
+            finally:
+                profiling.end('process_ai_move', trace_token)
+            if not keep_shooting:
+                break
+            socketio.sleep(1)
+    finally:
+        ai_rooms.discard(room_id)
+
+# ----------------------------
+# 過期房間回收 / 冷儲存
+# ----------------------------
+def notify_room_expired(room_id):
+    broadcast('room_expired', {'room_id': room_id, 'reason': 'idle_timeout'}, room_id)
+
+def reaper_loop():
     while True:
-        time.sleep(1)
-        keep_shooting = process_ai_move(room_id)
-        if not keep_shooting:
-            break
+        socketio.sleep(reaper.INTERVAL)
+        # 每個 shard 各自回收、各自 checkpoint
+        for shard in storage.shards:
+            try:
+                cycle = reaper.run_cycle(shard.connect, notify_room_expired, sleep=socketio.sleep)
+                if cycle['expired'] or cycle['archived']:
+                    print(f"[reaper] shard={shard.label} expired={cycle['expired']} archived={cycle['archived']} "
+                          f"batches={cycle['batches']} in {cycle['elapsed_ms']}ms")
+            except Exception as e:
+                print(f"[reaper] shard={shard.label} 回收失敗：{e}")
+
+if reaper.ENABLED and cluster.is_primary():
+    socketio.start_background_task(reaper_loop)
+
+socketio.start_background_task(ai_pool.warm_up)
+
+# ----------------------------
+# 重啟還原 / 健康檢查
+# ----------------------------
+def restore_active_games():
+    try:
+        result = restore.run([shard.connect for shard in storage.shards], cluster.owns,
+                             lambda room_id, delay: socketio.start_background_task(ai_auto_play, room_id, delay),
+                             sleep=socketio.sleep)
+        print(f"[restore] rooms={result['rooms']} ai_rescheduled={result['ai_rescheduled']} "
+              f"delta_warmed={result['delta_warmed']} truncated={result['truncated']} in {result['elapsed_ms']}ms")
+    except Exception as e:
+        restore.status["state"] = "done"
+        print(f"[restore] 還原失敗：{e}")
+
+socketio.start_background_task(restore_active_games)
+
+if traffic.RECORD_ON_START:
+    traffic.start()
+
+metrics.gauge("naval_restore_rooms", "啟動時還原的房間數", ("kind",),
+              collect=lambda: {(key,): restore.status[key] for key in ("rooms", "ai_rescheduled", "delta_warmed")})
+metrics.gauge("naval_restore_duration_seconds", "啟動還原耗時（完成前為 0）",
+              collect=lambda: {(): (restore.status["elapsed_ms"] or 0) / 1000})
+
+@app.route('/healthz')
+def healthz():
+    """程序存活即回 200；帶 ?ready=1 時在還原完成（或超過 RESTORE_BUDGET）前回 503"""
+    ready = restore.is_ready()
+    code = 503 if request.args.get('ready') and not ready else 200
+    return jsonify({"status": "ok" if ready else "restoring", "restore": restore.status}), code
+
+# ----------------------------
+# 管理介面（需設定 ADMIN_TOKEN，並以 X-Admin-Token header 帶入）
+# ----------------------------
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+def is_admin_request():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    if not is_admin_request():
+        return jsonify({"error": "未授權"}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        profiler = profiling.start_profile(
+            mode=data.get("mode", "wall"),
+            seconds=float(data.get("seconds", 10)),
+            interval=float(data.get("interval_ms", 5)) / 1000,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+    return jsonify({"mode": profiler.mode, "seconds": profiler.seconds, "path": profiler.path}), 202
+
+@app.route('/admin/slow_trace', methods=['GET', 'POST'])
+def slow_trace():
+    if not is_admin_request():
+        return jsonify({"error": "未授權"}), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiling.set_slow_threshold(float(data.get("threshold_ms", 0)))
+        except (TypeError, ValueError):
+            return jsonify({"error": "threshold_ms 必須是數字"}), 400
+
+    return jsonify({
+        "threshold_ms": profiling.slow_threshold_ms(),
+        "log_path": profiling.SLOW_LOG_PATH,
+        "recent": list(profiling.recent_slow),
+    }), 200
+
+@app.route('/admin/record', methods=['GET', 'POST', 'DELETE'])
+def record_traffic():
+    """POST 開始限時錄製、GET 查看進度、DELETE 提前停止；錄製檔給 test/replay.py 重播"""
+    if not is_admin_request():
+        return jsonify({"error": "未授權"}), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            recorder = traffic.start(seconds=float(data.get("seconds", traffic.DEFAULT_SECONDS)),
+                                     max_events=int(data.get("max_events", traffic.DEFAULT_MAX_EVENTS)))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 409
+        return jsonify(recorder.status()), 202
+
+    if request.method == 'DELETE':
+        result = traffic.stop()
+    else:
+        result = traffic.recorder.status() if traffic.recorder is not None else None
+    if result is None:
+        return jsonify({"error": "目前沒有在錄製"}), 404
+    return jsonify(result), 200
 
 # ----------------------------
 # REST API
 # ----------------------------
+# ----------------------------
+# 大量 AI 對局模擬
+# ----------------------------
+try:
+    # 讀子行程輸出時要讓出 event loop
+    from eventlet.green import subprocess
+except ImportError:  # pragma: no cover
+    import subprocess
+
+SIMULATE_MAX_GAMES = int(os.environ.get("SIMULATE_MAX_GAMES", "20000"))
+SIMULATE_MAX_WORKERS = int(os.environ.get("SIMULATE_MAX_WORKERS", str(os.cpu_count() or 1)))
+_simulation_running = False
+
+@app.route('/admin/simulate', methods=['POST'])
+def simulate():
+    """在獨立行程（內含行程池）中跑大量 AI 對局，以 NDJSON 串流進度與最終統計"""
+    global _simulation_running
+    if not is_admin_request():
+        return jsonify({"error": "未授權"}), 403
+
+    from ai import simulate as sim
+    data = request.get_json(silent=True) or {}
+    try:
+        games = data.get("games", 1000)
+        if isinstance(games, int) and games > SIMULATE_MAX_GAMES:
+            raise ValueError(f"games 不可超過 {SIMULATE_MAX_GAMES}")
+        spec = sim.make_spec(data.get("strategy", "heuristic"), games, data.get("seed", 0),
+                             data.get("opponent"), data.get("boards"))
+        workers = max(1, min(int(data.get("workers", SIMULATE_MAX_WORKERS)), SIMULATE_MAX_WORKERS))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if _simulation_running:
+        return jsonify({"error": "已有模擬正在執行"}), 409
+
+    cmd = [sys.executable, "-m", "ai.simulate", "--ndjson",
+           "--strategy", spec["strategy"], "--games", str(spec["games"]),
+           "--seed", str(spec["seed"]), "--workers", str(workers)]
+    if spec["opponent"]:
+        cmd += ["--opponent", spec["opponent"]]
+    if spec["boards"]:
+        cmd += ["--boards", "-"]
+
+    _simulation_running = True
+    proc = None
+    try:
+        proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if spec["boards"]:
+            proc.stdin.write(json_dumps(spec["boards"]).encode("utf-8"))
+        proc.stdin.close()
+    except OSError as e:
+        # 子行程沒啟動成功（或寫入棋盤時已結束）就不會有 stream() 來重設旗標
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        _simulation_running = False
+        return jsonify({"error": f"無法啟動模擬行程：{e}"}), 500
+
+    def stream():
+        global _simulation_running
+        finished = False
+        try:
+            for line in proc.stdout:
+                finished = finished or b'"type": "result"' in line or b'"type": "error"' in line
+                yield line
+            if proc.wait() != 0 and not finished:
+                yield (json_dumps({"type": "error", "message": f"模擬行程結束碼 {proc.returncode}"}) + "\n").encode("utf-8")
+        finally:
+            # 客戶端中途斷線時一併結束子行程
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            _simulation_running = False
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
 @app.route('/api/opponent', methods=['POST'])
 def get_opponent():
     data = request.get_json()
@@ -317,7 +902,7 @@ def get_opponent():
 
     row = fetchone(
         "SELECT player1_id, player2_id FROM game WHERE room_id = ?",
-        (room_id,)
+        (room_id,), room_id=room_id
     )
     if not row:
         return jsonify({"error": "找不到房間"}), 404
@@ -338,10 +923,56 @@ def get_opponent():
         "opponent_side": opponent_side
     }), 200
 
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """依勝場排序的排行榜；以 next_cursor 取下一頁"""
+    variant = request.args.get('variant', DEFAULT_VARIANT)
+    try:
+        get_variant(variant)
+        limit = int(request.args.get('limit', 20))
+        with storage.connection() as conn, metrics.DB_LATENCY.time("leaderboard"):
+            page = stats.leaderboard(conn, variant, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page), 200
+
+@app.route('/api/players/<player_id>/stats', methods=['GET'])
+def get_player_stats(player_id):
+    with storage.connection() as conn, metrics.DB_LATENCY.time("player_stats"):
+        result = stats.player_stats(conn, player_id)
+    if result is None:
+        return jsonify({"error": "找不到此玩家的戰績"}), 404
+    return jsonify(result), 200
+
+@app.route('/api/route', methods=['GET'])
+def get_route():
+    """回傳客戶端應連線的 worker；帶 room_id 時為該房間的擁有者"""
+    room_id = request.args.get('room_id')
+    if room_id:
+        row = fetchone("SELECT owner_worker FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
+        if not row:
+            return jsonify({"error": "找不到房間"}), 404
+        owner = row['owner_worker'] if row['owner_worker'] is not None else cluster.WORKER_ID
+    else:
+        # 新玩家優先導向已有人在等待配對（同一種 variant）的 worker
+        row = fetchone_any(
+            "SELECT owner_worker FROM game WHERE status = 'waiting' AND ai_field = 0 AND variant = ? LIMIT 1",
+            (request.args.get('variant', DEFAULT_VARIANT),)
+        )
+        owner = row['owner_worker'] if row and row['owner_worker'] is not None else cluster.WORKER_ID
+
+    return jsonify({"worker_id": owner, "url": cluster.worker_url(owner)}), 200
+
 @app.route('/api/generate_board', methods=['GET'])
 def generate_board_api():
     from ai.battleship_board import generate_board
-    return jsonify(generate_board())
+    try:
+        board_size, ship_sizes = get_variant(request.args.get('variant', DEFAULT_VARIANT))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with metrics.AI_LATENCY.time("generate_board"), profiling.span("ai"):
+        setup = generate_board(board_size, ship_sizes)
+    return jsonify(setup)
 
 @app.route('/api/sunken_ships', methods=['POST'])
 def get_sunken_ships():
@@ -352,13 +983,13 @@ def get_sunken_ships():
     if not room_id or player not in ["player1", "player2"]:
         return {"error": "缺少參數"}, 400
 
-    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,))
+    room = fetchone("SELECT * FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
     if not room:
         return {"error": "找不到房間"}, 404
 
     board_key = f"{player}_board"
     try:
-        board_data = json.loads(room[board_key])
+        board_data = json_loads(room[board_key])
         sunk_ids = check_sunken_ships(board_data)
         sunk_details = [ship for ship in board_data["ships"] if ship["id"] in sunk_ids]
         return {
@@ -0,0 +1,61 @@
+"""版本化的棋盤同步：每個房間的 move_seq 單調遞增，客戶端用 since 只拿變動的格子。
+
+每步棋只會改一格（2 命中 / 3 未中），同一份變動同時供觀戰廣播與 since 查詢重用。
+"""
+from collections import OrderedDict, deque
+
+from ai.utils import VARIANTS
+
+MAX_CACHED_ROOMS = 2000
+# 兩張最大棋盤的總格數，任何 variant 整局都在快取內；deque 只隨實際步數成長
+MAX_CACHED_MOVES = 2 * max(size for size, _ in VARIANTS.values()) ** 2
+
+
+def spectator_room(room_id):
+    return f"{room_id}:spectators"
+
+
+def mask_board(board):
+    """觀戰者看不到未被擊中的船（1 -> 0）"""
+    return [[0 if cell == 1 else cell for cell in row] for row in board]
+
+
+def make_change(seq, target, x, y, value):
+    return {"seq": seq, "board": target, "x": x, "y": y, "value": value}
+
+
+class DeltaCache:
+    """每個房間最近的變動，(seq, change)；房間數以 LRU 限制"""
+
+    def __init__(self, max_rooms=MAX_CACHED_ROOMS, max_moves=MAX_CACHED_MOVES):
+        self.max_rooms = max_rooms
+        self.max_moves = max_moves
+        self._rooms = OrderedDict()
+
+    def append(self, room_id, change):
+        moves = self._rooms.get(room_id)
+        if moves is None:
+            moves = self._rooms[room_id] = deque(maxlen=self.max_moves)
+            if len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room_id)
+            # 快取出現斷層（例如重啟後才開始記錄）就從頭來過
+            if moves and moves[-1][0] != change["seq"] - 1:
+                moves.clear()
+        moves.append((change["seq"], change))
+
+    def changes_since(self, room_id, since, current_seq):
+        """回傳 since 之後的變動；快取無法完整涵蓋時回傳 None，由呼叫端改查資料庫"""
+        if since >= current_seq:
+            return []
+        moves = self._rooms.get(room_id)
+        if not moves or moves[0][0] > since + 1 or moves[-1][0] < current_seq:
+            return None
+        return [change for seq, change in moves if seq > since]
+
+    def discard(self, room_id):
+        self._rooms.pop(room_id, None)
+
+
+delta_cache = DeltaCache()
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+from contextlib import closing
+
+import socketio
+
+# ----------------------------
+# 多 worker 設定
+# ----------------------------
+# WORKER_URLS：所有 worker 對外位址（逗號分隔），WORKER_ID：本 worker 在清單中的索引
+# 未設定 WORKER_URLS 時即為單 worker 模式，行為與原本相同
+WORKER_URLS = [u.strip() for u in os.environ.get("WORKER_URLS", "").split(",") if u.strip()]
+WORKER_ID = int(os.environ.get("WORKER_ID", "0"))
+MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE", "")
+
+QUEUE_POLL_INTERVAL = float(os.environ.get("SOCKETIO_QUEUE_POLL", "0.05"))
+QUEUE_RETENTION = int(os.environ.get("SOCKETIO_QUEUE_RETENTION", "60"))
+
+
+def is_clustered():
+    return len(WORKER_URLS) > 1
+
+
+def is_primary():
+    """只有第一個 worker 執行全域性的背景工作（例如回收器）"""
+    return WORKER_ID == 0
+
+
+def worker_url(worker_id):
+    if 0 <= worker_id < len(WORKER_URLS):
+        return WORKER_URLS[worker_id]
+    return None
+
+
+def owns(owner_worker):
+    """房間的擁有者是否為本 worker；舊資料沒有 owner 一律視為本地"""
+    return owner_worker is None or not is_clustered() or int(owner_worker) == WORKER_ID
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """以共用的 SQLite 檔當訊息佇列，讓同一台機器上的多個 worker 互相轉發 emit。
+
+    適合本機測試與小規模部署；正式多節點請改用 redis:// 等 message queue。
+    """
+    name = 'sqlite'
+
+    def __init__(self, get_conn, channel='flask-socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.get_conn = get_conn
+        with closing(self.get_conn()) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS socketio_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel VARCHAR(50) NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """)
+            conn.commit()
+
+    def _publish(self, data):
+        with closing(self.get_conn()) as conn:
+            conn.execute(
+                "INSERT INTO socketio_queue (channel, payload, created_at) VALUES (?, ?, ?)",
+                (self.channel, json.dumps(data), time.time()),
+            )
+            conn.commit()
+
+    def _listen(self):
+        with closing(self.get_conn()) as conn:
+            row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_queue").fetchone()
+        last_id = row[0]
+        last_prune = time.time()
+
+        while True:
+            with closing(self.get_conn()) as conn:
+                rows = conn.execute(
+                    "SELECT id, payload FROM socketio_queue WHERE id > ? AND channel = ? ORDER BY id",
+                    (last_id, self.channel),
+                ).fetchall()
+                if is_primary() and time.time() - last_prune > QUEUE_RETENTION:
+                    conn.execute("DELETE FROM socketio_queue WHERE created_at < ?",
+                                 (time.time() - QUEUE_RETENTION,))
+                    conn.commit()
+                    last_prune = time.time()
+
+            for row in rows:
+                last_id = row[0]
+                yield row[1]
+            time.sleep(QUEUE_POLL_INTERVAL)
+
+
+def client_manager_options(get_conn):
+    """依 SOCKETIO_MESSAGE_QUEUE 決定要給 SocketIO 的參數"""
+    if not MESSAGE_QUEUE:
+        return {}
+    if MESSAGE_QUEUE.startswith("sqlite"):
+        return {"client_manager": SQLiteQueueManager(get_conn)}
+    return {"message_queue": MESSAGE_QUEUE}
@@ -0,0 +1,141 @@
+"""Socket.IO payload 編碼協商：預設 JSON，客戶端可改用 MessagePack 二進位格式。
+
+- 以 `set_codec` 事件或連線 query `?codec=msgpack` 協商。
+- 二進位客戶端加入的是 `<room>:mp`，廣播時每個編碼各序列化一次。
+- 棋盤（整數二維陣列）打包成 msgpack ExtType(1)：[rows, cols] + 每格一個 byte。
+"""
+import json
+import time
+
+import metrics
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack 為選用套件
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+GRID_EXT_TYPE = 1
+JSON_SAMPLE_EVERY = 16  # JSON 由 Socket.IO 自行序列化，這裡每 N 次抽樣量一次大小
+
+PAYLOAD_BYTES = metrics.histogram(
+    "naval_payload_bytes", "每次廣播/回覆的 payload 大小（JSON 為抽樣）", ("codec", "event"),
+    buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+ENCODE_LATENCY = metrics.histogram(
+    "naval_payload_encode_seconds", "payload 序列化時間（JSON 為抽樣）", ("codec",),
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025))
+CODEC_CLIENTS = metrics.gauge("naval_codec_clients", "使用非 JSON 編碼的連線數", ("codec",))
+
+_client_codecs = {}
+_json_counter = 0
+
+
+def available_codecs():
+    return [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+
+def set_client_codec(sid, codec):
+    """設定連線的編碼，回傳實際採用的編碼（不支援時退回 JSON）"""
+    forget(sid)
+    if codec == MSGPACK and msgpack is not None:
+        _client_codecs[sid] = MSGPACK
+        CODEC_CLIENTS.inc(MSGPACK)
+        return MSGPACK
+    return JSON
+
+
+def client_codec(sid):
+    return _client_codecs.get(sid, JSON)
+
+
+def forget(sid):
+    codec = _client_codecs.pop(sid, None)
+    if codec is not None:
+        CODEC_CLIENTS.dec(codec)
+
+
+def has_binary_clients(clustered=False):
+    """廣播時是否需要另外送一份到 <room>:mp。
+    _client_codecs 只記得本程序的連線；多 worker 時其他 worker 上的二進位客戶端看不到，
+    因此只要支援 msgpack 就一律送（房內沒有二進位客戶端時只多一次序列化與佇列轉發）"""
+    if clustered:
+        return msgpack is not None
+    return bool(_client_codecs)
+
+
+def binary_room(room):
+    return f"{room}:mp"
+
+
+def base_room(room):
+    return room[:-3] if room.endswith(":mp") else room
+
+
+def room_for(sid, room):
+    return binary_room(room) if client_codec(sid) == MSGPACK else room
+
+
+def _is_grid(value):
+    return (
+        isinstance(value, list) and value and isinstance(value[0], list)
+        and all(isinstance(row, list) and len(row) == len(value[0]) for row in value)
+        # bool 是 int 的子類別，打包成 byte 會讓 true/false 變成 1/0
+        and all(type(cell) is int and 0 <= cell < 256 for row in value for cell in row)
+    )
+
+
+def _pack_default(obj):
+    raise TypeError(f"無法以 msgpack 編碼 {type(obj)!r}")
+
+
+def _compact(value):
+    if _is_grid(value):
+        rows, cols = len(value), len(value[0])
+        if rows < 256 and cols < 256:
+            cells = bytes(cell for row in value for cell in row)
+            return msgpack.ExtType(GRID_EXT_TYPE, bytes((rows, cols)) + cells)
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value]
+    return value
+
+
+def _ext_hook(code, data):
+    if code == GRID_EXT_TYPE:
+        rows, cols = data[0], data[1]
+        cells = data[2:]
+        return [list(cells[r * cols:(r + 1) * cols]) for r in range(rows)]
+    return msgpack.ExtType(code, data)
+
+
+def encode_msgpack(event, payload):
+    started = time.perf_counter()
+    packed = msgpack.packb(_compact(payload), use_bin_type=True, default=_pack_default)
+    ENCODE_LATENCY.observe(time.perf_counter() - started, MSGPACK)
+    PAYLOAD_BYTES.observe(len(packed), MSGPACK, event)
+    return packed
+
+
+def decode_msgpack(data):
+    return msgpack.unpackb(data, raw=False, ext_hook=_ext_hook)
+
+
+def sample_json(event, payload):
+    """抽樣量測 JSON 的大小與序列化時間"""
+    global _json_counter
+    _json_counter += 1
+    if _json_counter % JSON_SAMPLE_EVERY:
+        return
+    started = time.perf_counter()
+    size = len(json.dumps(payload, separators=(",", ":")))
+    ENCODE_LATENCY.observe(time.perf_counter() - started, JSON)
+    PAYLOAD_BYTES.observe(size, JSON, event)
+
+
+def decode_incoming(data):
+    """二進位客戶端送來的事件參數為 msgpack bytes"""
+    if msgpack is not None and isinstance(data, (bytes, bytearray)):
+        return decode_msgpack(bytes(data))
+    return data
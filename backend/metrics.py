@@ -0,0 +1,243 @@
+"""輕量的 Prometheus 文字格式指標（counter / gauge / histogram），不依賴額外套件。
+
+熱路徑上每次觀測只做一次 perf_counter 差值與 bisect，匯出時才累加 bucket。
+"""
+import time
+from bisect import bisect_left
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items(), key=lambda item: tuple(map(str, item[0]))):
+            lines.extend(self._expose_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *labels, amount=1):
+        self.labels(*labels).value += amount
+
+    def _expose_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """一般 gauge；給 collect 時在匯出當下呼叫，回傳 {(label values...): value}，未回傳的標籤組合匯出為 0"""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, *labels, amount=1):
+        self.labels(*labels).value += amount
+
+    def dec(self, *labels, amount=1):
+        self.labels(*labels).value -= amount
+
+    def set(self, value, *labels):
+        self.labels(*labels).value = value
+
+    def expose(self):
+        if self.collect is not None:
+            collected = self.collect()
+            # 這次沒回傳的標籤組合（例如某個狀態的房間數降為 0，GROUP BY 不會有那一列）歸零，不保留舊值
+            for values, child in self._children.items():
+                if values not in collected:
+                    child.value = 0
+            for values, value in collected.items():
+                self.labels(*values).value = value
+        return super().expose()
+
+    def _expose_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def time(self, *labels):
+        return _Timer(self.labels(*labels))
+
+    def _expose_child(self, values, child):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(float(bound)))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {child.count}"
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=(), collect=None):
+    return REGISTRY.register(Gauge(name, help, labelnames, collect))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def timed(hist, *labels):
+    """裝飾器：量測函式執行時間"""
+    def decorator(fn):
+        child = hist.labels(*labels)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+# ----------------------------
+# 伺服器使用的指標
+# ----------------------------
+SOCKET_EVENT_LATENCY = histogram(
+    "naval_socketio_event_duration_seconds", "Socket.IO 事件處理時間", ("event",))
+SOCKET_EVENT_ERRORS = counter(
+    "naval_socketio_event_errors_total", "Socket.IO 事件處理時拋出例外的次數", ("event",))
+HTTP_REQUEST_LATENCY = histogram(
+    "naval_http_request_duration_seconds", "REST 路由處理時間", ("endpoint", "method"))
+HTTP_REQUESTS = counter(
+    "naval_http_requests_total", "REST 請求數", ("endpoint", "method", "status"))
+DB_LATENCY = histogram(
+    "naval_db_call_duration_seconds", "SQLite 輔助函式執行時間", ("op",))
+AI_LATENCY = histogram(
+    "naval_ai_call_duration_seconds", "AI 呼叫執行時間", ("call",))
+CONNECTIONS = gauge(
+    "naval_socketio_connections", "目前連線中的 Socket.IO 客戶端數")
+CONNECTS = counter(
+    "naval_socketio_connects_total", "Socket.IO 連線次數")
@@ -0,0 +1,225 @@
+"""線上 worker 的取樣式 profiler 與慢請求追蹤。
+
+- SamplingProfiler：管理員觸發，在限定秒數內取樣呼叫堆疊，輸出 folded 格式
+  （可直接餵給 flamegraph.pl / speedscope）。
+  - wall：原生執行緒定期讀取 sys._current_frames()，包含閒置中的 event loop 與 AI 執行緒。
+  - cpu：以 SIGPROF（ITIMER_PROF）只在主執行緒實際耗用 CPU 時取樣。
+- 慢請求追蹤：開啟後每個事件/請求累計 db / json / ai 耗時，超過門檻時寫入 slow.log。
+"""
+import os
+import sys
+import json
+import time
+import signal
+import contextvars
+from collections import Counter, deque
+from datetime import datetime
+from functools import wraps
+
+try:
+    # eventlet monkey patch 之後 threading 會變成 green thread，取樣必須用原生執行緒
+    from eventlet import patcher
+    _threading = patcher.original("threading")
+    _thread = patcher.original("_thread")
+    _time = patcher.original("time")
+except ImportError:  # pragma: no cover
+    import threading as _threading
+    import _thread
+    _time = time
+
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), "instance", "profiles")
+MAX_PROFILE_SECONDS = 120
+
+# ----------------------------
+# 取樣式 profiler
+# ----------------------------
+_active_profiler = None
+
+
+def _frame_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+
+class SamplingProfiler:
+    def __init__(self, mode="wall", seconds=10.0, interval=0.005, out_dir=PROFILE_DIR):
+        if mode not in ("wall", "cpu"):
+            raise ValueError("mode 必須是 wall 或 cpu")
+        if mode == "cpu" and not hasattr(signal, "setitimer"):
+            raise ValueError("此平台不支援 cpu 取樣")
+        self.mode = mode
+        self.seconds = min(float(seconds), MAX_PROFILE_SECONDS)
+        self.interval = max(float(interval), 0.001)
+        self.samples = Counter()
+        self.sample_count = 0
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(out_dir, f"{mode}-{stamp}.folded")
+        self._sampler_ident = None
+
+    def start(self):
+        """需在主執行緒（伺服器的 event loop）呼叫"""
+        global _active_profiler
+        if _active_profiler is not None:
+            raise RuntimeError("已有 profiler 正在執行")
+        _active_profiler = self
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.mode == "cpu":
+            signal.signal(signal.SIGPROF, _on_sigprof)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        worker = _threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        worker.start()
+        return self
+
+    def _run(self):
+        global _active_profiler
+        self._sampler_ident = _thread.get_ident()
+        deadline = _time.monotonic() + self.seconds
+        try:
+            while _time.monotonic() < deadline:
+                if self.mode == "wall":
+                    self._sample_all_threads()
+                _time.sleep(self.interval)
+        finally:
+            if self.mode == "cpu":
+                signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            _active_profiler = None
+            self.dump()
+
+    def _sample_all_threads(self):
+        names = {t.ident: t.name for t in _threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._sampler_ident:
+                continue
+            self.record(frame, names.get(ident, f"thread-{ident}"))
+
+    def record(self, frame, thread_name="main"):
+        self.samples[f"{thread_name};{_frame_stack(frame)}"] += 1
+        self.sample_count += 1
+
+    def dump(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return self.path
+
+
+def _on_sigprof(signum, frame):
+    profiler = _active_profiler
+    if profiler is not None and profiler.mode == "cpu":
+        profiler.record(frame)
+
+
+def start_profile(mode="wall", seconds=10.0, interval=0.005):
+    return SamplingProfiler(mode, seconds, interval).start()
+
+
+def is_profiling():
+    return _active_profiler is not None
+
+
+# ----------------------------
+# 慢請求追蹤
+# ----------------------------
+SLOW_LOG_PATH = os.path.join(PROFILE_DIR, "slow.log")
+_slow_threshold = float(os.environ.get("SLOW_TRACE_MS", "0")) / 1000
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+recent_slow = deque(maxlen=200)
+
+
+class _Trace:
+    __slots__ = ("started", "durations", "counts")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = Counter()
+        self.counts = Counter()
+
+    def add(self, category, seconds):
+        self.durations[category] += seconds
+        self.counts[category] += 1
+
+
+def set_slow_threshold(ms):
+    """ms <= 0 代表關閉"""
+    global _slow_threshold
+    _slow_threshold = max(float(ms), 0) / 1000
+
+
+def slow_threshold_ms():
+    return _slow_threshold * 1000
+
+
+def begin():
+    if _slow_threshold <= 0:
+        return None
+    return _current_trace.set(_Trace())
+
+
+def end(name, token):
+    if token is None:
+        return
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is None:
+        return
+    total = time.perf_counter() - trace.started
+    if total < _slow_threshold:
+        return
+
+    breakdown = {f"{k}_ms": round(v * 1000, 3) for k, v in trace.durations.items()}
+    breakdown["other_ms"] = round((total - sum(trace.durations.values())) * 1000, 3)
+    entry = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "name": name,
+        "total_ms": round(total * 1000, 3),
+        "breakdown": breakdown,
+        "counts": dict(trace.counts),
+    }
+    recent_slow.append(entry)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(SLOW_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def traced(category):
+    """裝飾器：在慢請求追蹤開啟時，把函式耗時計入目前請求的 category"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.add(category, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class span:
+    """with 區塊版本的 traced"""
+    __slots__ = ("category", "trace", "started")
+
+    def __init__(self, category):
+        self.category = category
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            self.trace.add(self.category, time.perf_counter() - self.started)
+        return False
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import zlib
+from contextlib import closing
+
+# ----------------------------
+# 設定（皆可用環境變數覆寫，單位：秒）
+# ----------------------------
+ENABLED = os.environ.get("REAPER_ENABLED", "1") == "1"
+INTERVAL = int(os.environ.get("REAPER_INTERVAL", "60"))
+WAITING_TTL = int(os.environ.get("REAPER_WAITING_TTL", "600"))      # 等待配對的房間閒置多久就過期
+PLAYING_TTL = int(os.environ.get("REAPER_PLAYING_TTL", "3600"))     # 對戰中但無人操作多久就過期
+ARCHIVE_AFTER = int(os.environ.get("REAPER_ARCHIVE_AFTER", "300"))  # 結束/過期多久後搬進冷儲存
+BATCH_SIZE = int(os.environ.get("REAPER_BATCH_SIZE", "500"))
+MAX_BATCHES = int(os.environ.get("REAPER_MAX_BATCHES", "20"))       # 每輪最多搬幾批，避免占住 event loop
+
+ARCHIVE_STATUSES = ("finished", "expired")
+
+
+def init_archive(cur):
+    """建立冷儲存表；整列資料以 zlib 壓縮的 JSON 存放"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS game_archive (
+        id INTEGER PRIMARY KEY,
+        room_id VARCHAR(50) NOT NULL UNIQUE,
+        status VARCHAR(20),
+        winner_id VARCHAR(50),
+        created_at DATETIME,
+        last_activity DATETIME,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        payload BLOB
+    );
+    """)
+
+
+def _cutoff(seconds):
+    return f"-{int(seconds)} seconds"
+
+
+def expire_idle_rooms(conn, limit=BATCH_SIZE):
+    """把閒置超過 TTL 的 waiting/playing 房間標成 expired，回傳被過期的 room_id"""
+    expired = []
+    for status, ttl in (("waiting", WAITING_TTL), ("playing", PLAYING_TTL)):
+        with closing(conn.cursor()) as cur:
+            cur.execute("""
+                SELECT room_id FROM game
+                WHERE status = ? AND last_activity < datetime('now', ?)
+                ORDER BY last_activity
+                LIMIT ?
+            """, (status, _cutoff(ttl), limit))
+            room_ids = [row[0] for row in cur.fetchall()]
+            if not room_ids:
+                continue
+            # 以舊狀態作為條件，避免覆蓋掉剛好在這期間被加入/下子的房間；只回報真的被改到的房間
+            for room_id in room_ids:
+                cur.execute("UPDATE game SET status = 'expired' WHERE room_id = ? AND status = ?",
+                            (room_id, status))
+                if cur.rowcount:
+                    expired.append(room_id)
+            conn.commit()
+    return expired
+
+
+def archive_batch(conn, limit=BATCH_SIZE):
+    """把一批已結束的房間（含 move_log）壓縮搬到 game_archive 並從 game 刪除，回傳搬移筆數"""
+    with closing(conn.cursor()) as cur:
+        placeholders = ",".join("?" for _ in ARCHIVE_STATUSES)
+        cur.execute(f"""
+            SELECT * FROM game
+            WHERE status IN ({placeholders}) AND last_activity < datetime('now', ?)
+            ORDER BY last_activity
+            LIMIT ?
+        """, (*ARCHIVE_STATUSES, _cutoff(ARCHIVE_AFTER), limit))
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+
+        room_ids = [row["room_id"] for row in rows]
+        room_placeholders = ",".join("?" for _ in room_ids)
+        cur.execute(f"""
+            SELECT room_id, seq, board, x, y, value FROM move_log
+            WHERE room_id IN ({room_placeholders})
+            ORDER BY room_id, seq
+        """, room_ids)
+        moves = {}
+        for move in cur.fetchall():
+            moves.setdefault(move["room_id"], []).append(
+                [move["seq"], move["board"], move["x"], move["y"], move["value"]])
+
+        archived = []
+        for row in rows:
+            record = {key: row[key] for key in row.keys()}
+            record["moves"] = moves.get(row["room_id"], [])
+            payload = zlib.compress(json.dumps(record, default=str).encode("utf-8"))
+            archived.append((
+                row["id"], row["room_id"], row["status"], row["winner_id"],
+                row["created_at"], row["last_activity"], payload,
+            ))
+
+        cur.executemany("""
+            INSERT OR REPLACE INTO game_archive (
+                id, room_id, status, winner_id, created_at, last_activity, payload
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, archived)
+        cur.executemany("DELETE FROM game WHERE id = ?", [(row["id"],) for row in rows])
+        cur.execute(f"DELETE FROM move_log WHERE room_id IN ({room_placeholders})", room_ids)
+        conn.commit()
+        return len(rows)
+
+
+def run_cycle(get_conn, notify_expired=None, sleep=time.sleep):
+    """執行一輪回收：過期閒置房間 -> 通知 -> 分批歸檔 -> checkpoint，回傳統計"""
+    started = time.perf_counter()
+    stats = {"expired": 0, "archived": 0, "batches": 0}
+
+    with closing(get_conn()) as conn:
+        expired = expire_idle_rooms(conn)
+        stats["expired"] = len(expired)
+
+        for _ in range(MAX_BATCHES):
+            moved = archive_batch(conn)
+            if moved == 0:
+                break
+            stats["archived"] += moved
+            stats["batches"] += 1
+            if moved < BATCH_SIZE:
+                break
+            sleep(0)  # 批次之間讓出 CPU 給其他 socket
+
+        if stats["archived"]:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE);")
+
+    if notify_expired:
+        for room_id in expired:
+            notify_expired(room_id)
+
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return stats
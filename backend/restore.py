@@ -0,0 +1,104 @@
+"""重啟後還原進行中的對局：一次查出所有 playing 房間，重建記憶體狀態並重新排程 AI 回合。
+
+還原在背景分批進行，批次之間讓出 hub，/healthz 在還原期間也能立即回應。
+- AI 回合：current_turn = 'ai' 的 PvE 房間一定會重新排程（成本只有開一個 green thread），
+  第一步隨機分散在 RESTORE_AI_SPREAD 秒內，避免上千個房間同一刻一起查資料庫。
+- 增量同步快取：只預熱最近活動的房間（最多 delta_cache 的容量），超過 RESTORE_BUDGET 秒就停止；
+  沒預熱到的房間照常由 move_log 查詢，只是第一次 update_board 稍慢。
+"""
+import os
+import time
+import random
+from contextlib import ExitStack, closing
+
+import board_sync
+
+BUDGET = float(os.environ.get("RESTORE_BUDGET", "5"))       # 秒；超過即視為就緒，剩下的快取預熱放棄
+CHUNK_SIZE = int(os.environ.get("RESTORE_CHUNK_SIZE", "100"))  # 每批處理的房間數
+AI_SPREAD = float(os.environ.get("RESTORE_AI_SPREAD", "3"))    # 秒；重新排程的 AI 第一步隨機分散在這段時間內
+
+status = {
+    "state": "pending",        # pending -> restoring -> done
+    "rooms": 0,                # playing 房間數（本 worker 擁有的）
+    "ai_rescheduled": 0,
+    "delta_warmed": 0,
+    "truncated": False,        # 是否因超過預算而停止預熱
+    "elapsed_ms": None,
+}
+_started = None
+
+
+def is_ready():
+    """還原完成，或已超過時間預算（剩下的工作不影響正確性）"""
+    if status["state"] == "done":
+        return True
+    return _started is not None and time.perf_counter() - _started > BUDGET
+
+
+def load_active_rooms(conn, owns):
+    """單一查詢取出所有 playing 房間（只取還原需要的欄位，不讀棋盤），依最後活動時間由舊到新"""
+    rows = conn.execute("""
+        SELECT room_id, ai_field, current_turn, owner_worker, move_seq, last_activity
+        FROM game
+        WHERE status = 'playing'
+        ORDER BY last_activity
+    """).fetchall()
+    return [row for row in rows if owns(row["owner_worker"])]
+
+
+def warm_delta_cache(conn, room_ids, cache=board_sync.delta_cache):
+    """一次查出這些房間的 move_log 填回增量同步快取，回傳預熱的房間數"""
+    if not room_ids:
+        return 0
+    placeholders = ",".join("?" for _ in room_ids)
+    rows = conn.execute(f"""
+        SELECT room_id, seq, board, x, y, value FROM move_log
+        WHERE room_id IN ({placeholders})
+        ORDER BY room_id, seq
+    """, room_ids).fetchall()
+    warmed = set()
+    for row in rows:
+        cache.append(row["room_id"], board_sync.make_change(row["seq"], row["board"], row["x"], row["y"], row["value"]))
+        warmed.add(row["room_id"])
+    return len(warmed)
+
+
+def run(get_conns, owns, schedule_ai, sleep=time.sleep):
+    """執行一次還原並更新 status，回傳 status；get_conns 為各 shard 的連線工廠，
+    schedule_ai(room_id, delay) 負責排程 AI 回合"""
+    global _started
+    _started = time.perf_counter()
+    status["state"] = "restoring"
+
+    with ExitStack() as stack:
+        conns = [stack.enter_context(closing(get_conn())) for get_conn in get_conns]
+        # (conn, row)；多個 shard 時依最後活動時間合併成同一個順序
+        rooms = [(conn, row) for conn in conns for row in load_active_rooms(conn, owns)]
+        if len(conns) > 1:
+            rooms.sort(key=lambda item: item[1]["last_activity"] or "")
+        status["rooms"] = len(rooms)
+
+        # 先排程 AI：卡住的對局比冷快取嚴重
+        for start in range(0, len(rooms), CHUNK_SIZE):
+            for _, row in rooms[start:start + CHUNK_SIZE]:
+                if row["ai_field"] and row["current_turn"] == "ai":
+                    schedule_ai(row["room_id"], 1 + random.uniform(0, AI_SPREAD))
+                    status["ai_rescheduled"] += 1
+            sleep(0)
+
+        # 快取是 LRU：只預熱最近活動的那些，由舊到新放入，最新的留在最後
+        cached = [(conn, row["room_id"]) for conn, row in rooms if row["move_seq"]][-board_sync.delta_cache.max_rooms:]
+        for start in range(0, len(cached), CHUNK_SIZE):
+            if time.perf_counter() - _started > BUDGET:
+                status["truncated"] = True
+                break
+            by_conn = {}
+            for conn, room_id in cached[start:start + CHUNK_SIZE]:
+                by_conn.setdefault(conn, []).append(room_id)
+            for conn, room_ids in by_conn.items():
+                status["delta_warmed"] += warm_delta_cache(conn, room_ids)
+            sleep(0)
+
+    status["elapsed_ms"] = round((time.perf_counter() - _started) * 1000, 2)
+    status["state"] = "done"
+    return status
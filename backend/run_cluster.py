@@ -0,0 +1,53 @@
+"""在同一台機器上啟動多個單進程 worker（每個 worker 一個埠），共用 SQLite 訊息佇列。
+
+用法：
+    uv run python run_cluster.py --workers 4 --port 5001 --host 127.0.0.1
+
+eventlet + Socket.IO 需要 sticky session，因此不用 gunicorn -w N，
+而是每個 worker 各自監聽一個埠，客戶端透過 /api/route 或 redirect 事件連到房間所屬的 worker。
+"""
+import os
+import sys
+import signal
+import argparse
+import subprocess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Naval chess multi-worker launcher")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1", help="對外公布給客戶端的主機名稱")
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001, help="第一個 worker 的埠號")
+    parser.add_argument("--message-queue", default=os.environ.get("SOCKETIO_MESSAGE_QUEUE", "sqlite://"))
+    args = parser.parse_args()
+
+    ports = [args.port + i for i in range(args.workers)]
+    urls = ",".join(f"http://{args.host}:{port}" for port in ports)
+
+    procs = []
+    for worker_id, port in enumerate(ports):
+        env = dict(os.environ,
+                   WORKER_ID=str(worker_id),
+                   WORKER_URLS=urls,
+                   SOCKETIO_MESSAGE_QUEUE=args.message_queue)
+        cmd = [sys.executable, "-m", "gunicorn", "-k", "eventlet", "-w", "1",
+               "-b", f"{args.bind}:{port}", "app:app"]
+        procs.append(subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__))))
+        print(f"worker {worker_id} -> http://{args.host}:{port}")
+
+    def shutdown(signum, frame):
+        for proc in procs:
+            proc.terminate()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    exit_code = 0
+    for proc in procs:
+        exit_code = proc.wait() or exit_code
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""玩家戰績與排行榜。
+
+對局結束時，在把 game 標成 finished 的同一個 transaction 內遞增 player_stats 的彙總列，
+讀取端（排行榜、個人戰績）只查彙總表與索引，不掃 game 表也不解析棋盤。
+戰績依 variant 分開計算，不同大小棋盤的砲數不能互相比較。AI（player_id = 'ai'）不列入。
+
+既有資料庫可用以下指令從 game 與 game_archive 重建一次（在 backend/ 目錄下）：
+    uv run python -m stats --rebuild
+"""
+import os
+import json
+import zlib
+import argparse
+from contextlib import ExitStack, closing
+
+AI_PLAYER = "ai"
+MAX_PAGE_SIZE = 100
+
+
+def init_stats(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS player_stats (
+        player_id VARCHAR(50) NOT NULL,
+        variant VARCHAR(20) NOT NULL,
+        games_played INTEGER NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0,
+        win_shots INTEGER NOT NULL DEFAULT 0,   -- 所有勝局的砲數總和，平均 = win_shots / wins
+        best_shots INTEGER,                     -- 最少砲數的勝局
+        last_played DATETIME,
+        PRIMARY KEY (player_id, variant)
+    ) WITHOUT ROWID;
+    """)
+    # 排行榜的 keyset 分頁：(wins, player_id) 由大到小
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_player_stats_rank ON player_stats(variant, wins, player_id);")
+
+
+def shots_fired(board):
+    """攻擊方在這張棋盤上開過的砲數（2 命中 / 3 未中）"""
+    return sum(1 for row in board for cell in row if cell in (2, 3))
+
+
+def _record(conn, player_id, variant, won, shots, played_at=None):
+    conn.execute("""
+        INSERT INTO player_stats (player_id, variant, games_played, wins, losses, win_shots, best_shots, last_played)
+        VALUES (?, ?, 1, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ON CONFLICT (player_id, variant) DO UPDATE SET
+            games_played = games_played + 1,
+            wins = wins + excluded.wins,
+            losses = losses + excluded.losses,
+            win_shots = win_shots + excluded.win_shots,
+            best_shots = CASE
+                WHEN excluded.best_shots IS NULL THEN best_shots
+                WHEN best_shots IS NULL OR excluded.best_shots < best_shots THEN excluded.best_shots
+                ELSE best_shots
+            END,
+            last_played = MAX(COALESCE(last_played, ''), excluded.last_played)
+    """, (player_id, variant, int(won), int(not won), shots if won else 0, shots if won else None, played_at))
+
+
+def finish_game(conn, room, winner_id, shots):
+    """在呼叫端的 transaction 內結束對局並更新雙方戰績；已結束（或已過期）的房間不重複計算，回傳是否有更新"""
+    cur = conn.execute(
+        "UPDATE game SET status = 'finished', winner_id = ? WHERE room_id = ? AND status = 'playing'",
+        (winner_id, room['room_id'])
+    )
+    if cur.rowcount == 0:
+        return False
+    variant = room['variant'] or 'classic'
+    for player_id in (room['player1_id'], room['player2_id']):
+        if player_id and player_id != AI_PLAYER:
+            _record(conn, player_id, variant, player_id == winner_id, shots)
+    return True
+
+
+# ----------------------------
+# 查詢
+# ----------------------------
+def _format(row):
+    return {
+        "player_id": row["player_id"],
+        "variant": row["variant"],
+        "games_played": row["games_played"],
+        "wins": row["wins"],
+        "losses": row["losses"],
+        "win_rate": round(row["wins"] / row["games_played"], 4) if row["games_played"] else None,
+        "avg_shots_to_win": round(row["win_shots"] / row["wins"], 2) if row["wins"] else None,
+        "best_shots": row["best_shots"],
+        "last_played": row["last_played"],
+    }
+
+
+def encode_cursor(row):
+    return f"{row['wins']}:{row['player_id']}"
+
+
+def decode_cursor(cursor):
+    wins, _, player_id = cursor.partition(":")
+    if not player_id:
+        raise ValueError("cursor 格式錯誤")
+    return int(wins), player_id
+
+
+def leaderboard(conn, variant, limit=20, cursor=None):
+    """依勝場排序的一頁排行榜；cursor 為上一頁的 next_cursor。每頁只走索引的一段，與總筆數無關"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if cursor:
+        wins, player_id = decode_cursor(cursor)
+        rows = conn.execute("""
+            SELECT * FROM player_stats
+            WHERE variant = ? AND (wins, player_id) < (?, ?)
+            ORDER BY wins DESC, player_id DESC
+            LIMIT ?
+        """, (variant, wins, player_id, limit + 1)).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT * FROM player_stats
+            WHERE variant = ?
+            ORDER BY wins DESC, player_id DESC
+            LIMIT ?
+        """, (variant, limit + 1)).fetchall()
+    page = rows[:limit]
+    return {
+        "variant": variant,
+        "players": [_format(row) for row in page],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
+
+
+def player_stats(conn, player_id):
+    """回傳該玩家各 variant 的戰績；沒有任何紀錄時回傳 None"""
+    rows = conn.execute(
+        "SELECT * FROM player_stats WHERE player_id = ? ORDER BY variant", (player_id,)
+    ).fetchall()
+    if not rows:
+        return None
+    return {"player_id": player_id, "variants": {row["variant"]: _format(row) for row in rows}}
+
+
+# ----------------------------
+# 重建（一次性）
+# ----------------------------
+def _loser_shots(game, loser_side):
+    """與 finish_game 相同：數輸家棋盤上被打過的格子（舊資料沒有 move_log，不能用它計）"""
+    board_json = game[f"{loser_side}_board"]
+    if not board_json:
+        return 0
+    return shots_fired(json.loads(board_json)["board"])
+
+
+def _finished_games(conn):
+    """逐筆產生已結束的對局 (room, winner_id, shots)；game 表與冷儲存的壓縮 payload 都有雙方最後的棋盤"""
+    for room in conn.execute("SELECT * FROM game WHERE status = 'finished' AND winner_id IS NOT NULL"):
+        loser_side = "player2" if room["winner_id"] == room["player1_id"] else "player1"
+        yield dict(room), room["winner_id"], _loser_shots(room, loser_side)
+
+    # 升級前的資料庫還沒有冷儲存表
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'game_archive'").fetchone():
+        return
+    for (payload,) in conn.execute(
+            "SELECT payload FROM game_archive WHERE status = 'finished' AND winner_id IS NOT NULL"):
+        record = json.loads(zlib.decompress(payload))
+        loser_side = "player2" if record["winner_id"] == record["player1_id"] else "player1"
+        yield record, record["winner_id"], _loser_shots(record, loser_side)
+
+
+def rebuild(conn, sources=None):
+    """清空後由歷史對局重算全部戰績，回傳計入的局數；sources 為存放房間的 shard 連線（預設即 conn）"""
+    games = [game for source in (sources or [conn]) for game in _finished_games(source)]
+    with conn:
+        conn.execute("DELETE FROM player_stats")
+        for room, winner_id, shots in games:
+            variant = room.get("variant") or "classic"
+            for player_id in (room["player1_id"], room["player2_id"]):
+                if player_id and player_id != AI_PLAYER:
+                    _record(conn, player_id, variant, player_id == winner_id, shots, room.get("last_activity"))
+    return len(games)
+
+
+def main():
+    import storage
+
+    parser = argparse.ArgumentParser(description="Player statistics maintenance")
+    parser.add_argument("--rebuild", action="store_true", help="由 game 與 game_archive 重算 player_stats")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                     "instance", "naval_chess.db"),
+                        help="主檔路徑；分 shard 時（STORAGE_BACKEND=sharded）一併讀取同目錄 shards/ 下的檔案")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("請指定 --rebuild")
+    if not os.path.exists(args.db):
+        parser.error(f"找不到資料庫：{args.db}")
+    if storage.BACKEND == "memory":
+        parser.error("記憶體資料庫無法從外部重建")
+
+    store = storage.from_env(args.db)
+    try:
+        with ExitStack() as stack:
+            conn = stack.enter_context(closing(store.main.connect()))
+            with closing(conn.cursor()) as cur:
+                init_stats(cur)
+            sources = [stack.enter_context(closing(shard.connect())) for shard in store.shards] \
+                if store.sharded else None
+            print(f"已由 {rebuild(conn, sources)} 局重建玩家戰績")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""SQLite 儲存層：app.py 的 fetchone / execute / transaction 經由這裡取得連線。
+
+- sqlite（預設）：單一檔案 instance/naval_chess.db，與原本相同。
+- sharded：房間依 room_id 雜湊分到 STORAGE_SHARDS 個檔案（instance/shards/naval_chess-<i>.db），
+  每個 shard 有自己的寫入鎖與連線池，不同房間的下子不再搶同一把鎖。
+- memory：共用快取的記憶體資料庫（可搭配 STORAGE_SHARDS），只供壓測與基準使用，程序結束即消失。
+
+房間資料（game、move_log、game_archive）依 room_id 放在所屬 shard；
+全域資料（player_stats、socketio_queue）留在主檔。shard 連線會 ATTACH 主檔，
+未加 schema 前綴的 player_stats 會解析到主檔，stats.finish_game 因此仍在同一個 transaction 內
+同時更新 game 與 player_stats（WAL 模式下跨檔提交不保證崩潰時的原子性，必要時以 stats --rebuild 重算）。
+"""
+import os
+import time
+import zlib
+import sqlite3
+from contextlib import closing, contextmanager
+
+import metrics
+
+BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")        # sqlite / sharded / memory
+SHARDS = int(os.environ.get("STORAGE_SHARDS", "1" if BACKEND == "sqlite" else "4"))
+POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", "4"))     # 每個 shard 保留的閒置連線數；0 = 每次都開新連線
+BACKENDS = ("sqlite", "sharded", "memory")
+ATTACH_AS = "shared"
+
+SHARD_WRITE_LATENCY = metrics.histogram(
+    "naval_db_shard_write_seconds", "各 shard 寫入（含等待寫入鎖）的時間", ("shard",))
+
+
+class Shard:
+    """一個資料庫檔案與它的連線池"""
+
+    def __init__(self, label, target, uri=False, attach=None):
+        self.label = label
+        self.target = target
+        self.uri = uri
+        self.attach = attach  # 要 ATTACH 的主檔（只有 shard 需要）
+        self._idle = []
+        self.write_latency = SHARD_WRITE_LATENCY.labels(label)
+
+    def connect(self):
+        """開一條新連線（呼叫端負責關閉）"""
+        conn = sqlite3.connect(self.target, uri=self.uri, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL;")
+        if self.attach:
+            conn.execute(f"ATTACH DATABASE ? AS {ATTACH_AS}", (self.attach,))
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """從連線池借一條連線，用完歸還；同一時間一條連線只會借給一個呼叫端"""
+        conn = self._idle.pop() if self._idle else self.connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if len(self._idle) < POOL_SIZE:
+                self._idle.append(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def timed_write(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.write_latency.observe(time.perf_counter() - started)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class Storage:
+    """主檔 + N 個房間 shard；shards == 1 時主檔就是唯一的 shard"""
+
+    def __init__(self, backend, main_path, shards=1):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的 STORAGE_BACKEND：{backend}（可用：{', '.join(BACKENDS)}）")
+        if shards < 1:
+            raise ValueError("STORAGE_SHARDS 必須是正整數")
+        if backend == "sqlite" and shards != 1:
+            raise ValueError("多個 shard 請使用 STORAGE_BACKEND=sharded")
+        self.backend = backend
+        self._keep_alive = []
+
+        if backend == "memory":
+            # 共用快取的具名記憶體資料庫；至少要有一條連線開著，資料才不會消失
+            name = os.path.splitext(os.path.basename(main_path))[0]
+            main = f"file:{name}?mode=memory&cache=shared"
+            shard_targets = [f"file:{name}-{i}?mode=memory&cache=shared" for i in range(shards)]
+            uri = True
+        else:
+            main = main_path
+            stem = os.path.splitext(os.path.basename(main_path))[0]
+            shard_dir = os.path.join(os.path.dirname(main_path), "shards")
+            shard_targets = [os.path.join(shard_dir, f"{stem}-{i}.db") for i in range(shards)]
+            uri = False
+            if shards > 1:
+                os.makedirs(shard_dir, exist_ok=True)
+
+        self.main = Shard("main" if shards > 1 else "0", main, uri=uri)
+        if shards == 1:
+            self.shards = [self.main]
+        else:
+            self.shards = [Shard(str(i), target, uri=uri, attach=main) for i, target in enumerate(shard_targets)]
+
+        if backend == "memory":
+            self._keep_alive = [shard.connect() for shard in {id(s): s for s in [self.main, *self.shards]}.values()]
+
+    @property
+    def sharded(self):
+        return len(self.shards) > 1
+
+    def shard_for(self, room_id):
+        """房間所屬的 shard；用 crc32 而不是 hash()，不同程序、重啟後都一樣"""
+        if len(self.shards) == 1:
+            return self.shards[0]
+        return self.shards[zlib.crc32(str(room_id).encode("utf-8")) % len(self.shards)]
+
+    def connection(self, room_id=None):
+        """room_id 為 None 時取主檔（全域資料）的連線，否則取該房間所屬 shard 的連線"""
+        return (self.main if room_id is None else self.shard_for(room_id)).connection()
+
+    def fetchone_any(self, sql, params=()):
+        """依序查每個 shard，回傳第一個有結果的那一列（例如找一個等待中的房間）"""
+        for shard in self.shards:
+            with shard.connection() as conn:
+                row = conn.execute(sql, params).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def fetchall_shards(self, sql, params=()):
+        """合併所有 shard 的結果（不保證順序）"""
+        rows = []
+        for shard in self.shards:
+            with shard.connection() as conn:
+                rows.extend(conn.execute(sql, params).fetchall())
+        return rows
+
+    def init(self, init_main, init_shard):
+        """建表：init_main(cur) 在主檔，init_shard(cur) 在每個 shard（單檔時兩者都在同一個檔）"""
+        with closing(self.main.connect()) as conn:
+            with closing(conn.cursor()) as cur:
+                init_main(cur)
+                self._check_layout(cur)
+            conn.commit()
+        for shard in self.shards:
+            with closing(shard.connect()) as conn:
+                with closing(conn.cursor()) as cur:
+                    init_shard(cur)
+                conn.commit()
+
+    def _check_layout(self, cur):
+        """shard 數量改變時房間會被雜湊到別的檔案，舊房間就找不到了，直接拒絕啟動"""
+        cur.execute("CREATE TABLE IF NOT EXISTS storage_meta (key VARCHAR(50) PRIMARY KEY, value TEXT)")
+        row = cur.execute("SELECT value FROM storage_meta WHERE key = 'shards'").fetchone()
+        if row is None:
+            has_rooms = cur.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'game'").fetchone()
+            if self.sharded and has_rooms and cur.execute("SELECT 1 FROM game LIMIT 1").fetchone():
+                raise RuntimeError("主檔已有單檔模式的房間資料，改用多個 shard 前請先清空或換一個資料目錄")
+            # 多個 worker 同時啟動時可能已被別人寫入，改以實際存下的值檢查
+            cur.execute("INSERT OR IGNORE INTO storage_meta (key, value) VALUES ('shards', ?)", (str(len(self.shards)),))
+            row = cur.execute("SELECT value FROM storage_meta WHERE key = 'shards'").fetchone()
+        if int(row[0]) != len(self.shards):
+            raise RuntimeError(f"資料庫是以 {row[0]} 個 shard 建立的，目前設定為 {len(self.shards)} 個；"
+                               "請沿用原本的 STORAGE_SHARDS 或換一個資料目錄")
+
+    def close(self):
+        for shard in {id(s): s for s in [self.main, *self.shards]}.values():
+            shard.close()
+        for conn in self._keep_alive:
+            conn.close()
+        self._keep_alive = []
+
+
+def from_env(main_path):
+    return Storage(BACKEND, main_path, SHARDS)
@@ -0,0 +1,264 @@
+"""無頭壓力測試：模擬大量玩家（PVP 配對與 PVE）自動加入遊戲並連續出招。
+
+用法（伺服器需先啟動）：
+    uv run --extra loadtest python test/load_test.py --url http://localhost:5000 --pvp-pairs 500 --pve 100 --move-delay 0.2
+
+輸出加入延遲、出招往返延遲百分位數、錯誤率與每秒完成局數。
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai.battleship_board import generate_board  # noqa: E402
+from ai.utils import BOARD_SIZE  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+class Stats:
+    def __init__(self):
+        self.join_latency = []
+        self.move_rtt = []
+        self.errors = Counter()
+        self.moves = 0
+        self.games_finished = 0
+        self.players_started = 0
+        self.redirects = 0
+
+    def summary(self, elapsed):
+        def dist(values):
+            return {
+                "count": len(values),
+                "p50_ms": _ms(percentile(values, 50)),
+                "p90_ms": _ms(percentile(values, 90)),
+                "p99_ms": _ms(percentile(values, 99)),
+                "max_ms": _ms(max(values) if values else None),
+            }
+        total_errors = sum(self.errors.values())
+        return {
+            "players": self.players_started,
+            "elapsed_s": round(elapsed, 2),
+            "join": dist(self.join_latency),
+            "move_rtt": dist(self.move_rtt),
+            "moves": self.moves,
+            "games_finished": self.games_finished,
+            "games_per_s": round(self.games_finished / elapsed, 3) if elapsed else 0,
+            "redirects": self.redirects,
+            "errors": dict(self.errors),
+            "error_rate": round(total_errors / max(1, self.moves + len(self.join_latency)), 4),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class SimPlayer:
+    """單一模擬玩家：連線 -> join_game -> 輪到自己就隨機挑未打過的格子攻擊"""
+
+    def __init__(self, url, stats, is_ai_game, move_delay, timeout, games):
+        self.url = url
+        self.stats = stats
+        self.is_ai_game = is_ai_game
+        self.move_delay = move_delay
+        self.timeout = timeout
+        self.games_left = games
+        self.player_id = str(uuid.uuid4())
+        self.done = asyncio.Event()
+        self.sio = None
+
+    def _new_client(self):
+        sio = socketio.AsyncClient(reconnection=False)
+        sio.on('joined_game', self.on_joined)
+        sio.on('match_success', self.on_joined)
+        sio.on('game_started', self.on_game_started)
+        sio.on('move_made', self.on_move_made)
+        sio.on('game_over', self.on_game_over)
+        sio.on('redirect', self.on_redirect)
+        sio.on('room_expired', self.on_room_expired)
+        sio.on('error', self.on_error)
+        return sio
+
+    async def run(self):
+        self.stats.players_started += 1
+        try:
+            await self.connect(self.url)
+            await self.join()
+            while not self.done.is_set():
+                try:
+                    await asyncio.wait_for(self.done.wait(), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    if self.pending_move and time.perf_counter() - self.pending_move[2] > self.timeout:
+                        self.stats.errors['move_timeout'] += 1
+                        self.done.set()
+                    elif not self.room_id:
+                        self.stats.errors['join_timeout'] += 1
+                        self.done.set()
+        except Exception as e:
+            self.stats.errors[type(e).__name__] += 1
+        finally:
+            if self.sio and self.sio.connected:
+                await self.sio.disconnect()
+
+    async def connect(self, url):
+        if self.sio and self.sio.connected:
+            await self.sio.disconnect()
+        self.sio = self._new_client()
+        await self.sio.connect(url, transports=['websocket'])
+
+    async def join(self):
+        setup = generate_board()
+        self.room_id = None
+        self.untried = list(range(BOARD_SIZE * BOARD_SIZE))
+        random.shuffle(self.untried)
+        self.pending_move = None
+        self.join_started = time.perf_counter()
+        await self.sio.emit('join_game', {
+            "player_id": self.player_id,
+            "board": setup["board"],
+            "ships": setup["ships"],
+            "is_ai_game": self.is_ai_game,
+        })
+
+    async def fire(self):
+        if not self.untried or not self.room_id:
+            return
+        if self.move_delay:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.move_delay)
+        # 等待期間對局可能已結束並斷線
+        if self.done.is_set() or not self.sio.connected:
+            return
+        action = self.untried.pop()
+        x, y = divmod(action, BOARD_SIZE)
+        self.pending_move = (x, y, time.perf_counter())
+        await self.sio.emit('make_move', {
+            'room_id': self.room_id,
+            'player': self.player_id,
+            'x': x,
+            'y': y,
+        })
+
+    # --- 事件 ---
+
+    async def on_joined(self, data):
+        if self.room_id is None:
+            self.stats.join_latency.append(time.perf_counter() - self.join_started)
+        self.room_id = data['room_id']
+
+    async def on_game_started(self, data):
+        if data['first_turn'] == self.player_id:
+            await self.fire()
+
+    async def on_move_made(self, data):
+        if data['attacker'] == self.player_id:
+            if self.pending_move and (data['x'], data['y']) == self.pending_move[:2]:
+                self.stats.move_rtt.append(time.perf_counter() - self.pending_move[2])
+                self.stats.moves += 1
+                self.pending_move = None
+            if data['hit']:
+                await self.fire()
+        elif not data['hit']:
+            await self.fire()
+
+    async def on_game_over(self, data):
+        self.stats.games_finished += 1
+        self.games_left -= 1
+        if self.games_left > 0:
+            await self.join()
+        else:
+            self.done.set()
+
+    async def on_redirect(self, data):
+        self.stats.redirects += 1
+        await self.connect(data['url'])
+        await self.join()
+
+    async def on_room_expired(self, data):
+        self.stats.errors['room_expired'] += 1
+        self.done.set()
+
+    async def on_error(self, data):
+        self.stats.errors[data.get('message', 'error') if isinstance(data, dict) else 'error'] += 1
+        # 出招被拒（例如還沒輪到自己）就把這次出招視為結束，等下一個 move_made
+        self.pending_move = None
+
+
+async def run_load(args):
+    stats = Stats()
+    players = []
+    for _ in range(args.pvp_pairs * 2):
+        players.append(SimPlayer(args.url, stats, False, args.move_delay, args.timeout, args.games))
+    for _ in range(args.pve):
+        players.append(SimPlayer(args.url, stats, True, args.move_delay, args.timeout, args.games))
+
+    started = time.perf_counter()
+    tasks = []
+    step = args.ramp_up / len(players) if players else 0
+    for player in players:
+        tasks.append(asyncio.create_task(player.run()))
+        if step:
+            await asyncio.sleep(step)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=args.duration or None)
+    except asyncio.TimeoutError:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        stats.errors['run_timeout'] += sum(1 for p in players if not p.done.is_set())
+
+    return stats.summary(time.perf_counter() - started)
+
+
+def print_report(summary):
+    print(f"\n玩家數：{summary['players']}，耗時 {summary['elapsed_s']}s")
+    for key, label in (("join", "加入延遲"), ("move_rtt", "出招往返")):
+        d = summary[key]
+        print(f"{label}：n={d['count']} p50={d['p50_ms']}ms p90={d['p90_ms']}ms "
+              f"p99={d['p99_ms']}ms max={d['max_ms']}ms")
+    print(f"出招數：{summary['moves']}，完成局數：{summary['games_finished']}（{summary['games_per_s']} 局/秒）")
+    print(f"錯誤率：{summary['error_rate']}，錯誤：{summary['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Naval chess load generator")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--pvp-pairs", type=int, default=10, help="PVP 玩家對數")
+    parser.add_argument("--pve", type=int, default=0, help="PVE 玩家數")
+    parser.add_argument("--games", type=int, default=1, help="每位玩家連續玩幾局")
+    parser.add_argument("--move-delay", type=float, default=0.1, help="出招間隔（秒，±50%% 隨機）")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="在幾秒內把所有玩家陸續連上")
+    parser.add_argument("--timeout", type=float, default=30.0, help="單次等待回應的逾時（秒）")
+    parser.add_argument("--duration", type=float, default=0, help="整體時間上限（秒），0 表示不限")
+    parser.add_argument("--json", help="另存結果為 JSON")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    summary = asyncio.run(run_load(args))
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""重播 traffic.py 錄下的線上流量，量測各事件 / REST 呼叫的延遲百分位數，並可與基準結果比較。
+
+用法（伺服器需先啟動）：
+    uv run --extra loadtest python test/replay.py instance/traffic/traffic-XXXX.ndjson.gz --speed 4 --json runs/base.json
+    uv run --extra loadtest python test/replay.py instance/traffic/traffic-XXXX.ndjson.gz --speed 4 --baseline runs/base.json
+
+每個錄到的連線對應一個重播客戶端，依錄製時的時間點（除以 --speed）依序送出同樣的事件；
+錄製檔內的 room_id 在重播時換成伺服器新分配的房間（依 "room" 紀錄對應）。
+延遲為送出事件到收到對應回覆（例如 make_move -> move_made / error）的時間，REST 為 HTTP 往返時間。
+伺服器端的隨機性（先手、AI 出招）會讓對局走向與錄製時不同，出招被拒等錯誤回覆會另外計數，仍計入延遲。
+有 --baseline 時，任一項 p50 / p99 比基準慢超過 --tolerance（且超過 --min-delta-ms）即以結束碼 1 結束；
+樣本少於 100 的項目只比 p50。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter, defaultdict, deque
+
+import aiohttp
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec  # noqa: E402
+import traffic  # noqa: E402
+from load_test import percentile, _ms  # noqa: E402
+
+# 送出的事件 -> 視為其回覆的事件
+RESPONSES = {
+    "join_game": ("joined_game", "match_success", "redirect", "error"),
+    "make_move": ("move_made", "redirect", "error"),
+    "update_board": ("board_update", "board_delta", "error"),
+    "spectate": ("spectator_snapshot", "spectator_catchup", "error"),
+    "set_codec": ("codec_set",),
+}
+ROOM_WAIT = 5.0  # 秒；事件引用的房間還沒對應到新房間時最多等多久
+P99_MIN_COUNT = 100  # 樣本少於此數時 p99 幾乎就是最大值，只比 p50
+
+
+class Results:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = Counter()
+        self.timeouts = Counter()
+        self.sent = Counter()
+        self.unmapped_rooms = 0
+        self.max_lag = 0.0
+
+    def summary(self, elapsed, speed, source):
+        keys = sorted(set(self.latency) | set(self.sent))
+        return {
+            "source": os.path.basename(source),
+            "speed": speed,
+            "elapsed_s": round(elapsed, 2),
+            "sent": sum(self.sent.values()),
+            "max_lag_ms": _ms(self.max_lag),
+            "unmapped_rooms": self.unmapped_rooms,
+            "calls": {key: {
+                "sent": self.sent[key],
+                "count": len(self.latency[key]),
+                "p50_ms": _ms(percentile(self.latency[key], 50)),
+                "p90_ms": _ms(percentile(self.latency[key], 90)),
+                "p99_ms": _ms(percentile(self.latency[key], 99)),
+                "max_ms": _ms(max(self.latency[key]) if self.latency[key] else None),
+                "errors": self.errors[key],
+                "timeouts": self.timeouts[key],
+            } for key in keys},
+        }
+
+
+class Replayer:
+    def __init__(self, url, speed, timeout):
+        self.url = url.rstrip("/")
+        self.speed = speed
+        self.timeout = timeout
+        self.results = Results()
+        self.clients = {}
+        self.rooms = {}          # 錄製檔的 room token -> 伺服器新分配的 room_id
+        self.room_mapped = defaultdict(asyncio.Event)
+        self.http = None
+
+    def map_room(self, token, room_id):
+        self.rooms[token] = room_id
+        self.room_mapped[token].set()
+
+    async def live_room(self, token):
+        if not isinstance(token, str) or token in self.rooms:
+            return self.rooms.get(token, token)
+        try:
+            await asyncio.wait_for(self.room_mapped[token].wait(), ROOM_WAIT)
+        except asyncio.TimeoutError:
+            # 錄製開始前就存在的房間：照原樣送出，伺服器會回「房間不存在」
+            self.results.unmapped_rooms += 1
+            self.rooms[token] = token
+        return self.rooms[token]
+
+    async def with_live_rooms(self, payload):
+        if isinstance(payload, dict) and "room_id" in payload:
+            payload = dict(payload, room_id=await self.live_room(payload["room_id"]))
+        return payload
+
+    def client(self, index):
+        if index not in self.clients:
+            self.clients[index] = ReplayClient(self, index)
+        return self.clients[index]
+
+    async def request(self, method, rule, path, query, body):
+        key = f"{method} {rule}"
+        self.results.sent[key] += 1
+        query = await self.with_live_rooms(query)
+        body = await self.with_live_rooms(body)
+        started = time.perf_counter()
+        try:
+            async with self.http.request(method, self.url + path, params=query or None, json=body,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                await response.read()
+                if response.status >= 500:
+                    self.results.errors[key] += 1
+        except asyncio.TimeoutError:
+            self.results.timeouts[key] += 1
+            return
+        except aiohttp.ClientError:
+            self.results.errors[key] += 1
+            return
+        self.results.latency[key].append(time.perf_counter() - started)
+
+    async def run(self, records):
+        tasks = []
+        self.http = aiohttp.ClientSession()
+        started = time.perf_counter()
+        try:
+            for record in records:
+                t_ms, kind = record[0], record[1]
+                delay = started + t_ms / 1000 / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.results.max_lag = max(self.results.max_lag, -delay)
+
+                if kind == "r":
+                    tasks.append(asyncio.create_task(self.request(*record[2:7])))
+                elif kind == "room":
+                    self.client(record[2]).add_room_token(record[3])
+                else:
+                    self.client(record[2]).queue.put_nowait(record)
+
+            for client in self.clients.values():
+                client.queue.put_nowait(None)
+            await asyncio.gather(*(client.task for client in self.clients.values()), *tasks,
+                                 return_exceptions=True)
+        finally:
+            await asyncio.gather(*(client.close() for client in self.clients.values()), return_exceptions=True)
+            await self.http.close()
+        return time.perf_counter() - started
+
+
+class ReplayClient:
+    """一個錄到的連線：依序送出它的事件，並把收到的回覆對回送出的事件"""
+
+    def __init__(self, replayer, index):
+        self.replayer = replayer
+        self.results = replayer.results
+        self.index = index
+        self.queue = asyncio.Queue()
+        # 錄製時分到的房間與重播時分到的房間依序配對；兩邊誰先到都可能
+        self.room_tokens = deque()
+        self.unclaimed_rooms = deque()
+        self.live_rooms = set()
+        self.players = set()         # 這個連線 join_game 用過的 player_id，用來辨認自己的 move_made
+        self.pending = defaultdict(deque)  # 事件 -> deque[送出時間]
+        self.sio = None
+        self.task = asyncio.create_task(self.run())
+
+    def add_room_token(self, token):
+        if self.unclaimed_rooms:
+            self.replayer.map_room(token, self.unclaimed_rooms.popleft())
+        else:
+            self.room_tokens.append(token)
+
+    async def connect(self, codec_name=None):
+        await self.close()
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("*", self.on_any)
+        url = self.replayer.url + (f"?codec={codec_name}" if codec_name else "")
+        await self.sio.connect(url, transports=["websocket"], wait_timeout=self.replayer.timeout)
+
+    async def close(self):
+        if self.sio is not None and self.sio.connected:
+            await self.sio.disconnect()
+
+    async def run(self):
+        while True:
+            record = await self.queue.get()
+            if record is None:
+                break
+            try:
+                await self.handle(record)
+            except Exception as e:
+                self.results.errors[f"client:{type(e).__name__}"] += 1
+        # 等最後送出的事件回覆
+        deadline = time.perf_counter() + self.replayer.timeout
+        while any(self.pending.values()) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        for event, sent in self.pending.items():
+            self.results.timeouts[event] += len(sent)
+        await self.close()
+
+    async def handle(self, record):
+        kind = record[1]
+        if kind == "c":
+            await self.connect(record[3])
+        elif kind == "d":
+            await self.close()
+        elif kind == "e":
+            event, payload = record[3], record[4]
+            if self.sio is None or not self.sio.connected:
+                # 錄製開始前就已連線的客戶端
+                await self.connect()
+            payload = await self.replayer.with_live_rooms(payload)
+            if event == "join_game" and isinstance(payload, dict):
+                self.players.add(payload.get("player_id"))
+            self.results.sent[event] += 1
+            if event in RESPONSES:
+                self.pending[event].append(time.perf_counter())
+            await self.sio.emit(event, payload)
+
+    def match(self, event, data):
+        """找出這個回覆對應的送出事件（最早送出、且回覆類型相符的那個）"""
+        candidates = [name for name, sent in self.pending.items() if sent and event in RESPONSES[name]]
+        if event == "move_made" and not (isinstance(data, dict) and data.get("attacker") in self.players):
+            return None
+        if event == "error" and isinstance(data, dict) and data.get("event") in candidates:
+            return data["event"]
+        return min(candidates, key=lambda name: self.pending[name][0], default=None)
+
+    async def on_any(self, event, data=None):
+        data = codec.decode_incoming(data)
+        if event in ("joined_game", "match_success") and isinstance(data, dict):
+            room_id = data.get("room_id")
+            if room_id not in self.live_rooms:
+                self.live_rooms.add(room_id)
+                if self.room_tokens:
+                    self.replayer.map_room(self.room_tokens.popleft(), room_id)
+                else:
+                    self.unclaimed_rooms.append(room_id)
+
+        name = self.match(event, data)
+        if name is None:
+            return
+        sent_at = self.pending[name].popleft()
+        now = time.perf_counter()
+        if now - sent_at > self.replayer.timeout:
+            self.results.timeouts[name] += 1
+            return
+        self.results.latency[name].append(now - sent_at)
+        if event == "error":
+            self.results.errors[name] += 1
+
+
+# ----------------------------
+# 與基準比較
+# ----------------------------
+def compare(baseline, current, tolerance=0.2, min_delta_ms=2.0, min_count=20):
+    """回傳 (rows, regressions)；樣本數不足 min_count 的項目只列出不判定，不足 P99_MIN_COUNT 的只判定 p50"""
+    rows, regressions = [], []
+    for key in sorted(set(baseline["calls"]) | set(current["calls"])):
+        base, cur = baseline["calls"].get(key), current["calls"].get(key)
+        row = {"key": key, "base": base, "current": cur, "regressed": []}
+        count = min(base["count"], cur["count"]) if base and cur else 0
+        if count >= min_count:
+            for stat in ("p50_ms", "p99_ms") if count >= P99_MIN_COUNT else ("p50_ms",):
+                if base[stat] is None or cur[stat] is None:
+                    continue
+                if cur[stat] - base[stat] > max(min_delta_ms, base[stat] * tolerance):
+                    row["regressed"].append(stat)
+            if row["regressed"]:
+                regressions.append(key)
+        rows.append(row)
+    return rows, regressions
+
+
+def _change(base, cur, stat):
+    if not base or not cur or base[stat] is None or cur[stat] is None:
+        return "-"
+    if not base[stat]:
+        return f"{cur[stat]}ms"
+    return f"{(cur[stat] / base[stat] - 1) * 100:+.0f}%"
+
+
+def print_comparison(rows):
+    print(f"\n{'項目':<36} {'基準 p50/p99':>18} {'本次 p50/p99':>18} {'p50':>7} {'p99':>7}")
+    for row in rows:
+        base, cur = row["base"], row["current"]
+        fmt = lambda d: f"{d['p50_ms']}/{d['p99_ms']}" if d else "-"
+        flag = "  <- 變慢" if row["regressed"] else ""
+        print(f"{row['key']:<36} {fmt(base):>18} {fmt(cur):>18} "
+              f"{_change(base, cur, 'p50_ms'):>7} {_change(base, cur, 'p99_ms'):>7}{flag}")
+
+
+def print_report(summary):
+    print(f"\n重播 {summary['source']}（{summary['speed']}x），耗時 {summary['elapsed_s']}s，"
+          f"送出 {summary['sent']} 筆，排程最大落後 {summary['max_lag_ms']}ms，未對應房間 {summary['unmapped_rooms']}")
+    for key, d in summary["calls"].items():
+        print(f"{key}：sent={d['sent']} n={d['count']} p50={d['p50_ms']}ms p90={d['p90_ms']}ms "
+              f"p99={d['p99_ms']}ms max={d['max_ms']}ms errors={d['errors']} timeouts={d['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded naval chess traffic")
+    parser.add_argument("recording", help="traffic.py 錄下的 .ndjson.gz 檔")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--speed", type=float, default=1.0, help="重播倍速（2 = 兩倍速）")
+    parser.add_argument("--timeout", type=float, default=10.0, help="等待單一回覆的逾時（秒）")
+    parser.add_argument("--json", help="另存結果為 JSON（可作為之後的 --baseline）")
+    parser.add_argument("--baseline", help="與先前 --json 存下的結果比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p50 / p99 容許變慢的比例")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="差距小於此毫秒數不算變慢（避免雜訊）")
+    parser.add_argument("--min-count", type=int, default=20, help="樣本數少於此值的項目不判定")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("speed 必須是正數")
+
+    try:
+        _, records = traffic.read(args.recording)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    replayer = Replayer(args.url, args.speed, args.timeout)
+    elapsed = asyncio.run(replayer.run(records))
+    summary = replayer.results.summary(elapsed, args.speed, args.recording)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(baseline, summary, args.tolerance, args.min_delta_ms, args.min_count)
+        print_comparison(rows)
+        if baseline.get("speed") != summary["speed"]:
+            print(f"\n注意：基準為 {baseline.get('speed')}x，本次為 {summary['speed']}x，延遲不一定可比")
+        if regressions:
+            print(f"\n{len(regressions)} 項變慢：{', '.join(regressions)}")
+            sys.exit(1)
+        print("\n沒有項目超過容許範圍")
+
+
+if __name__ == "__main__":
+    main()
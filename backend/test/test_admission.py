@@ -0,0 +1,144 @@
+"""准入控制：token bucket 的補充與突發上限、全域上限，以及 update_board 合併器的 single-flight 與 TTL。
+
+用法（在 backend/ 目錄下）：
+    uv run python test/test_admission.py
+    python -m pytest test/test_admission.py
+"""
+import os
+import sys
+
+import eventlet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admission  # noqa: E402
+
+
+class FakeClock:
+    """取代 admission 內的 time，測試不必真的等待"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def with_clock(test):
+    def wrapper():
+        real, admission.time = admission.time, FakeClock()
+        try:
+            test(admission.time)
+        finally:
+            admission.time = real
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@with_clock
+def test_token_bucket_burst_and_refill(clock):
+    bucket = admission.TokenBucket(burst=3)
+    assert [bucket.take(rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    # 突發額度用完：還差 1 個 token，每秒補 2 個 -> 0.5 秒
+    assert bucket.take(rate=2, burst=3) == 0.5
+
+    clock.now += 0.5
+    assert bucket.take(rate=2, burst=3) == 0
+    # 閒置再久也只補到突發上限
+    clock.now += 60
+    assert [bucket.take(rate=2, burst=3) for _ in range(4)][-1] > 0
+
+
+@with_clock
+def test_check_rejects_socket_and_player_rate(clock):
+    sid = "sid-rate"
+    try:
+        for _ in range(int(admission.SOCKET_BURST)):
+            assert admission.check("make_move", sid) is None
+        reason, retry_after = admission.check("make_move", sid)
+        assert reason == "socket_rate" and retry_after > 0
+
+        # 同一玩家從多個連線送出，共用玩家額度
+        for i in range(int(admission.PLAYER_BURST)):
+            assert admission.check("make_move", f"sid-tab-{i}", "player-x") is None
+        assert admission.check("make_move", "sid-tab-last", "player-x")[0] == "player_rate"
+    finally:
+        for key in [k for k in admission._socket_buckets if k.startswith("sid-")]:
+            admission.forget(key)
+        admission._player_buckets.pop("player-x", None)
+
+
+def test_check_rejects_when_overloaded():
+    held = [admission.inflight() for _ in range(admission.MAX_INFLIGHT)]
+    for ctx in held:
+        ctx.__enter__()
+    try:
+        assert admission.check("update_board", "sid-busy") == ("overloaded", 1.0)
+    finally:
+        for ctx in held:
+            ctx.__exit__(None, None, None)
+    assert admission.check("update_board", "sid-busy") is None
+    admission.forget("sid-busy")
+
+
+def test_coalescer_single_flight():
+    coalescer = admission.Coalescer("test", ttl=0)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        eventlet.sleep(0.01)  # 讓其他 greenthread 在計算期間到達
+        return ("board_state", {"n": len(calls)})
+
+    threads = [eventlet.spawn(coalescer.run, "room", 0, compute) for _ in range(5)]
+    results = [thread.wait() for thread in threads]
+    assert len(calls) == 1
+    assert results == [("board_state", {"n": 1})] * 5
+    # ttl=0（多 worker 模式）：完成後不重用
+    coalescer.run("room", 0, compute)
+    assert len(calls) == 2
+
+
+@with_clock
+def test_coalescer_ttl_and_invalidate(clock):
+    coalescer = admission.Coalescer("test", ttl=0.25)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert coalescer.run("room", 5, compute) == 1
+    clock.now += 0.2
+    assert coalescer.run("room", 5, compute) == 1
+    assert coalescer.run("room", 6, compute) == 2  # 不同 since 各算各的
+    clock.now += 0.1
+    assert coalescer.run("room", 5, compute) == 3  # 超過 TTL 重新計算
+
+    coalescer.invalidate("room")
+    assert coalescer.run("room", 5, compute) == 4
+
+
+def test_coalescer_error_is_not_cached():
+    coalescer = admission.Coalescer("test", ttl=10)
+
+    def fail():
+        raise RuntimeError("db down")
+
+    try:
+        coalescer.run("room", 0, fail)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("expected RuntimeError")
+    assert coalescer.run("room", 0, lambda: "ok") == "ok"
+
+
+if __name__ == "__main__":
+    test_token_bucket_burst_and_refill()
+    test_check_rejects_socket_and_player_rate()
+    test_check_rejects_when_overloaded()
+    test_coalescer_single_flight()
+    test_coalescer_ttl_and_invalidate()
+    test_coalescer_error_is_not_cached()
+    print("准入控制測試通過")
@@ -0,0 +1,112 @@
+"""批次啟發式（ai/utils.py 的 *_mask）與逐格版本的等價性測試。
+
+用法（在 backend/ 目錄下）：
+    uv run python test/test_batched_heuristics.py       # 另外印出速度比較
+    python -m pytest test/test_batched_heuristics.py    # 有安裝 pytest 時
+
+盤面取自實際對局的各個階段（隨機亂打與啟發式出招兩種），涵蓋命中、未中、擊沉與各種剩餘船隻組合。
+"""
+import os
+import sys
+import time
+import random
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.env import BattleshipEnv  # noqa: E402
+from ai.utils import (  # noqa: E402
+    VARIANTS, adjacent_mask, allowed_actions_mask, between_mask, get_all_adjacent_actions,
+    get_allowed_actions, get_between_actions, get_diagonal_actions, get_probability_actions,
+    is_near_missed_cluster, near_missed_cluster_mask, parity_mask, probability_density_batch,
+    probability_mask, stack_envs,
+)
+
+
+def sample_envs(variant, games, seed):
+    """每局在隨機的步數停下，回傳停在各階段的 env"""
+    size, ship_sizes = VARIANTS[variant]
+    random.seed(seed)
+    envs = []
+    for game in range(games):
+        env = BattleshipEnv(board_size=size, ship_sizes=ship_sizes)
+        heuristic = game % 2 == 0
+        for _ in range(random.randrange(size * size)):
+            actions = get_allowed_actions(env) if heuristic else env.available_actions()
+            _, _, done = env.step(random.choice(actions))
+            if done:
+                break
+        envs.append(env)
+    return envs
+
+
+def as_mask(actions, n):
+    mask = np.zeros(n * n, dtype=bool)
+    mask[list(actions)] = True
+    return mask
+
+
+def check_variant(variant, games=200, seed=0):
+    envs = sample_envs(variant, games, seed)
+    states, remaining = stack_envs(envs)
+    n = states.shape[-1]
+    flat = lambda mask: mask.reshape(len(envs), n * n)
+
+    between = flat(between_mask(states))
+    adjacent = flat(adjacent_mask(states))
+    near_missed = flat(near_missed_cluster_mask(states))
+    parity = flat(parity_mask(states))
+    probability = flat(probability_mask(states, remaining))
+    density = probability_density_batch(states, remaining)
+    allowed = allowed_actions_mask(states, remaining)
+
+    for k, env in enumerate(envs):
+        assert np.array_equal(between[k], as_mask(get_between_actions(env), n))
+        assert np.array_equal(adjacent[k], as_mask(get_all_adjacent_actions(env), n))
+        assert np.array_equal(near_missed[k], [is_near_missed_cluster(env, a) for a in range(n * n)])
+        assert np.array_equal(parity[k], as_mask(get_diagonal_actions(env), n))
+        assert np.array_equal(density[k], env.compute_probability_density())
+        assert np.array_equal(probability[k], as_mask(get_probability_actions(env), n))
+        assert np.array_equal(allowed[k], as_mask(get_allowed_actions(env), n)), (variant, k)
+
+
+def test_classic():
+    check_variant("classic")
+
+
+def test_large_boards():
+    check_variant("large", games=40, seed=1)
+
+
+def test_finished_and_fresh_games():
+    env_done = BattleshipEnv()
+    while not env_done.step(random.choice(env_done.available_actions()))[2]:
+        pass
+    envs = [BattleshipEnv(), env_done]
+    states, remaining = stack_envs(envs)
+    allowed = allowed_actions_mask(states, remaining)
+    assert np.array_equal(allowed[0], as_mask(get_allowed_actions(envs[0]), 10))
+    # 已擊沉全部船：與逐格版本一樣，只剩未攻擊格可選
+    assert np.array_equal(allowed[1], as_mask(get_allowed_actions(env_done), 10))
+
+
+def benchmark(games=1000):
+    envs = sample_envs("classic", games, seed=2)
+    states, remaining = stack_envs(envs)
+    started = time.perf_counter()
+    for env in envs:
+        get_allowed_actions(env)
+    scalar = time.perf_counter() - started
+    started = time.perf_counter()
+    allowed_actions_mask(states, remaining)
+    batched = time.perf_counter() - started
+    print(f"{games} 局：逐格 {scalar * 1000:.1f} ms，批次 {batched * 1000:.1f} ms（{scalar / batched:.1f}x）")
+
+
+if __name__ == "__main__":
+    test_classic()
+    test_large_boards()
+    test_finished_and_fresh_games()
+    print("等價性測試通過")
+    benchmark()
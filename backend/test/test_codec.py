@@ -0,0 +1,95 @@
+"""MessagePack 編碼：棋盤打包成 ExtType(1) 後解回來必須與 JSON 版本完全相同（10/20/30 三種大小），
+以及 JSON 抽樣量測的頻率與大小。
+
+用法（在 backend/ 目錄下）：
+    uv run --extra msgpack python test/test_codec.py
+    python -m pytest test/test_codec.py
+"""
+import os
+import sys
+import json
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from ai.battleship_board import generate_board  # noqa: E402
+from ai.utils import VARIANTS  # noqa: E402
+
+
+def as_json(payload):
+    """比較序列化後的字串，1 與 True 這類 Python 視為相等的值也分得出來"""
+    return json.dumps(payload, sort_keys=True)
+
+
+def round_trip(event, payload):
+    return as_json(codec.decode_msgpack(codec.encode_msgpack(event, payload)))
+
+
+def played_board(size, ship_sizes, seed):
+    """隨機打了一部分的棋盤：0 海 / 1 船 / 2 命中 / 3 未中"""
+    rng = random.Random(seed)
+    board = generate_board(size, ship_sizes)
+    grid = board["board"]
+    for _ in range(size * size // 3):
+        x, y = rng.randrange(size), rng.randrange(size)
+        grid[x][y] = 2 if grid[x][y] == 1 else 3
+    return board
+
+
+def test_grid_round_trip_all_variants():
+    assert codec.msgpack is not None, "需要安裝 msgpack（uv sync --extra msgpack）"
+    for seed, (variant, (size, ship_sizes)) in enumerate(VARIANTS.items()):
+        board = played_board(size, ship_sizes, seed)
+        payload = {"room_id": "r", "variant": variant, "board": board["board"], "ships": board["ships"], "seq": 7}
+        packed = codec.encode_msgpack("board_state", payload)
+        # 棋盤以 ExtType 打包：每格一個 byte，比 JSON 小
+        assert len(packed) < len(json.dumps(payload, separators=(",", ":")))
+        assert as_json(codec.decode_msgpack(packed)) == as_json(payload), variant
+
+
+def test_nested_and_edge_payloads():
+    size = VARIANTS["huge"][0]
+    payloads = [
+        # 觀戰快照：兩張遮蔽後的棋盤，player2 尚未加入
+        {"room_id": "r", "player1": [[0, 2, 3] * 10] * size, "player2": None, "status": "waiting", "seq": 0},
+        # 增量同步與 catch-up 的 changes 陣列
+        {"seq": 3, "changes": [{"seq": 3, "board": "player1", "x": 29, "y": 0, "value": 2}]},
+        [{"seq": 1, "board": "player2", "x": 0, "y": 9, "value": 3}],
+        # 看起來像棋盤但不能用 byte 打包的：超過 255、負數、長短不一、空的
+        {"grid": [[0, 256], [1, 2]]},
+        {"grid": [[0, -1], [1, 2]]},
+        {"grid": [[0, 1, 2], [1, 2]]},
+        {"grid": [[]], "empty": []},
+        # AI 出招序列是 [x, y] 的陣列，也會被當成 N x 2 的棋盤打包
+        {"ai_turns": [[0, 0], [29, 29], [15, 3]]},
+        # bool 不是格子值，必須保持 true/false
+        {"flags": [[True, False], [False, True]]},
+    ]
+    for payload in payloads:
+        assert round_trip("spectator_snapshot", payload) == as_json(payload), payload
+
+
+def test_decode_incoming_passes_json_through():
+    payload = {"room_id": "r", "player": "p1", "x": 3, "y": 4}
+    assert codec.decode_incoming(payload) is payload
+    assert codec.decode_incoming(codec.encode_msgpack("make_move", payload)) == payload
+
+
+def test_json_sampling():
+    event = "test_sampled_event"
+    child = codec.PAYLOAD_BYTES.labels(codec.JSON, event)
+    payload = {"board": [[0] * 10 for _ in range(10)], "seq": 1}
+    before = child.count
+    for _ in range(codec.JSON_SAMPLE_EVERY * 3):
+        codec.sample_json(event, payload)
+    assert child.count - before == 3
+    assert child.sum == 3 * len(json.dumps(payload, separators=(",", ":")))
+
+
+if __name__ == "__main__":
+    test_grid_round_trip_all_variants()
+    test_nested_and_edge_payloads()
+    test_decode_incoming_passes_json_through()
+    test_json_sampling()
+    print("編碼測試通過")
@@ -0,0 +1,168 @@
+"""回收器的狀態轉換：TTL 的判斷、以舊狀態為條件的更新，以及歸檔時 game + move_log 完整搬進 game_archive。
+
+用法（在 backend/ 目錄下）：
+    uv run python test/test_reaper.py
+    python -m pytest test/test_reaper.py
+"""
+import os
+import sys
+import json
+import zlib
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reaper  # noqa: E402
+
+
+def make_db(target=":memory:", uri=False):
+    conn = sqlite3.connect(target, uri=uri)
+    conn.row_factory = sqlite3.Row
+    # 與 app.init_room_tables 相同的欄位與觸發器（UPDATE 時 last_activity 會被改成現在）
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS game (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id VARCHAR(50) NOT NULL UNIQUE,
+            player1_id VARCHAR(50), player2_id VARCHAR(50),
+            player1_board TEXT, player2_board TEXT,
+            ai_field BOOLEAN DEFAULT 0, ai_turn_array TEXT, current_turn VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'waiting', winner_id VARCHAR(50),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP, last_activity DATETIME,
+            owner_worker INTEGER, move_seq INTEGER DEFAULT 0, variant VARCHAR(20) DEFAULT 'classic'
+        );
+        CREATE TABLE IF NOT EXISTS move_log (
+            room_id VARCHAR(50) NOT NULL, seq INTEGER NOT NULL, board VARCHAR(10) NOT NULL,
+            x INTEGER NOT NULL, y INTEGER NOT NULL, value INTEGER NOT NULL,
+            PRIMARY KEY (room_id, seq)
+        ) WITHOUT ROWID;
+        CREATE TRIGGER IF NOT EXISTS trg_game_touch_last_activity
+        AFTER UPDATE ON game
+        BEGIN
+            UPDATE game SET last_activity = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END;
+    """)
+    reaper.init_archive(conn.cursor())
+    return conn
+
+
+def add_room(conn, room_id, status, idle_seconds, moves=0):
+    """INSERT 不會觸發 last_activity 觸發器，可以直接寫入往前推的時間"""
+    conn.execute("""
+        INSERT INTO game (room_id, player1_id, player2_id, player1_board, status, last_activity, move_seq)
+        VALUES (?, 'alice', 'bob', '{"board": [[0]]}', ?, datetime('now', ?), ?)
+    """, (room_id, status, f"-{idle_seconds} seconds", moves))
+    conn.executemany("INSERT INTO move_log (room_id, seq, board, x, y, value) VALUES (?, ?, 'player2', ?, 0, 3)",
+                     [(room_id, seq, seq) for seq in range(1, moves + 1)])
+    conn.commit()
+
+
+def status_of(conn, room_id):
+    row = conn.execute("SELECT status FROM game WHERE room_id = ?", (room_id,)).fetchone()
+    return row["status"] if row else None
+
+
+def test_expire_respects_ttl():
+    conn = make_db()
+    add_room(conn, "waiting-old", "waiting", reaper.WAITING_TTL + 60)
+    add_room(conn, "waiting-new", "waiting", reaper.WAITING_TTL - 60)
+    add_room(conn, "playing-mid", "playing", reaper.WAITING_TTL + 60)
+    add_room(conn, "playing-old", "playing", reaper.PLAYING_TTL + 60)
+    add_room(conn, "finished-old", "finished", reaper.PLAYING_TTL + 60)
+
+    assert sorted(reaper.expire_idle_rooms(conn)) == ["playing-old", "waiting-old"]
+    assert status_of(conn, "waiting-old") == "expired"
+    assert status_of(conn, "waiting-new") == "waiting"
+    assert status_of(conn, "playing-mid") == "playing"
+    assert status_of(conn, "playing-old") == "expired"
+    assert status_of(conn, "finished-old") == "finished"
+    # 已過期的房間不會再被處理一次
+    assert reaper.expire_idle_rooms(conn) == []
+
+
+class JoinBeforeUpdate:
+    """在回收器 SELECT 之後、UPDATE 之前，模擬有玩家加入了等待中的房間"""
+
+    def __init__(self, conn, room_id):
+        self.conn = conn
+        self.room_id = room_id
+
+    def cursor(self):
+        proxy, conn, room_id = self, self.conn, self.room_id
+
+        class Cursor:
+            def __init__(self):
+                self._cur = conn.cursor()
+
+            def execute(self, sql, params=()):
+                if sql.lstrip().startswith("UPDATE") and room_id is not None:
+                    conn.execute("UPDATE game SET status = 'playing' WHERE room_id = ?", (room_id,))
+                    proxy.room_id = None
+                return self._cur.execute(sql, params)
+
+            def __getattr__(self, name):
+                return getattr(self._cur, name)
+
+        return Cursor()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_expire_skips_room_joined_after_select():
+    conn = make_db()
+    add_room(conn, "joined", "waiting", reaper.WAITING_TTL + 60)
+    add_room(conn, "idle", "waiting", reaper.WAITING_TTL + 60)
+
+    expired = reaper.expire_idle_rooms(JoinBeforeUpdate(conn, "joined"))
+    assert expired == ["idle"]
+    assert status_of(conn, "joined") == "playing"
+    assert status_of(conn, "idle") == "expired"
+
+
+def test_archive_batch_round_trip():
+    conn = make_db()
+    add_room(conn, "done", "finished", reaper.ARCHIVE_AFTER + 60, moves=3)
+    add_room(conn, "done-recent", "finished", reaper.ARCHIVE_AFTER - 60, moves=1)
+    add_room(conn, "live", "playing", reaper.ARCHIVE_AFTER + 60, moves=2)
+    original = dict(conn.execute("SELECT * FROM game WHERE room_id = 'done'").fetchone())
+
+    assert reaper.archive_batch(conn) == 1
+    assert status_of(conn, "done") is None
+    assert conn.execute("SELECT COUNT(*) FROM move_log WHERE room_id = 'done'").fetchone()[0] == 0
+    assert status_of(conn, "done-recent") == "finished"
+    assert conn.execute("SELECT COUNT(*) FROM move_log WHERE room_id IN ('done-recent', 'live')").fetchone()[0] == 3
+
+    archived = conn.execute("SELECT * FROM game_archive WHERE room_id = 'done'").fetchone()
+    assert (archived["id"], archived["status"]) == (original["id"], "finished")
+    record = json.loads(zlib.decompress(archived["payload"]))
+    assert record.pop("moves") == [[1, "player2", 1, 0, 3], [2, "player2", 2, 0, 3], [3, "player2", 3, 0, 3]]
+    assert record == original
+    assert reaper.archive_batch(conn) == 0
+
+
+def test_run_cycle_expires_then_archives_later():
+    target = "file:reaper-cycle?mode=memory&cache=shared"
+    keep_alive = make_db(target, uri=True)
+    try:
+        add_room(keep_alive, "stale", "waiting", reaper.WAITING_TTL + 60)
+        add_room(keep_alive, "done", "finished", reaper.ARCHIVE_AFTER + 60, moves=2)
+        notified = []
+
+        result = reaper.run_cycle(lambda: make_db(target, uri=True), notified.append, sleep=lambda _: None)
+        assert (result["expired"], result["archived"], result["batches"]) == (1, 1, 1)
+        assert notified == ["stale"]
+        # 剛過期的房間 last_activity 被觸發器更新，要再等 ARCHIVE_AFTER 才會歸檔
+        assert status_of(keep_alive, "stale") == "expired"
+        assert status_of(keep_alive, "done") is None
+
+        assert reaper.run_cycle(lambda: make_db(target, uri=True), sleep=lambda _: None)["archived"] == 0
+    finally:
+        keep_alive.close()
+
+
+if __name__ == "__main__":
+    test_expire_respects_ttl()
+    test_expire_skips_room_joined_after_select()
+    test_archive_batch_round_trip()
+    test_run_cycle_expires_then_archives_later()
+    print("回收器測試通過")
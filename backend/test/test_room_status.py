@@ -0,0 +1,107 @@
+"""make_move 的拒絕條件：已結束或被回收器標為 expired 的房間（歸檔前仍留在 game 表），
+以及超出該房間 variant 棋盤大小或不是整數的座標。
+
+用法（在 backend/ 目錄下）：
+    uv run python test/test_room_status.py
+    python -m pytest test/test_room_status.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reaper  # noqa: E402
+import storage  # noqa: E402
+
+# 在 import app 之前改用記憶體資料庫並關閉背景回收器，不碰 instance/ 下的資料
+storage.BACKEND, storage.SHARDS = "memory", 1
+reaper.ENABLED = False
+
+import app as server  # noqa: E402
+from ai.battleship_board import generate_board  # noqa: E402
+from ai.utils import get_variant  # noqa: E402
+
+
+def start_pvp_game(prefix, variant="classic"):
+    """兩個玩家配對成功，回傳 (room_id, 先手的 client, 先手的 player_id)"""
+    clients = {}
+    for player_id in (f"{prefix}-p1", f"{prefix}-p2"):
+        client = server.socketio.test_client(server.app)
+        board = generate_board(*get_variant(variant))
+        client.emit('join_game', {'player_id': player_id, 'board': board['board'], 'ships': board['ships'],
+                                  'variant': variant})
+        clients[player_id] = client
+    received = clients[f"{prefix}-p2"].get_received()
+    room_id = next(m['args'][0]['room_id'] for m in received if m['name'] == 'match_success')
+    first = next(m['args'][0]['first_turn'] for m in received if m['name'] == 'game_started')
+    for client in clients.values():
+        client.get_received()
+    return room_id, clients[first], first
+
+
+def events(client, name):
+    return [m['args'][0] for m in client.get_received() if m['name'] == name]
+
+
+def test_make_move_rejected_after_expire():
+    room_id, client, player = start_pvp_game("expire")
+    # 模擬回收器：閒置超過 TTL 的房間被標成 expired，但還沒歸檔
+    server.execute("UPDATE game SET status = 'expired' WHERE room_id = ?", (room_id,), room_id=room_id)
+
+    client.emit('make_move', {'room_id': room_id, 'player': player, 'x': 0, 'y': 0})
+    errors = events(client, 'error')
+    assert errors and errors[0]['status'] == 'expired'
+    room = server.fetchone("SELECT move_seq, status FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
+    assert (room['move_seq'], room['status']) == (0, 'expired')
+
+
+def test_make_move_rejected_after_finish():
+    room_id, client, player = start_pvp_game("finish")
+    server.execute("UPDATE game SET status = 'finished', winner_id = ? WHERE room_id = ?",
+                   (player, room_id), room_id=room_id)
+
+    client.emit('make_move', {'room_id': room_id, 'player': player, 'x': 0, 'y': 0})
+    received = client.get_received()
+    assert [m['args'][0]['status'] for m in received if m['name'] == 'error'] == ['finished']
+    assert not [m for m in received if m['name'] in ('move_made', 'game_over')]
+
+
+def test_ai_move_stops_on_expired_room():
+    room_id, _, _ = start_pvp_game("ai")
+    server.execute("UPDATE game SET status = 'expired', current_turn = 'ai' WHERE room_id = ?",
+                   (room_id,), room_id=room_id)
+    assert server.process_ai_move(room_id) is False
+    room = server.fetchone("SELECT move_seq FROM game WHERE room_id = ?", (room_id,), room_id=room_id)
+    assert room['move_seq'] == 0
+
+
+def move_seq(room_id):
+    return server.fetchone("SELECT move_seq FROM game WHERE room_id = ?", (room_id,), room_id=room_id)['move_seq']
+
+
+def test_make_move_rejects_bad_coordinates():
+    room_id, client, player = start_pvp_game("coords")
+    for x, y in ((-1, 0), (0, -1), (10, 0), (0, 10), ("3", 4), (1.5, 2), (True, 0)):
+        client.emit('make_move', {'room_id': room_id, 'player': player, 'x': x, 'y': y})
+        errors = events(client, 'error')
+        assert errors and '0 到 9' in errors[0]['message'], (x, y)
+    assert move_seq(room_id) == 0
+
+
+def test_make_move_uses_room_variant_size():
+    room_id, client, player = start_pvp_game("coords-large", variant="large")
+    client.emit('make_move', {'room_id': room_id, 'player': player, 'x': 20, 'y': 0})
+    assert events(client, 'error')
+    client.emit('make_move', {'room_id': room_id, 'player': player, 'x': 19, 'y': 15})
+    moves = events(client, 'move_made')
+    assert [(m['x'], m['y']) for m in moves] == [(19, 15)]
+    assert move_seq(room_id) == 1
+
+
+if __name__ == "__main__":
+    test_make_move_rejected_after_expire()
+    test_make_move_rejected_after_finish()
+    test_ai_move_stops_on_expired_room()
+    test_make_move_rejects_bad_coordinates()
+    test_make_move_uses_room_variant_size()
+    print("房間狀態測試通過")
@@ -0,0 +1,89 @@
+"""stats.rebuild 的砲數必須與即時路徑（finish_game + shots_fired）一致，舊資料沒有 move_log 也一樣。
+
+用法（在 backend/ 目錄下）：
+    uv run python test/test_stats_rebuild.py
+    python -m pytest test/test_stats_rebuild.py
+"""
+import os
+import sys
+import json
+import zlib
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reaper  # noqa: E402
+import stats  # noqa: E402
+
+
+def make_db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    # 升級前的 game 表：只有最早的欄位，也沒有 move_log
+    conn.execute("""
+        CREATE TABLE game (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id VARCHAR(50) NOT NULL UNIQUE,
+            player1_id VARCHAR(50), player2_id VARCHAR(50),
+            player1_board TEXT, player2_board TEXT,
+            ai_field BOOLEAN DEFAULT 0, ai_turn_array TEXT, current_turn VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'waiting', winner_id VARCHAR(50),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP, last_activity DATETIME
+        )
+    """)
+    conn.execute("CREATE TABLE move_log (room_id, seq, board, x, y, value)")
+    reaper.init_archive(conn.cursor())
+    stats.init_stats(conn.cursor())
+    return conn
+
+
+def board_with_shots(hits, misses):
+    board = [[0] * 10 for _ in range(10)]
+    cells = [(r, c) for r in range(10) for c in range(10)]
+    for r, c in cells[:hits]:
+        board[r][c] = 2
+    for r, c in cells[hits:hits + misses]:
+        board[r][c] = 3
+    for r, c in cells[hits + misses:hits + misses + 3]:
+        board[r][c] = 1
+    return json.dumps({"board": board, "ships": []})
+
+
+def test_rebuild_from_game_without_move_log():
+    conn = make_db()
+    # alice（player1）獲勝：輸家是 player2，棋盤上 17 命中 + 20 未中
+    conn.execute("""
+        INSERT INTO game (room_id, player1_id, player2_id, player1_board, player2_board, status, winner_id)
+        VALUES ('r1', 'alice', 'bob', ?, ?, 'finished', 'alice')
+    """, (board_with_shots(5, 5), board_with_shots(17, 20)))
+
+    assert stats.rebuild(conn) == 1
+    alice = stats.player_stats(conn, "alice")["variants"]["classic"]
+    assert alice["best_shots"] == 37
+    assert alice["avg_shots_to_win"] == 37.0
+    row = conn.execute("SELECT win_shots FROM player_stats WHERE player_id = 'alice'").fetchone()
+    assert row["win_shots"] == 37
+    bob = stats.player_stats(conn, "bob")["variants"]["classic"]
+    assert (bob["losses"], bob["best_shots"]) == (1, None)
+
+
+def test_rebuild_from_archive_payload():
+    conn = make_db()
+    record = {
+        "room_id": "r2", "player1_id": "carol", "player2_id": "ai", "status": "finished", "winner_id": "carol",
+        "player1_board": board_with_shots(3, 3), "player2_board": board_with_shots(17, 8),
+        "variant": "classic", "last_activity": "2024-01-01 00:00:00", "moves": [],
+    }
+    conn.execute("INSERT INTO game_archive (room_id, status, winner_id, payload) VALUES ('r2', 'finished', 'carol', ?)",
+                 (zlib.compress(json.dumps(record).encode("utf-8")),))
+
+    assert stats.rebuild(conn) == 1
+    carol = stats.player_stats(conn, "carol")["variants"]["classic"]
+    assert (carol["wins"], carol["best_shots"]) == (1, 25)
+    assert stats.player_stats(conn, "ai") is None
+
+
+if __name__ == "__main__":
+    test_rebuild_from_game_without_move_log()
+    test_rebuild_from_archive_payload()
+    print("重建測試通過")
@@ -0,0 +1,143 @@
+"""儲存層：sqlite / sharded / memory 三種後端都能建立並讀回房間，房間固定落在 crc32 選到的 shard，
+跨 shard 查詢找得到每個房間，且 shard 數量改變時拒絕啟動。
+
+用法（在 backend/ 目錄下）：
+    uv run python test/test_storage.py
+    python -m pytest test/test_storage.py
+"""
+import os
+import sys
+import uuid
+import zlib
+import shutil
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+BACKENDS = [("sqlite", 1), ("sharded", 4), ("memory", 1), ("memory", 3)]
+ROOMS = [f"room-{i}" for i in range(40)]
+
+
+def init_main(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS player_stats (player_id VARCHAR(50) PRIMARY KEY, wins INTEGER DEFAULT 0)")
+
+
+def init_shard(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS game (
+            room_id VARCHAR(50) PRIMARY KEY, player1_id VARCHAR(50), status VARCHAR(20) DEFAULT 'waiting'
+        )
+    """)
+
+
+def open_storage(backend, shards, directory):
+    # memory 後端以檔名當共用快取的名稱，每個測試各用一個，互不干擾
+    store = storage.Storage(backend, os.path.join(directory, f"naval-{uuid.uuid4().hex[:8]}.db"), shards)
+    store.init(init_main, init_shard)
+    return store
+
+
+def create_rooms(store):
+    for i, room_id in enumerate(ROOMS):
+        with store.connection(room_id) as conn:
+            conn.execute("INSERT INTO game (room_id, player1_id, status) VALUES (?, ?, ?)",
+                         (room_id, f"p{i}", "waiting" if i == len(ROOMS) - 1 else "playing"))
+            conn.commit()
+
+
+@pytest.mark.parametrize("backend,shards", BACKENDS)
+def test_rooms_round_trip(backend, shards):
+    directory = tempfile.mkdtemp()
+    store = open_storage(backend, shards, directory)
+    try:
+        create_rooms(store)
+        assert len(store.shards) == shards
+        for i, room_id in enumerate(ROOMS):
+            shard = store.shard_for(room_id)
+            assert shard is store.shards[zlib.crc32(room_id.encode("utf-8")) % shards]
+            with store.connection(room_id) as conn:
+                row = conn.execute("SELECT player1_id FROM game WHERE room_id = ?", (room_id,)).fetchone()
+            assert row["player1_id"] == f"p{i}"
+
+        rows = store.fetchall_shards("SELECT room_id FROM game")
+        assert sorted(row["room_id"] for row in rows) == sorted(ROOMS)
+        waiting = store.fetchone_any("SELECT room_id FROM game WHERE status = 'waiting'")
+        assert waiting["room_id"] == ROOMS[-1]
+        assert store.fetchone_any("SELECT room_id FROM game WHERE status = 'expired'") is None
+        if shards > 1:
+            # 40 個房間不會全部擠在同一個 shard
+            assert len({store.shard_for(room_id).label for room_id in ROOMS}) > 1
+    finally:
+        store.close()
+        shutil.rmtree(directory)
+
+
+@pytest.mark.parametrize("backend,shards", [("sharded", 4), ("memory", 3)])
+def test_shard_sees_global_tables(backend, shards):
+    """shard 連線 ATTACH 主檔，未加前綴的 player_stats 解析到主檔（stats.finish_game 依賴這點）"""
+    directory = tempfile.mkdtemp()
+    store = open_storage(backend, shards, directory)
+    try:
+        with store.connection(ROOMS[0]) as conn:
+            conn.execute("INSERT INTO player_stats (player_id, wins) VALUES ('alice', 1)")
+            conn.commit()
+        with store.connection() as conn:
+            assert conn.execute("SELECT wins FROM player_stats WHERE player_id = 'alice'").fetchone()[0] == 1
+    finally:
+        store.close()
+        shutil.rmtree(directory)
+
+
+def test_layout_mismatch_rejected():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "naval.db")
+    try:
+        store = storage.Storage("sharded", path, 4)
+        store.init(init_main, init_shard)
+        create_rooms(store)
+        store.close()
+
+        # 同樣的 shard 數可以重開，房間都還在
+        store = storage.Storage("sharded", path, 4)
+        store.init(init_main, init_shard)
+        assert len(store.fetchall_shards("SELECT room_id FROM game")) == len(ROOMS)
+        store.close()
+
+        for shards in (2, 8):
+            store = storage.Storage("sharded", path, shards)
+            with pytest.raises(RuntimeError, match="4 個 shard"):
+                store.init(init_main, init_shard)
+            store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_single_file_rooms_block_sharding():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "naval.db")
+    try:
+        store = storage.Storage("sqlite", path)
+        store.init(init_main, init_shard)
+        create_rooms(store)
+        store.close()
+
+        store = storage.Storage("sharded", path, 4)
+        with pytest.raises(RuntimeError):
+            store.init(init_main, init_shard)
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    for backend, shards in BACKENDS:
+        test_rooms_round_trip(backend, shards)
+    test_shard_sees_global_tables("sharded", 4)
+    test_shard_sees_global_tables("memory", 3)
+    test_layout_mismatch_rejected()
+    test_single_file_rooms_block_sharding()
+    print("儲存層測試通過")
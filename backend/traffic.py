@@ -0,0 +1,177 @@
+"""線上流量錄製：記錄收到的 Socket.IO 事件與 REST 呼叫，供 test/replay.py 重播做效能回歸測試。
+
+預設關閉；以環境變數 TRAFFIC_RECORD=1 在啟動時開始，或由 POST /admin/record 開始一段限時錄製。
+檔案為 gzip 壓縮的 NDJSON（instance/traffic/traffic-<時間>-<pid>.ndjson.gz），第一行是標頭，之後每行一筆：
+    [t_ms, "c", client, codec]                  連線（codec 為 query 帶的編碼，可能為 null）
+    [t_ms, "d", client]                         斷線
+    [t_ms, "e", client, event, payload]         Socket.IO 事件（已解碼的 payload）
+    [t_ms, "r", method, rule, path, query, body]  REST 呼叫（/api/ 開頭；rule 為路由樣板，統計時依它分組）
+    [t_ms, "room", client, room]                該連線 join_game 後被分到的房間，重播時用來對應新的 room_id
+t_ms 為距離開始錄製的毫秒數；client 為連線的流水號。
+player_id / player / room_id 等識別碼以本次錄製專用的隨機金鑰做 HMAC 後截短，同一個 id 在檔內一致，
+但無法反推，也無法和其他次錄製對應。棋盤與座標原樣保留（重播需要），不記錄 IP 與 header。
+"""
+import os
+import gzip
+import hmac
+import json
+import time
+import atexit
+import hashlib
+import secrets
+from datetime import datetime
+
+import metrics
+
+TRAFFIC_DIR = os.path.join(os.path.dirname(__file__), "instance", "traffic")
+RECORD_ON_START = os.environ.get("TRAFFIC_RECORD", "0") == "1"
+DEFAULT_SECONDS = float(os.environ.get("TRAFFIC_RECORD_SECONDS", "600"))
+DEFAULT_MAX_EVENTS = int(os.environ.get("TRAFFIC_RECORD_MAX_EVENTS", "500000"))
+MAX_SECONDS = 3600
+FORMAT_VERSION = 1
+
+# 這些鍵的字串值視為識別碼；player 的值也可能是 'player1'/'player2'（sunken_ships）或 'ai'，不需匿名
+ID_KEYS = ("player_id", "player", "room_id")
+PUBLIC_IDS = ("player1", "player2", "ai")
+
+RECORDED = metrics.counter("naval_traffic_recorded_total", "錄製的事件數", ("kind",))
+
+
+class Recorder:
+    def __init__(self, seconds=DEFAULT_SECONDS, max_events=DEFAULT_MAX_EVENTS, out_dir=TRAFFIC_DIR):
+        self.seconds = min(float(seconds), MAX_SECONDS)
+        self.max_events = int(max_events)
+        if self.seconds <= 0 or self.max_events <= 0:
+            raise ValueError("seconds 與 max_events 必須是正數")
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        # 多 worker 同時錄製時各寫各的檔
+        self.path = os.path.join(out_dir, f"traffic-{stamp}-{os.getpid()}.ndjson.gz")
+        self._key = secrets.token_bytes(16)
+        self._clients = {}
+        self._started = time.monotonic()
+        self.events = 0
+        self._file = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=6)
+        self._file.write(json.dumps({
+            "format": "naval-traffic", "version": FORMAT_VERSION,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+        }) + "\n")
+
+    def anonymize(self, value):
+        if not isinstance(value, str) or not value or value in PUBLIC_IDS:
+            return value
+        return hmac.new(self._key, value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def _scrub(self, payload):
+        if not isinstance(payload, dict):
+            return payload
+        return {key: self.anonymize(value) if key in ID_KEYS else value for key, value in payload.items()}
+
+    def client(self, sid, create=True):
+        index = self._clients.get(sid)
+        if index is None and create:
+            index = self._clients[sid] = len(self._clients) + 1
+        return index
+
+    def write(self, kind, *fields):
+        """寫入一筆；超過時間或筆數上限時自動停止錄製"""
+        elapsed = time.monotonic() - self._started
+        if elapsed > self.seconds or self.events >= self.max_events:
+            stop()
+            return
+        self._file.write(json.dumps([round(elapsed * 1000, 1), kind, *fields],
+                                    separators=(",", ":"), default=_default) + "\n")
+        self.events += 1
+        RECORDED.inc(kind)
+
+    def close(self):
+        self._file.close()
+
+    def status(self):
+        return {"path": self.path, "events": self.events, "clients": len(self._clients),
+                "elapsed_s": round(time.monotonic() - self._started, 1), "seconds": self.seconds}
+
+
+def _default(value):
+    # msgpack 客戶端送來的 bytes 等無法直接轉成 JSON 的值
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    return str(value)
+
+
+recorder = None
+
+
+def start(seconds=DEFAULT_SECONDS, max_events=DEFAULT_MAX_EVENTS):
+    global recorder
+    if recorder is not None:
+        raise RuntimeError("已有錄製正在進行")
+    recorder = Recorder(seconds, max_events)
+    return recorder
+
+
+@atexit.register
+def stop():
+    """停止錄製並回傳最後的狀態；沒有在錄製時回傳 None（gzip 檔要關閉後才完整）"""
+    global recorder
+    current, recorder = recorder, None
+    if current is None:
+        return None
+    current.close()
+    return current.status()
+
+
+# ----------------------------
+# 給 app.py 呼叫的掛鉤（未錄製時只多一次 None 判斷）
+# ----------------------------
+def on_connect(sid, codec_name=None):
+    if recorder is not None:
+        recorder.write("c", recorder.client(sid), codec_name)
+
+
+def on_disconnect(sid):
+    if recorder is not None:
+        client = recorder.client(sid, create=False)
+        if client is not None:
+            recorder.write("d", client)
+
+
+def on_event(sid, event, payload):
+    if recorder is not None:
+        recorder.write("e", recorder.client(sid), event, recorder._scrub(payload))
+
+
+def on_room(sid, room_id):
+    if recorder is not None:
+        recorder.write("room", recorder.client(sid), recorder.anonymize(room_id))
+
+
+def on_request(method, rule, view_args, query, body):
+    """rule 為 Flask 的路由樣板（例如 /api/players/<player_id>/stats），路徑參數另外匿名後代回"""
+    if recorder is not None:
+        path = rule
+        for key, value in (view_args or {}).items():
+            path = path.replace(f"<{key}>", recorder.anonymize(value) if key in ID_KEYS else str(value))
+        recorder.write("r", method, rule, path, recorder._scrub(query), recorder._scrub(body))
+
+
+# ----------------------------
+# 讀取（重播端使用）
+# ----------------------------
+def read(path):
+    """回傳 (標頭, 紀錄的 iterator)"""
+    f = gzip.open(path, "rt", encoding="utf-8")
+    header = json.loads(f.readline())
+    if header.get("format") != "naval-traffic":
+        f.close()
+        raise ValueError(f"{path} 不是流量錄製檔")
+    if header.get("version") != FORMAT_VERSION:
+        f.close()
+        raise ValueError(f"不支援的錄製檔版本：{header.get('version')}")
+
+    def records():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return header, records()
@@ -54,12 +54,32 @@ interface GameState {
   moveShip: (id: number, row: number, col: number) => void;
   rotateShip: (id: number) => void;
   showShips: (ships: Ship[]) => number[][];
-  connectToServer: () => void;
+  connectToServer: (url?: string) => Promise<void>;
   joinGame: (isAi: boolean) => void;
   makeMove: (x: number, y: number) => void;
 }
 
 const API = process.env.NEXT_PUBLIC_API_URL || "http://localhost:5000";
+// 多 worker 模式下連續被 redirect 的上限，避免 worker 之間來回跳
+const MAX_REDIRECTS = 3;
+
+// 最近一次送出的 join_game / make_move，收到 redirect 時改連到新 worker 後重送
+let pendingEmit: { event: string; payload: object } | null = null;
+let redirects = 0;
+
+// 單 worker 模式 /api/route 回傳 url: null，沿用 API
+async function resolveServer(): Promise<string> {
+  try {
+    const res = await fetch(`${API}/api/route`);
+    if (res.ok) {
+      const { url } = await res.json();
+      if (url) return url;
+    }
+  } catch (e) {
+    console.error("Route lookup failed:", e);
+  }
+  return API;
+}
 
 export default create<GameState>((set, get) => ({
   ships: [],
@@ -141,11 +161,31 @@ export default create<GameState>((set, get) => ({
     }));
   },
 
-  connectToServer: () => {
-    const socket = io(API, { transports: ["websocket"] });
-    socket.on("connect", () => set({ socket }));
+  connectToServer: async (url?: string) => {
+    const server = url ?? (await resolveServer());
+    get().socket?.disconnect();
+    const socket = io(server, { transports: ["websocket"] });
+    let resend = url !== undefined;
+    socket.on("connect", () => {
+      set({ socket });
+      // redirect 後的新連線：重送原本的事件（之後的自動重連不重送）
+      if (resend && pendingEmit) socket.emit(pendingEmit.event, pendingEmit.payload);
+      resend = false;
+    });
+
+    socket.on("redirect", ({ url: target }) => {
+      if (!target || !pendingEmit || redirects >= MAX_REDIRECTS) {
+        console.error("Redirect ignored:", target);
+        return;
+      }
+      redirects += 1;
+      socket.removeAllListeners();
+      get().connectToServer(target);
+    });
 
     socket.on("joined_game", async ({ room_id }) => {
+      pendingEmit = null;
+      redirects = 0;
       set({ roomId: room_id });
 
       if (!get().isAiGame) {
@@ -170,6 +210,8 @@ export default create<GameState>((set, get) => ({
     });
 
     socket.on("match_success", ({ room_id, player }) => {
+      pendingEmit = null;
+      redirects = 0;
       set({
         roomId: room_id,
         mySide: player,
@@ -182,6 +224,10 @@ export default create<GameState>((set, get) => ({
     );
 
     socket.on("move_made", async ({ attacker, x, y, hit }) => {
+      if (attacker === get().playerId) {
+        pendingEmit = null;
+        redirects = 0;
+      }
       const prev = get().sunkenShips;
       set({ lastSunken: [] });
       set({ lastMove: { attacker, x, y, hit } });
@@ -242,12 +288,16 @@ export default create<GameState>((set, get) => ({
     }
 
     const board = shipsToMatrix(ships);
-    socket.emit("join_game", { player_id: playerId, board, ships, is_ai_game: isAi });
+    pendingEmit = { event: "join_game", payload: { player_id: playerId, board, ships, is_ai_game: isAi } };
+    redirects = 0;
+    socket.emit(pendingEmit.event, pendingEmit.payload);
   },
 
   makeMove: (x, y) => {
     const { socket, roomId, playerId, currentTurn } = get();
     if (!socket || !roomId || currentTurn !== playerId) return;
-    socket.emit("make_move", { room_id: roomId, player: playerId, x, y });
+    pendingEmit = { event: "make_move", payload: { room_id: roomId, player: playerId, x, y } };
+    redirects = 0;
+    socket.emit(pendingEmit.event, pendingEmit.payload);
   },
 }));